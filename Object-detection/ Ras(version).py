@@ -1,4 +1,9 @@
 import cv2
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.vision import Detector
 
 import time
 from gpiozero import AngularServo
@@ -6,23 +11,16 @@ servo =AngularServo(18, initial_angle=0, min_pulse_width=0.0006, max_pulse_width
 
 #thres = 0.45 # Threshold to detect object
 
-classNames = []
 classFile = "/home/pi/Desktop/ODF/coco.names"
-with open(classFile,"rt") as f:
-    classNames = f.read().rstrip("\n").split("\n")
-
 configPath = "/home/pi/Desktop/ODF/Pretrained vectors mobile_net.pbtxt"
 weightsPath = "/home/pi/Desktop/ODF/frozen_inference_graph.pb"
 
-net = cv2.dnn_DetectionModel(weightsPath,configPath)
-net.setInputSize(320,320)
-net.setInputScale(1.0/ 127.5)
-net.setInputMean((127.5, 127.5, 127.5))
-net.setInputSwapRB(True)
+detector = Detector(weightsPath, configPath, classFile, targets=None)
+classNames = detector.obj_names
 
 
 def getObjects(img, thres, nms, draw=True, objects=[]):
-    classIds, confs, bbox = net.detect(img,confThreshold=thres,nmsThreshold=nms)
+    classIds, confs, bbox = detector.detect_raw(img, thres, nms)
     #print(classIds,bbox)
     if len(objects) == 0: objects = classNames
     objectInfo =[]
@@ -0,0 +1,113 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.vision import Detector, TARGETS
+
+# Run the float32 reference and a quantized candidate over a recorded dataset
+# and report per-frame latency plus AP drift for the target classes.
+#
+#   python compare_models.py --dataset recordings/run1 --candidate mobilenet_ssd_int8.onnx
+#
+# Without hand labels, the reference model's detections (at the usual 0.45
+# threshold) are the ground truth, so AP measures how far the candidate has
+# drifted from the float model: 1.0 means identical detections.
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+IOU_THRESHOLD = 0.5
+
+
+def iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y2 = np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    return inter / (box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - inter)
+
+
+def average_precision(truth, predictions):
+    """VOC all-point AP. truth: per-frame [K, 4] boxes; predictions: (frame, score, box) list."""
+    total = sum(len(t) for t in truth)
+    if total == 0:
+        return None
+    used = [np.zeros(len(t), bool) for t in truth]
+    predictions = sorted(predictions, key=lambda p: -p[1])
+    tp = np.zeros(len(predictions))
+    for i, (frame, _, box) in enumerate(predictions):
+        if len(truth[frame]) == 0:
+            continue
+        overlaps = iou(box, truth[frame])
+        best = int(np.argmax(overlaps))
+        if overlaps[best] >= IOU_THRESHOLD and not used[frame][best]:
+            used[frame][best] = True
+            tp[i] = 1
+    tp_cum = np.cumsum(tp)
+    recall = np.concatenate([[0.0], tp_cum / total, [1.0]])
+    precision = np.concatenate([[0.0], tp_cum / np.arange(1, len(tp) + 1), [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    steps = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+
+def run(detector, frames):
+    latencies, results = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        results.append(detector.detect_raw(frame))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+
+def latency_line(name, ms):
+    return (f"{name:<10} mean {ms.mean():7.2f} ms  p50 {np.percentile(ms, 50):7.2f} ms  "
+            f"p95 {np.percentile(ms, 95):7.2f} ms  ({1000 / ms.mean():.1f} FPS)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare float and quantized detectors")
+    parser.add_argument("--dataset", required=True, help="folder of recorded frames (jpg/png)")
+    parser.add_argument("--reference", default="frozen_inference_graph.pb")
+    parser.add_argument("--config", default="Pretrained_vectors_mobile_net.pbtxt")
+    parser.add_argument("--candidate", default="mobilenet_ssd_int8.onnx")
+    parser.add_argument("--labels", default="data_items.names")
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.dataset, pattern)))
+    frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+    if not frames:
+        raise SystemExit(f"No frames found in {args.dataset}")
+
+    reference = Detector(args.reference, args.config, args.labels)
+    # Low threshold on the candidate so the precision/recall curve is complete
+    candidate = Detector(args.candidate, labels=args.labels, conf_threshold=0.05)
+
+    ref_ms, ref_results = run(reference, frames)
+    cand_ms, cand_results = run(candidate, frames)
+
+    print(f"{len(frames)} frames from {args.dataset}")
+    print(latency_line("reference", ref_ms))
+    print(latency_line("candidate", cand_ms))
+    print(f"Speedup: {ref_ms.mean() / cand_ms.mean():.2f}x")
+
+    aps = []
+    for name in TARGETS:
+        class_id = reference.obj_names.index(name) + 1
+        truth = [boxes[ids == class_id] for ids, _, boxes in ref_results]
+        predictions = [(i, score, box)
+                       for i, (ids, scores, boxes) in enumerate(cand_results)
+                       for score, box in zip(scores[ids == class_id], boxes[ids == class_id])]
+        ap = average_precision(truth, predictions)
+        if ap is None:
+            print(f"AP {name:<15} n/a (no reference detections)")
+            continue
+        aps.append(ap)
+        print(f"AP {name:<15} {ap:.3f}  drift {1 - ap:+.3f}")
+    if aps:
+        print(f"mAP vs reference   {np.mean(aps):.3f}  drift {1 - np.mean(aps):+.3f}")
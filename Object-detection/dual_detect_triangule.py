@@ -3,20 +3,15 @@ from picamera2 import Picamera2
 import numpy as np
 from flask import Flask, Response
 import threading
+import os
+import sys
 
-# === Load Labels ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
+from auv.vision import Detector, compute_depth, match_detections
 
-# === Load DNN Model ===
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
-
-# === Set Target Classes ===
-targets = ["Human", "Plastic Bottle"]
+# === Load DNN Model (CSI RGB888 and USB frames are both BGR) ===
+detector = Detector(input_format="BGR")
 
 # === Constants for Triangulation ===
 BASELINE_CM = 12.0      # Distance between CSI and USB cameras
@@ -34,59 +29,23 @@ usb_camera = cv2.VideoCapture(1)
 usb_camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
 usb_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-frame_lock = threading.Lock()
-latest_frame = None
-
-# === Object Detection ===
-def detect(frame):
-    results = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    detections = []
-    if len(results) == 3:
-        class_ids, confidences, boxes = results
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            label = obj_names[class_id - 1]
-            if label.lower() in [t.lower() for t in targets] and confidence > 0.45:
-                detections.append((label, box))
-    return detections
-
-# === Triangulation ===
-def compute_depth(center_left, center_right):
-    disparity = abs(center_left[0] - center_right[0])
-    if disparity == 0:
-        return None
-    depth_cm = (FOCAL_LENGTH_PX * BASELINE_CM) / disparity
-    return round(depth_cm, 2)
-
-# === Match Detections by Label ===
-def match_detections(csi_dets, usb_dets):
-    matched = []
-    for label1, box1 in csi_dets:
-        c1 = (box1[0] + box1[2] // 2, box1[1] + box1[3] // 2)
-        for label2, box2 in usb_dets:
-            if label1 == label2:
-                c2 = (box2[0] + box2[2] // 2, box2[1] + box2[3] // 2)
-                matched.append((label1, box1, box2, c1, c2))
-                break
-    return matched
+broadcaster = FrameBroadcaster()
 
 # === Frame Producer ===
 def update_frames():
-    global latest_frame
     while True:
         frame_csi = picamera.capture_array("main")
-        frame_csi = cv2.cvtColor(frame_csi, cv2.COLOR_RGB2BGR)
 
         ret, frame_usb = usb_camera.read()
         if not ret:
             continue
 
-        detections_csi = detect(frame_csi)
-        detections_usb = detect(frame_usb)
+        detections_csi, detections_usb = detector.detect_many([frame_csi, frame_usb])
 
         matches = match_detections(detections_csi, detections_usb)
 
         for label, box1, box2, center1, center2 in matches:
-            depth = compute_depth(center1, center2)
+            depth = compute_depth(center1, center2, FOCAL_LENGTH_PX, BASELINE_CM)
             if depth:
                 print(f"{label} Depth: {depth} cm")
                 # Draw CSI view
@@ -100,19 +59,16 @@ def update_frames():
         ret, buffer = cv2.imencode('.jpg', stacked, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
         if not ret:
             continue
-        with frame_lock:
-            latest_frame = buffer.tobytes()
+        broadcaster.publish(buffer.tobytes())
 
 # === MJPEG Streaming ===
 @app.route('/video')
 def video():
-    def generate():
-        while True:
-            with frame_lock:
-                if latest_frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/stats')
+def stats():
+    return broadcaster.stats()
 
 @app.route('/')
 def index():
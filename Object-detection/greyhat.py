@@ -1,24 +1,22 @@
 import cv2
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.vision import Detector
 
 #thres = 0.45 # Threshold to detect object
 
-classNames = []
 classFile = 'C:\\AUV\\Object-detection\\data_items.names'
-with open(classFile,"rt") as f:
-    classNames = f.read().rstrip("\n").split("\n")
-
 configPath = 'C:\\AUV\\Object-detection\\Pretrained_vectors_mobile_net.pbtxt'
 weightsPath = 'C:\\AUV\\Object-detection\\frozen_inference_graph.pb'
 
-net = cv2.dnn_DetectionModel(weightsPath,configPath)
-net.setInputSize(320,320)
-net.setInputScale(1.0/ 127.5)
-net.setInputMean((127.5, 127.5, 127.5))
-net.setInputSwapRB(True)
+detector = Detector(weightsPath, configPath, classFile, targets=None)
+classNames = detector.obj_names
 
 
 def getObjects(img, thres, nms, draw=True, objects=[]):
-    classIds, confs, bbox = net.detect(img,confThreshold=thres,nmsThreshold=nms)
+    classIds, confs, bbox = detector.detect_raw(img, thres, nms)
     #print(classIds,bbox)
     if len(objects) == 0: objects = classNames
     objectInfo =[]
@@ -3,20 +3,15 @@ from picamera2 import Picamera2
 import numpy as np
 from flask import Flask, Response
 import threading
+import os
+import sys
 
-# === Load Labels ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
+from auv.vision import Detector
 
-# === Load DNN Model ===
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
-
-# === Set Target Classes ===
-targets = ["Human", "Plastic Bottle"]
+# === Load DNN Model (CSI RGB888 and USB frames are both BGR) ===
+detector = Detector(input_format="BGR")
 
 # === Flask App ===
 app = Flask(__name__)
@@ -31,38 +26,32 @@ usb_camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
 usb_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 usb_camera.set(cv2.CAP_PROP_FPS, 30)
 
-frame_lock = threading.Lock()
-latest_frame = None
+broadcaster = FrameBroadcaster()
 
 # === Object Detection ===
-def detect_and_draw(frame, color=(0, 255, 0)):
-    result = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    if len(result) == 3:
-        class_ids, confidences, boxes = result
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            if class_id <= len(obj_names):
-                label = obj_names[class_id - 1]
-                if label.lower() in [t.lower() for t in targets]:
-                    cv2.rectangle(frame, box, color, 2)
-                    cv2.putText(frame, f"{label} {round(confidence * 100)}%", 
-                                (box[0], box[1] - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+def draw_detections(frame, class_ids, confidences, boxes, color=(0, 255, 0)):
+    # Only target classes reach here; labels are looked up just for drawing
+    for class_id, confidence, box in zip(class_ids, confidences, boxes):
+        label = detector.label(class_id)
+        cv2.rectangle(frame, box, color, 2)
+        cv2.putText(frame, f"{label} {round(confidence * 100)}%", 
+                    (box[0], box[1] - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
     return frame
 
 # === Frame Producer Thread ===
 def update_frames():
-    global latest_frame
     while True:
         # Get frames
         csi_frame = picamera.capture_array("main")
-        csi_frame = cv2.cvtColor(csi_frame, cv2.COLOR_RGB2BGR)
 
         ret, usb_frame = usb_camera.read()
         if not ret:
             continue
 
-        # Detect and draw
-        detect_and_draw(csi_frame, color=(0, 255, 0))    # Green for CSI
-        detect_and_draw(usb_frame, color=(255, 0, 0))    # Blue for USB
+        # Detect both frames in one pass, then draw
+        raw_csi, raw_usb = detector.detect_many_raw([csi_frame, usb_frame])
+        draw_detections(csi_frame, *raw_csi, color=(0, 255, 0))    # Green for CSI
+        draw_detections(usb_frame, *raw_usb, color=(255, 0, 0))    # Blue for USB
 
         # Combine horizontally
         combined = np.hstack((csi_frame, usb_frame))
@@ -70,19 +59,16 @@ def update_frames():
         if not ret:
             continue
 
-        with frame_lock:
-            latest_frame = buffer.tobytes()
+        broadcaster.publish(buffer.tobytes())
 
 # === Stream Route ===
 @app.route('/video')
 def video():
-    def generate():
-        while True:
-            with frame_lock:
-                if latest_frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/stats')
+def stats():
+    return broadcaster.stats()
 
 # === Main Page ===
 @app.route('/')
@@ -1,22 +1,20 @@
 import cv2
+import os
+import sys
 
-obj_names = []
-class_file = 'C:\\AUV\\Object-detection\\data_items.names'
-with open(class_file, "rt") as f:
-    obj_names = f.read().rstrip("\n").split("\n")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.vision import Detector
 
+class_file = 'C:\\AUV\\Object-detection\\data_items.names'
 config_path = 'C:\\AUV\\Object-detection\\Pretrained_vectors_mobile_net.pbtxt'
 weights_path = 'C:\\AUV\\Object-detection\\frozen_inference_graph.pb'
 
-model = cv2.dnn_DetectionModel(weights_path, config_path)
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
+detector = Detector(weights_path, config_path, class_file, targets=None)
+obj_names = detector.obj_names
 
 # Detection function
 def detect_objects(frame, threshold, nms_thresh, draw=True, targets=[]):
-    class_ids, confidences, boxes = model.detect(frame, confThreshold=threshold, nmsThreshold=nms_thresh)
+    class_ids, confidences, boxes = detector.detect_raw(frame, threshold, nms_thresh)
     if len(targets) == 0:
         targets = obj_names
     detected_objects = []
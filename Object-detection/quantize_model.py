@@ -0,0 +1,93 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+
+# Export the float32 MobileNet-SSD (frozen_inference_graph.pb) to ONNX and
+# quantize it to INT8 with static calibration on captured frames.
+#
+#   python quantize_model.py --calib-dir captures/ --output mobilenet_ssd_int8.onnx
+#
+# Needs tf2onnx (+ tensorflow) for the export and onnxruntime for the
+# quantization; neither is needed on the robot beyond onnxruntime itself.
+# The result loads through the usual detector:
+#   Detector(weights="mobilenet_ssd_int8.onnx")
+#
+# For FP16 without a new artifact, use the opencv_fp16 DNN backend instead
+# (AUV_DNN_BACKEND=opencv_fp16).
+
+INPUT_SIZE = (320, 320)
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def export_onnx(weights, output, opset=13):
+    print(f"Converting {weights} -> {output}")
+    subprocess.run([
+        sys.executable, "-m", "tf2onnx.convert",
+        "--graphdef", weights,
+        "--inputs", "image_tensor:0",
+        "--outputs", "detection_boxes:0,detection_classes:0,detection_scores:0,num_detections:0",
+        "--opset", str(opset),
+        "--output", output,
+    ], check=True)
+
+
+def calibration_images(calib_dir, limit):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(calib_dir, pattern)))
+    if not paths:
+        raise SystemExit(f"No calibration images found in {calib_dir}")
+    return paths[:limit]
+
+
+class FrameCalibrationReader:
+    """Feeds captured frames to onnxruntime's calibrator, preprocessed like the detector does."""
+
+    def __init__(self, paths, input_name):
+        self.paths = iter(paths)
+        self.input_name = input_name
+
+    def get_next(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            image = cv2.cvtColor(cv2.resize(frame, INPUT_SIZE), cv2.COLOR_BGR2RGB)
+            return {self.input_name: image[np.newaxis]}
+        return None
+
+
+def quantize_int8(float_model, output, paths):
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(float_model, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    print(f"Calibrating on {len(paths)} frames")
+    # Only the convolutions are quantized; the box decoding and NMS tail stays float
+    quantize_static(
+        float_model, output, FrameCalibrationReader(paths, input_name),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+    )
+    print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB, "
+          f"float: {os.path.getsize(float_model) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export MobileNet-SSD to an INT8 ONNX model")
+    parser.add_argument("--weights", default="frozen_inference_graph.pb")
+    parser.add_argument("--calib-dir", required=True, help="folder of captured frames (jpg/png)")
+    parser.add_argument("--calib-count", type=int, default=200)
+    parser.add_argument("--float-output", default="mobilenet_ssd_fp32.onnx")
+    parser.add_argument("--output", default="mobilenet_ssd_int8.onnx")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.float_output):
+        export_onnx(args.weights, args.float_output)
+    quantize_int8(args.float_output, args.output, calibration_images(args.calib_dir, args.calib_count))
@@ -0,0 +1 @@
+"""Shared building blocks for the AUV scripts (raspi5/, propeller_control/, ...)."""
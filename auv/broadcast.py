@@ -0,0 +1,71 @@
+"""Encode-once MJPEG fan-out for the Flask /video routes.
+
+The producer publishes each JPEG once; every viewer blocks on a condition
+variable until a newer frame exists and then sends only that frame. A slow
+viewer simply skips the frames it missed, so the number of viewers never
+feeds back into the detection loop.
+"""
+import itertools
+import threading
+
+
+class FrameBroadcaster:
+    """Latest-frame slot with a sequence number and per-client counters."""
+
+    def __init__(self, boundary=b"frame"):
+        self.boundary = boundary
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._client_ids = itertools.count(1)
+        self._clients = {}
+
+    def publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self._cond.notify_all()
+
+    def wait(self, last_seq, timeout=None):
+        """Block until a frame newer than last_seq exists; return (seq, frame).
+
+        Returns last_seq unchanged (and frame None) if the timeout expires.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq, timeout):
+                return last_seq, None
+            return self._seq, self._frame
+
+    def stream(self, timeout=1.0):
+        """Generator of multipart MJPEG chunks for one HTTP client."""
+        client_id = next(self._client_ids)
+        counters = {"sent": 0, "dropped": 0}
+        with self._cond:
+            self._clients[client_id] = counters
+        header = b"--" + self.boundary + b"\r\nContent-Type: image/jpeg\r\n\r\n"
+
+        last_seq = 0
+        try:
+            while True:
+                seq, frame = self.wait(last_seq, timeout)
+                if frame is None:
+                    continue
+                if last_seq:
+                    counters["dropped"] += seq - last_seq - 1
+                last_seq = seq
+                yield header + frame + b"\r\n"
+                counters["sent"] += 1
+        finally:
+            with self._cond:
+                del self._clients[client_id]
+
+    def viewer_count(self):
+        with self._cond:
+            return len(self._clients)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "seq": self._seq,
+                "clients": {str(cid): dict(c) for cid, c in self._clients.items()},
+            }
@@ -0,0 +1,136 @@
+"""Stereo calibration results and rectification maps for the dual-CSI rig.
+
+raspi5/calibrate_stereo.py writes one uncompressed .npz with the intrinsics,
+extrinsics, rectification transforms and fixed-point initUndistortRectifyMap
+tables for every working resolution. At startup the tables are memory-mapped
+straight out of the .npz (no decode, pages shared between processes), so
+rectifying a frame costs one cv2.remap.
+
+Until a calibration exists the scripts fall back to their hand-tuned
+FOCAL_LENGTH_PX constants.
+"""
+import os
+import struct
+import zipfile
+
+import cv2
+import numpy as np
+
+from auv.vision import compute_depth
+
+# === Calibration File (relative to the script's working directory) ===
+CALIBRATION = "stereo_calibration.npz"
+
+
+def size_key(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def _memmap_member(path, info):
+    """Read-only np.memmap of one uncompressed .npy member inside a .npz."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{info.filename} in {path} is compressed; save with np.savez, not savez_compressed")
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran_order else "C")
+
+
+class StereoCalibration:
+    """Loaded calibration: camera matrices, stereo geometry and remap tables.
+
+    focal_length_px and baseline_cm describe the rectified pair at the
+    calibration resolution, i.e. what compute_depth() and DepthEngine expect.
+    """
+
+    def __init__(self, path=CALIBRATION):
+        self.path = path
+        self._maps = {}
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = info.filename[:-len(".npy")]
+                if name.startswith("map"):
+                    self._maps[name] = _memmap_member(path, info)
+                else:
+                    with archive.open(info) as f:
+                        setattr(self, name, np.lib.format.read_array(f))
+        self.image_size = tuple(int(v) for v in self.image_size)
+        self.focal_length_px = float(self.P0[0, 0])
+        self.baseline_cm = float(np.linalg.norm(self.T))
+
+    def sizes(self):
+        return sorted({key.split("_")[1] for key in self._maps})
+
+    def maps(self, size):
+        """(map0_xy, map0_interp, map1_xy, map1_interp) fixed-point tables for size (w, h)."""
+        key = size_key(size)
+        try:
+            return tuple(self._maps[f"map{cam}_{key}_{part}"] for cam in (0, 1) for part in ("xy", "interp"))
+        except KeyError:
+            raise KeyError(f"{self.path} has no maps for {key} (available: {self.sizes()})") from None
+
+    def rectify_points(self, points, size, camera=0, out_size=None):
+        """[N, 2] pixel points of a raw size (w, h) frame of camera, in the rectified frame.
+
+        The result is in pixels of out_size (default: size); at image_size
+        they match focal_length_px and baseline_cm.
+        """
+        out_size = out_size or size
+        K, D, R, P = (getattr(self, f"{name}{camera}") for name in ("K", "D", "R", "P"))
+        K, P = K.copy(), P.copy()
+        K[:2] *= size[0] / self.image_size[0]
+        P[:2] *= out_size[0] / self.image_size[0]
+        points = np.asarray(points, np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(points, K, D, R=R, P=P).reshape(-1, 2)
+
+    def rectify_box(self, box, size, camera=0):
+        """(x, y, w, h) box from a raw size (w, h) frame of camera, mapped into the rectified frame.
+
+        The box corners and edge midpoints are undistorted and rotated into
+        the rectified view; the result is their bounding box.
+        """
+        x, y, w, h = box
+        points = [(x + fx * w, y + fy * h) for fx in (0, 0.5, 1) for fy in (0, 0.5, 1) if (fx, fy) != (0.5, 0.5)]
+        rectified = self.rectify_points(points, size, camera)
+        (x0, y0), (x1, y1) = rectified.min(axis=0), rectified.max(axis=0)
+        return int(round(x0)), int(round(y0)), int(round(x1 - x0)), int(round(y1 - y0))
+
+    def rectify_centers(self, center0, center1, size):
+        """Left/right box centres from a raw size (w, h) pair, rectified at image_size.
+
+        That is the geometry compute_depth() assumes with focal_length_px and
+        baseline_cm: raw centres mix lens distortion and the cameras' relative
+        rotation into the disparity.
+        """
+        return tuple(tuple(float(v) for v in self.rectify_points([center], size, camera, self.image_size)[0])
+                     for camera, center in enumerate((center0, center1)))
+
+    def depth(self, center0, center1, size):
+        """compute_depth() for box centres from a raw size (w, h) pair, rectified first."""
+        return compute_depth(*self.rectify_centers(center0, center1, size), self.focal_length_px, self.baseline_cm)
+
+    def rectify(self, frame0, frame1, size=None):
+        """Undistort and row-align a pair with one fixed-point remap per frame."""
+        size = size or (frame0.shape[1], frame0.shape[0])
+        map0_xy, map0_interp, map1_xy, map1_interp = self.maps(size)
+        return (cv2.remap(frame0, map0_xy, map0_interp, cv2.INTER_LINEAR),
+                cv2.remap(frame1, map1_xy, map1_interp, cv2.INTER_LINEAR))
+
+
+def load_calibration(path=CALIBRATION):
+    """StereoCalibration from path, or None (with a note) if it has not been made yet."""
+    if not os.path.exists(path):
+        print(f"[auv.calibration] No {path}; using hand-tuned focal length, no rectification")
+        return None
+    calibration = StereoCalibration(path)
+    print(f"[auv.calibration] Loaded {path}: f={calibration.focal_length_px:.1f}px "
+          f"baseline={calibration.baseline_cm:.2f}cm maps={calibration.sizes()}")
+    return calibration
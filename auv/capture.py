@@ -0,0 +1,390 @@
+"""Concurrent stereo capture paired on sensor timestamps.
+
+Calling picam0.capture_array() and then picam1.capture_array() takes the two
+frames at different instants (and waits for each camera in turn), so any yaw
+between them shows up as disparity. StereoCapture runs each Picamera2 on its
+own thread, reads the SensorTimestamp of every request and only hands out
+pairs whose exposures are within a tolerance; frames that find no partner
+are dropped and counted.
+
+Frames are written straight from the mapped camera buffer into a FrameRing
+of preallocated slots per camera, with the flip and alpha drop done on the
+way in, so the steady state allocates no frame memory. Slots carry an owner
+count: whoever keeps frames past the next read() takes a StereoPair and
+releases it when done, and a slot is only rewritten once its count is zero.
+"""
+import threading
+import time
+import traceback
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Mounting orientation -> (vflip, hflip) requested from the ISP
+ORIENTATIONS = {
+    "normal": (False, False),
+    "vflip": (True, False),      # what the AUV's upside-down mounts have always used
+    "hflip": (False, True),
+    "rotate180": (True, True),
+}
+# (vflip, hflip) still to do in software -> cv2.flip code
+FLIP_CODES = {(False, False): None, (True, False): 0, (False, True): 1, (True, True): -1}
+
+
+def configure_camera(cam, orientation="normal", **config):
+    """Configure cam for video with the ISP doing the mounting flip.
+
+    config is passed to create_video_configuration (main=..., controls=...).
+    Returns the cv2.flip code the caller still has to apply, which is None
+    unless the sensor refused (part of) the libcamera Transform. Without
+    libcamera (auv.hal.SimCamera off the Pi) there is no ISP and no flip.
+    """
+    try:
+        from libcamera import Transform
+    except ImportError:
+        cam.configure(cam.create_video_configuration(**config))
+        return None
+
+    vflip, hflip = ORIENTATIONS[orientation]
+    applied = (False, False)
+    try:
+        cam.configure(cam.create_video_configuration(transform=Transform(vflip=vflip, hflip=hflip), **config))
+        transform = cam.camera_configuration().get("transform")
+        if transform is not None:
+            applied = (bool(transform.vflip), bool(transform.hflip))
+    except RuntimeError as e:
+        print(f"[auv.capture] Camera rejected {orientation} transform, flipping in software: {e}")
+        cam.configure(cam.create_video_configuration(**config))
+    return FLIP_CODES[(vflip != applied[0], hflip != applied[1])]
+
+
+class FrameSlot:
+    """One frame buffer and the number of owners still using it."""
+
+    __slots__ = ("array", "refs", "_ring")
+
+    def __init__(self, array, ring=None):
+        self.array = array
+        self.refs = 0
+        self._ring = ring
+
+    def retain(self):
+        if self._ring is not None:
+            with self._ring.lock:
+                self.refs += 1
+        return self
+
+    def release(self):
+        if self._ring is not None:
+            with self._ring.lock:
+                if self.refs <= 0:
+                    raise RuntimeError("FrameSlot released more often than it was retained")
+                self.refs -= 1
+
+
+class FrameRing:
+    """Preallocated frame slots, each reused only once every owner released it.
+
+    acquire() hands out a free slot already retained once for the caller.
+    When every slot is busy a standalone slot is allocated (and counted in
+    overruns) rather than stalling capture; it is simply garbage collected.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=8):
+        self.lock = threading.Lock()
+        self._slots = [FrameSlot(np.empty(shape, dtype), self) for _ in range(slots)]
+        self._next = 0
+        self.overruns = 0
+
+    def acquire(self):
+        with self.lock:
+            for _ in range(len(self._slots)):
+                slot = self._slots[self._next]
+                self._next = (self._next + 1) % len(self._slots)
+                if slot.refs == 0:
+                    slot.refs = 1
+                    return slot
+            self.overruns += 1
+        return FrameSlot(np.empty_like(self._slots[0].array))
+
+    def in_use(self):
+        with self.lock:
+            return sum(1 for slot in self._slots if slot.refs)
+
+
+class StereoPair:
+    """(frame0, frame1) from StereoCapture.read_pair(), owning its ring slots.
+
+    Unpacks like the tuple read() returns. Call release() (or use it as a
+    context manager) once nothing reads or writes the frames any more;
+    releasing twice is harmless.
+    """
+
+    __slots__ = ("frames", "seq", "_slots")
+
+    def __init__(self, frames, slots=(), seq=0):
+        self.frames = frames
+        self.seq = seq
+        self._slots = slots
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __enter__(self):
+        return self.frames
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def retain(self):
+        """Another handle on the same frames, for a second owner to release."""
+        for slot in self._slots:
+            slot.retain()
+        return StereoPair(self.frames, self._slots, self.seq)
+
+    def release(self):
+        slots, self._slots = self._slots, ()
+        for slot in slots:
+            slot.release()
+
+
+def lores_size(main_size, input_size=(320, 320)):
+    """Aspect-correct lores stream size for a detector input: its width, main's aspect, even sides.
+
+    The ISP scales main down to this for free, so the detector only upsamples
+    the short side instead of resizing the whole 640x480 frame on the CPU.
+    """
+    width = min(input_size[0], main_size[0]) // 2 * 2
+    height = int(round(width * main_size[1] / main_size[0] / 2)) * 2
+    return width, height
+
+
+def copy_frame(src, dst, flip=None, drop_alpha=False):
+    """Copy a camera buffer into dst, flipping and/or dropping X/alpha in the same pass."""
+    if drop_alpha:
+        cv2.cvtColor(src, cv2.COLOR_BGRA2BGR, dst=dst)
+        if flip is not None:
+            cv2.flip(dst, flip, dst=dst)
+    elif flip is not None:
+        cv2.flip(src, flip, dst=dst)
+    else:
+        np.copyto(dst, src)
+    return dst
+
+
+def map_stream(request, name):
+    """Context manager exposing a request's stream buffer as mapped.array, without a copy."""
+    if hasattr(request, "mapped_array"):  # auv.hal.SimCamera
+        return request.mapped_array(name)
+    from picamera2 import MappedArray
+
+    return MappedArray(request, name)
+
+
+class StereoCapture:
+    """Two Picamera2 instances captured concurrently and paired by timestamp.
+
+    The cameras must already be configured and started. read() blocks until a
+    pair newer than the last one returned is available and gives back
+    (frame0, frame1); report() shows pair rate, drops and skew percentiles.
+
+    flip (a cv2.flip code, or one per camera as returned by configure_camera)
+    and drop_alpha (4-channel XBGR8888 -> 3 channels) are applied while
+    copying out of the camera buffer. The returned frames live in a FrameRing
+    per camera and stream and may be modified. Frames from read() stay valid
+    until the next read(); to keep them longer (another thread, a pipeline)
+    use read_pair() and release the StereoPair when done.
+
+    stream may also be a tuple such as ("main", "lores"); each frame of the
+    pair is then a tuple in that order. Streams left out of active_streams
+    are not copied at all and come back as None, e.g. "main" while nobody
+    watches the annotated video.
+
+    Without hardware sync the two sensors free-run with an arbitrary phase
+    offset, so the default tolerance is half a frame period at 30 fps: every
+    frame pairs with its nearest partner and the skew report shows how far
+    apart they really are. Tighten it once the sensors are synchronized.
+    """
+
+    def __init__(self, cam0, cam1, tolerance_ms=16.0, stream="main", history=1000,
+                 flip=None, drop_alpha=False, ring_slots=8):
+        self.cams = (cam0, cam1)
+        self.streams = (stream,) if isinstance(stream, str) else tuple(stream)
+        self.active_streams = set(self.streams)
+        self.flips = tuple(flip) if isinstance(flip, (tuple, list)) else (flip, flip)
+        self.drop_alpha = drop_alpha
+        self.ring_slots = ring_slots
+        self.rings = ({}, {})  # stream name -> FrameRing, per camera
+        self.tolerance_ns = int(tolerance_ms * 1e6)
+        self._pending = (deque(), deque())  # (timestamp_ns, frame, slots) per camera
+        self.max_pending = 4
+        self._cond = threading.Condition()
+        self._pair = None   # (frames, slots) of the newest pair, owned by the capture
+        self._held = None   # StereoPair handed out by read()
+        self._seq = 0
+        self._last_read = 0
+        self._running = threading.Event()
+        self._threads = []
+        self.unpaired = [0, 0]
+        self.errors = [0, 0]
+        self.skews_ms = deque(maxlen=history)
+        self._started_at = None
+
+    def _capture_loop(self, index):
+        cam = self.cams[index]
+        while self._running.is_set():
+            request = cam.capture_request()
+            frames, slots = [], []
+            try:
+                timestamp = request.get_metadata()["SensorTimestamp"]
+                for name in self.streams:
+                    if name not in self.active_streams:
+                        frames.append(None)
+                        continue
+                    with map_stream(request, name) as mapped:
+                        slot = self._acquire(index, name, mapped.array)
+                        slots.append(slot)
+                        copy_frame(mapped.array, slot.array, self.flips[index], self.drop_alpha)
+                    frames.append(slot.array)
+            except Exception:
+                # Drop this frame, but give its slots back and keep capturing
+                self._release(slots)
+                self.errors[index] += 1
+                print(f"[auv.capture] Camera {index} frame failed:")
+                traceback.print_exc()
+                continue
+            finally:
+                request.release()
+            self._add(index, timestamp, frames[0] if len(frames) == 1 else tuple(frames), tuple(slots))
+
+    def _acquire(self, index, name, src):
+        """A ring slot for a copy of src, creating the ring on first use."""
+        ring = self.rings[index].get(name)
+        if ring is None:
+            shape = src.shape[:2] + (3,) if self.drop_alpha else src.shape
+            with self._cond:  # report() iterates the rings
+                ring = self.rings[index][name] = FrameRing(shape, src.dtype, self.ring_slots)
+        return ring.acquire()
+
+    @staticmethod
+    def _release(slots):
+        for slot in slots:
+            slot.release()
+
+    def _drop(self, index):
+        """Discard the oldest pending frame of camera index (caller holds _cond)."""
+        _, _, slots = self._pending[index].popleft()
+        self._release(slots)
+        self.unpaired[index] += 1
+
+    def _add(self, index, timestamp, frame, slots):
+        with self._cond:
+            pending = self._pending[index]
+            if len(pending) == self.max_pending:
+                self._drop(index)
+            pending.append((timestamp, frame, slots))
+
+            left, right = self._pending
+            while left and right:
+                skew = left[0][0] - right[0][0]
+                if abs(skew) <= self.tolerance_ns:
+                    (_, frame0, slots0), (_, frame1, slots1) = left.popleft(), right.popleft()
+                    if self._pair is not None:
+                        self._release(self._pair[1])
+                    self._pair = ((frame0, frame1), slots0 + slots1)
+                    self._seq += 1
+                    self.skews_ms.append(skew / 1e6)
+                    self._cond.notify_all()
+                elif skew < 0:
+                    self._drop(0)   # left frame is older than anything right can still deliver
+                else:
+                    self._drop(1)
+
+    def start(self):
+        self._running.set()
+        self._started_at = time.monotonic()
+        self._threads = [threading.Thread(target=self._capture_loop, args=(i,), daemon=True) for i in (0, 1)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._threads = []
+        with self._cond:
+            for index in (0, 1):
+                while self._pending[index]:
+                    self._drop(index)
+            if self._pair is not None:
+                self._release(self._pair[1])
+                self._pair = None
+        if self._held is not None:
+            self._held.release()
+            self._held = None
+
+    def read(self, timeout=1.0):
+        """Next pair as (frame0, frame1) for a single consumer; None on timeout.
+
+        The frames stay valid until the next read() call.
+        """
+        pair = self.read_pair(self._last_read, timeout)
+        if pair is None:
+            return None
+        if self._held is not None:
+            self._held.release()
+        self._held = pair
+        self._last_read = pair.seq
+        return pair.frames
+
+    def read_pair(self, last_seq=None, timeout=1.0):
+        """StereoPair for the newest pair after last_seq (default: the last one read), or None.
+
+        The caller owns the pair's slots until it calls release(). Several
+        consumers can share one StereoCapture, each passing its own last seq.
+        """
+        own = last_seq is None
+        if own:
+            last_seq = self._last_read
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq, timeout):
+                return None
+            frames, slots = self._pair
+            for slot in slots:
+                slot.retain()
+            if own:
+                self._last_read = self._seq
+            return StereoPair(frames, slots, self._seq)
+
+    def read_seq(self, last_seq=0, timeout=1.0):
+        """(seq, StereoPair) for the newest pair after last_seq, or (last_seq, None); release the pair."""
+        pair = self.read_pair(last_seq, timeout)
+        return (last_seq, None) if pair is None else (pair.seq, pair)
+
+    def report(self):
+        with self._cond:
+            skews = np.abs(np.array(self.skews_ms))
+            pairs, unpaired = self._seq, list(self.unpaired)
+            rings = [list(cam_rings.values()) for cam_rings in self.rings]
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        report = {
+            "pairs": pairs,
+            "pairs_per_s": round(pairs / elapsed, 2) if elapsed else 0.0,
+            "unpaired": {"cam0": unpaired[0], "cam1": unpaired[1]},
+            "errors": list(self.errors),
+            "ring_overruns": [sum(ring.overruns for ring in cam_rings) for cam_rings in rings],
+            "slots_in_use": [sum(ring.in_use() for ring in cam_rings) for cam_rings in rings],
+        }
+        if len(skews):
+            report["skew_ms"] = {
+                "p50": round(float(np.percentile(skews, 50)), 3),
+                "p95": round(float(np.percentile(skews, 95)), 3),
+                "max": round(float(skews.max()), 3),
+            }
+        return report
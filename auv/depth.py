@@ -0,0 +1,143 @@
+"""Per-track depth estimation with a constant-velocity Kalman filter.
+
+DepthSmoother averaged the last five depths per *label*, so two swimmers were
+blended into one number and every change showed up five frames late.
+KalmanDepthFilter keeps [depth, closing speed] per tracked object ID, gates
+out stereo outliers on the innovation and can predict each depth forward to
+the moment the control loop acts on it. All tracks live in preallocated
+arrays, so one update() call filters every measurement of a frame at once.
+"""
+import time
+
+import numpy as np
+
+
+class KalmanDepthFilter:
+    """Constant-velocity Kalman filter on depth (cm) for up to `capacity` track IDs.
+
+    accel_std is the process noise (cm/s^2); measurement noise grows with depth
+    like stereo error does: max(measurement_rel * z, measurement_min) cm, with
+    measurement_rel overridable per measurement when depths come from sources
+    of different quality (e.g. a dense SGBM median vs box-centre disparity). A
+    measurement more than gate_sigma standard deviations from the prediction
+    is rejected; after max_rejects rejections in a row the track is restarted
+    at the new depth (the object really did jump). Tracks not measured for
+    max_age seconds are dropped.
+    """
+
+    def __init__(self, capacity=32, accel_std=30.0, measurement_rel=0.05, measurement_min=2.0,
+                 velocity_std=50.0, gate_sigma=3.0, max_rejects=3, max_age=2.0):
+        self.capacity = capacity
+        self.q = accel_std ** 2
+        self.measurement_rel = measurement_rel
+        self.measurement_min = measurement_min
+        self.velocity_var = velocity_std ** 2
+        self.gate_sigma = gate_sigma
+        self.max_rejects = max_rejects
+        self.max_age = max_age
+
+        self.x = np.zeros((capacity, 2))    # depth, velocity
+        self.P = np.zeros((capacity, 3))    # covariance as p00, p01, p11
+        self.t = np.zeros(capacity)         # time of last measurement
+        self.rejects = np.zeros(capacity, dtype=np.int32)
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self.rejected = 0
+
+    def _slot(self, track_id, t):
+        slot = self._slots.get(track_id)
+        if slot is not None:
+            return slot, False
+        if not self._free:
+            # Full: recycle the track that was measured longest ago
+            oldest = min(self._slots, key=lambda k: self.t[self._slots[k]])
+            self._free.append(self._slots.pop(oldest))
+        slot = self._free.pop()
+        self._slots[track_id] = slot
+        self.t[slot] = t
+        self.rejects[slot] = 0
+        return slot, True
+
+    def _release(self, track_id):
+        self._free.append(self._slots.pop(track_id))
+
+    def _predict(self, slots, t):
+        dt = np.maximum(t - self.t[slots], 0.0)
+        x = self.x[slots].copy()
+        x[:, 0] += dt * x[:, 1]
+        p00, p01, p11 = self.P[slots].T
+        P = np.stack([
+            p00 + 2 * dt * p01 + dt * dt * p11 + self.q * dt ** 4 / 4,
+            p01 + dt * p11 + self.q * dt ** 3 / 2,
+            p11 + self.q * dt * dt,
+        ], axis=1)
+        return x, P
+
+    def prune(self, t=None):
+        t = time.monotonic() if t is None else t
+        for track_id, slot in list(self._slots.items()):
+            if t - self.t[slot] > self.max_age:
+                self._release(track_id)
+
+    def update(self, track_ids, depths, t=None, measurement_rel=None):
+        """Fold one frame's measurements in; returns filtered depths (None where unknown).
+
+        depths may contain None (no stereo depth this frame): those tracks are
+        only predicted to t. measurement_rel, if given, is the relative noise
+        of each depth (parallel to depths).
+        """
+        t = time.monotonic() if t is None else t
+        self.prune(t)
+        if not len(track_ids):
+            return []
+        z = np.array([np.nan if d is None else d for d in depths], dtype=np.float64)
+        allocated = [self._slot(track_id, t) for track_id in track_ids]
+        slots = np.array([slot for slot, _ in allocated])
+        new = np.array([is_new for _, is_new in allocated])
+        measured = ~np.isnan(z)
+
+        x, P = self._predict(slots, t)
+        rel = self.measurement_rel if measurement_rel is None else np.asarray(measurement_rel, dtype=np.float64)
+        R = np.maximum(rel * np.nan_to_num(z), self.measurement_min) ** 2
+        S = P[:, 0] + R
+        y = np.nan_to_num(z) - x[:, 0]
+        inside = y * y <= self.gate_sigma ** 2 * S
+
+        accept = measured & ~new & inside
+        rejects = np.where(measured & ~new & ~inside, self.rejects[slots] + 1, 0)
+        restart = measured & (new | (rejects >= self.max_rejects))
+        self.rejected += int(np.count_nonzero(measured & ~new & ~inside & ~restart))
+
+        k0, k1 = P[:, 0] / S, P[:, 1] / S
+        x[accept, 0] += k0[accept] * y[accept]
+        x[accept, 1] += k1[accept] * y[accept]
+        P[accept] = np.stack([(1 - k0) * P[:, 0], (1 - k0) * P[:, 1], P[:, 2] - k1 * P[:, 1]], axis=1)[accept]
+        x[restart] = np.stack([z, np.zeros_like(z)], axis=1)[restart]
+        P[restart] = np.stack([R, np.zeros_like(R), np.full_like(R, self.velocity_var)], axis=1)[restart]
+
+        # Only measured tracks move their state (and clock) forward
+        self.x[slots[measured]] = x[measured]
+        self.P[slots[measured]] = P[measured]
+        self.t[slots[measured]] = t
+        self.rejects[slots] = np.where(restart, 0, rejects)
+        for track_id, is_new, has in zip(track_ids, new, measured):
+            if is_new and not has:
+                self._release(track_id)
+
+        known = measured | ~new
+        return [round(float(d), 2) if k else None for d, k in zip(x[:, 0], known)]
+
+    def predict(self, track_ids, t=None):
+        """Depths extrapolated to time t (e.g. when the motors act); None for unknown IDs."""
+        t = time.monotonic() if t is None else t
+        known = [track_id in self._slots for track_id in track_ids]
+        if not any(known):
+            return [None] * len(track_ids)
+        slots = np.array([self._slots[i] for i, k in zip(track_ids, known) if k])
+        depths = iter(self._predict(slots, t)[0][:, 0])
+        return [round(float(next(depths)), 2) if k else None for k in known]
+
+    def velocity(self, track_id):
+        """Closing speed in cm/s (negative when the object gets nearer), or None."""
+        slot = self._slots.get(track_id)
+        return None if slot is None else round(float(self.x[slot, 1]), 2)
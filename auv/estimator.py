@@ -0,0 +1,430 @@
+"""Navigation-state estimation from the MPU-9250 (error-state EKF).
+
+The old dead reckoning integrated low-passed acceleration without removing
+gravity or bias, integrated yaw with a fixed TIME_STEP and mixed up the axes
+when moving x/y. ErrorStateEKF keeps a nominal state (position, velocity,
+attitude quaternion, accel and gyro bias) that is integrated sample by
+sample with the real timestamps, and a 15-dimensional error covariance that
+measurement updates correct:
+
+- gravity direction from the accelerometer while the craft is not
+  accelerating (roll, pitch, accel bias),
+- magnetometer heading (yaw, and through it the gyro z bias),
+- zero velocity while the IMU reads stationary (caps velocity drift).
+
+The world frame is x = magnetic north, y = west, z = up; positions in m,
+velocities in m/s. A FIFO batch is propagated at once: the attitude is
+chained sample by sample in plain floats, everything else (rotation
+matrices, velocity, position) is vectorized over the batch, and the
+preallocated covariance is propagated once per few samples with in-place
+matmuls. Updates only touch the covariance columns they observe.
+
+NavigationEstimator runs the filter on its own thread from an IMUStream and
+publishes a Pose at a fixed rate for the control loop.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+from auv.pipeline import StageStats
+
+GRAVITY = 9.80665
+DEG_TO_RAD = math.pi / 180
+# AK8963 axes in the MPU-9250 accel/gyro frame: x_mag = y, y_mag = x, z_mag = -z
+MAG_TO_BODY = np.array([[0.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, -1.0]])
+
+# Error-state layout
+P_, V_, TH_, BA_, BG_ = slice(0, 3), slice(3, 6), slice(6, 9), slice(9, 12), slice(12, 15)
+N_STATES = 15
+
+
+def skew(v):
+    return np.array([[0.0, -v[2], v[1]], [v[2], 0.0, -v[0]], [-v[1], v[0], 0.0]])
+
+
+def quat_multiply(a, b):
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return np.array([
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ])
+
+
+def quat_from_rotvec(v):
+    angle = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    if angle < 1e-12:
+        return np.array([1.0, v[0] / 2, v[1] / 2, v[2] / 2])
+    s = math.sin(angle / 2) / angle
+    return np.array([math.cos(angle / 2), v[0] * s, v[1] * s, v[2] * s])
+
+
+def quat_to_matrix(q, out=None):
+    w, x, y, z = q
+    out = np.empty((3, 3)) if out is None else out
+    out[0, 0], out[0, 1], out[0, 2] = 1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)
+    out[1, 0], out[1, 1], out[1, 2] = 2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)
+    out[2, 0], out[2, 1], out[2, 2] = 2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)
+    return out
+
+
+def quat_to_matrices(q):
+    """[N, 3, 3] rotation matrices from [N, 4] quaternions (w, x, y, z)."""
+    w, x, y, z = q.T
+    R = np.empty((len(q), 3, 3))
+    R[:, 0, 0], R[:, 0, 1], R[:, 0, 2] = 1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)
+    R[:, 1, 0], R[:, 1, 1], R[:, 1, 2] = 2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)
+    R[:, 2, 0], R[:, 2, 1], R[:, 2, 2] = 2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)
+    return R
+
+
+def quat_from_euler(roll, pitch, yaw):
+    cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+    cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+    cy, sy = math.cos(yaw / 2), math.sin(yaw / 2)
+    return np.array([cr * cp * cy + sr * sp * sy, sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy, cr * cp * sy - sr * sp * cy])
+
+
+def euler_from_matrix(R):
+    """(roll, pitch, yaw) in radians, ZYX convention."""
+    return (math.atan2(R[2, 1], R[2, 2]), math.asin(max(-1.0, min(1.0, -R[2, 0]))),
+            math.atan2(R[1, 0], R[0, 0]))
+
+
+def wrap_angle(a):
+    return (a + math.pi) % (2 * math.pi) - math.pi
+
+
+class Pose:
+    """Published navigation state: position/velocity (m, m/s), attitude (deg), biases."""
+
+    def __init__(self, timestamp, position, velocity, roll, pitch, yaw, gyro_bias, accel_bias):
+        self.timestamp = timestamp
+        self.position = position
+        self.velocity = velocity
+        self.roll = roll
+        self.pitch = pitch
+        self.yaw = yaw
+        self.gyro_bias = gyro_bias
+        self.accel_bias = accel_bias
+
+    def as_dict(self):
+        return {
+            "t": round(self.timestamp, 4),
+            "position_m": [round(float(v), 3) for v in self.position],
+            "velocity_m_s": [round(float(v), 3) for v in self.velocity],
+            "roll": round(self.roll, 2), "pitch": round(self.pitch, 2), "yaw": round(self.yaw, 2),
+            "gyro_bias_dps": [round(float(v), 4) for v in self.gyro_bias],
+            "accel_bias_g": [round(float(v), 4) for v in self.accel_bias],
+        }
+
+
+class ErrorStateEKF:
+    """15-state error-state EKF driven by accel (g) and gyro (deg/s) samples.
+
+    Noise densities are per sqrt(s): accel_noise (m/s^2), gyro_noise (rad/s),
+    and the bias random walks accel_bias_walk (m/s^3), gyro_bias_walk (rad/s^2).
+    The covariance is propagated every covariance_every samples.
+    """
+
+    def __init__(self, accel_noise=0.05, gyro_noise=0.005, accel_bias_walk=0.002, gyro_bias_walk=5e-5,
+                 gravity_std=0.3, heading_std_deg=5.0, zero_velocity_std=0.05,
+                 stationary_gyro_dps=1.0, stationary_accel=0.2, covariance_every=10):
+        self.p = np.zeros(3)
+        self.v = np.zeros(3)
+        self.q = np.array([1.0, 0.0, 0.0, 0.0])
+        self.ba = np.zeros(3)   # m/s^2
+        self.bg = np.zeros(3)   # rad/s
+        self.R = np.eye(3)
+        self.t = None
+        self.covariance_every = covariance_every
+
+        self.P = np.diag([1e-4] * 3 + [1e-2] * 3 + [np.radians(5) ** 2] * 2 + [np.radians(30) ** 2]
+                         + [0.1 ** 2] * 3 + [np.radians(1) ** 2] * 3)
+        self._noise_density = np.array([0.0] * 3 + [accel_noise ** 2] * 3 + [gyro_noise ** 2] * 3
+                                       + [accel_bias_walk ** 2] * 3 + [gyro_bias_walk ** 2] * 3)
+        self._diag = np.diag_indices(N_STATES)
+        self._F = np.eye(N_STATES)
+        self._FP = np.empty((N_STATES, N_STATES))
+        self._stationary_R = np.diag([zero_velocity_std ** 2] * 3 + [gravity_std ** 2] * 3)
+        self._stationary_H = np.zeros((6, 9))   # columns V, TH, BA
+        self._stationary_H[0:3, 0:3] = np.eye(3)
+        self._stationary_H[3:6, 6:9] = np.eye(3)
+        self._heading_H = np.ones((1, 1))
+        self._heading_R = np.array([[np.radians(heading_std_deg) ** 2]])
+        self.stationary_gyro = np.radians(stationary_gyro_dps)
+        self.stationary_accel = stationary_accel
+        self.gravity_w = np.array([0.0, 0.0, -GRAVITY])
+        self.rejected = 0
+
+    # === Initialisation ===
+    def align(self, accel, gyro, mag=None, t=None):
+        """Level (and with mag, heading) from a short stationary batch; gyro mean -> bias."""
+        a = np.mean(np.asarray(accel, dtype=np.float64), axis=0) * GRAVITY
+        roll = math.atan2(a[1], a[2])
+        pitch = math.atan2(-a[0], math.hypot(a[1], a[2]))
+        self.q = quat_from_euler(roll, pitch, 0.0)
+        self.bg = np.mean(np.asarray(gyro, dtype=np.float64), axis=0) * DEG_TO_RAD
+        quat_to_matrix(self.q, self.R)
+        if mag is not None:
+            m = self.R @ (MAG_TO_BODY @ np.asarray(mag, dtype=np.float64))
+            self.q = quat_multiply(quat_from_rotvec([0.0, 0.0, -math.atan2(m[1], m[0])]), self.q)
+            quat_to_matrix(self.q, self.R)
+        self.t = t
+
+    # === Propagation ===
+    def _attitudes(self, angles):
+        """[N, 4] attitude after each body rotation increment in angles [N, 3] (rad)."""
+        qw, qx, qy, qz = self.q.tolist()
+        out = np.empty((len(angles), 4))
+        for i, (x, y, z) in enumerate(angles.tolist()):
+            angle = math.sqrt(x * x + y * y + z * z)
+            if angle < 1e-12:
+                dw, s = 1.0, 0.5
+            else:
+                dw, s = math.cos(angle / 2), math.sin(angle / 2) / angle
+            dx, dy, dz = x * s, y * s, z * s
+            qw, qx, qy, qz = (qw * dw - qx * dx - qy * dy - qz * dz, qw * dx + qx * dw + qy * dz - qz * dy,
+                              qw * dy - qx * dz + qy * dw + qz * dx, qw * dz + qx * dy - qy * dx + qz * dw)
+            norm = math.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+            qw, qx, qy, qz = qw / norm, qx / norm, qy / norm, qz / norm
+            out[i] = qw, qx, qy, qz
+        return out
+
+    def _propagate_covariance(self, dt, R, f_w):
+        F = self._F
+        F[P_, V_] = np.eye(3) * dt
+        F[V_, TH_] = -skew(f_w) * dt
+        F[V_, BA_] = -R * dt
+        F[TH_, BG_] = -R * dt
+        np.matmul(F, self.P, out=self._FP)
+        np.matmul(self._FP, F.T, out=self.P)
+        self.P[self._diag] += self._noise_density * dt
+
+    def predict_batch(self, t, accel, gyro):
+        """Propagate through [N] samples (t in s, accel [N, 3] in g, gyro [N, 3] in deg/s)."""
+        n = len(t)
+        if not n:
+            return
+        t = np.asarray(t, dtype=np.float64)
+        if self.t is None:
+            self.t = t[0]
+        dt = np.empty(n)
+        dt[0] = t[0] - self.t
+        np.subtract(t[1:], t[:-1], out=dt[1:])
+        np.maximum(dt, 0.0, out=dt)
+        a = np.asarray(accel, dtype=np.float64) * GRAVITY - self.ba
+        w = (np.asarray(gyro, dtype=np.float64) * DEG_TO_RAD - self.bg) * dt[:, None]
+
+        # Each sample's specific force is rotated with the attitude before it
+        q = self._attitudes(w)
+        R_prev = np.empty((n, 3, 3))
+        R_prev[0] = self.R
+        R_prev[1:] = quat_to_matrices(q[:-1])
+        f_w = np.einsum("nij,nj->ni", R_prev, a)
+        a_w = f_w + self.gravity_w
+        v = self.v + np.cumsum(a_w * dt[:, None], axis=0)
+        v_prev = np.vstack((self.v, v[:-1]))
+        self.p = self.p + np.sum(v_prev * dt[:, None] + 0.5 * a_w * (dt * dt)[:, None], axis=0)
+        self.v = v[-1]
+
+        for start in range(0, n, self.covariance_every):
+            chunk = slice(start, start + self.covariance_every)
+            span = float(dt[chunk].sum())
+            if span > 0:
+                weights = dt[chunk] / span
+                self._propagate_covariance(span, R_prev[start], weights @ f_w[chunk])
+
+        self.q = q[-1]
+        quat_to_matrix(self.q, self.R)
+        self.t = t[-1]
+
+    def predict(self, t, accel, gyro):
+        """One IMU sample (see predict_batch)."""
+        self.predict_batch(np.array([t]), np.asarray(accel)[None], np.asarray(gyro)[None])
+
+    # === Measurement updates ===
+    def _correct(self, cols, H, y, R_meas, gate_sigma=None):
+        """EKF update for a measurement observing only the error states in cols (a slice)."""
+        PHt = self.P[:, cols] @ H.T
+        S_inv = np.linalg.inv(H @ PHt[cols] + R_meas)
+        if gate_sigma is not None and y @ S_inv @ y > gate_sigma ** 2 * len(y):
+            self.rejected += 1
+            return False
+        K = PHt @ S_inv
+        dx = K @ y
+        self.P -= K @ PHt.T
+        self.P += self.P.T
+        self.P *= 0.5
+
+        self.p += dx[P_]
+        self.v += dx[V_]
+        self.q = quat_multiply(quat_from_rotvec(dx[TH_]), self.q)
+        self.q /= math.sqrt(self.q @ self.q)
+        self.ba += dx[BA_]
+        self.bg += dx[BG_]
+        quat_to_matrix(self.q, self.R)
+        return True
+
+    def stationary(self, accel, gyro):
+        """True if every sample of an [N, 3] batch reads as not moving."""
+        a = np.linalg.norm(accel, axis=-1) * GRAVITY
+        w = np.linalg.norm(np.asarray(gyro) * DEG_TO_RAD - self.bg, axis=-1)
+        return bool(np.all(np.abs(a - GRAVITY) < self.stationary_accel) and np.all(w < self.stationary_gyro))
+
+    def update_stationary(self, accel):
+        """Zero velocity plus the accelerometer (mean of a still batch, g) as a tilt measurement."""
+        g_up = -self.gravity_w
+        y = np.empty(6)
+        y[0:3] = -self.v
+        y[3:6] = np.asarray(accel) * GRAVITY - self.ba - self.R.T @ g_up
+        self._stationary_H[3:6, 3:6] = self.R.T @ skew(g_up)
+        return self._correct(slice(3, 12), self._stationary_H, y, self._stationary_R, gate_sigma=3.0)
+
+    def update_heading(self, mag):
+        """Magnetometer vector (AK8963 axes, any unit) as a yaw measurement."""
+        m = self.R @ (MAG_TO_BODY @ np.asarray(mag, dtype=np.float64))
+        if math.hypot(m[0], m[1]) < 1e-6:
+            return False
+        y = np.array([wrap_angle(-math.atan2(m[1], m[0]))])
+        return self._correct(slice(8, 9), self._heading_H, y, self._heading_R, gate_sigma=3.0)
+
+    def pose(self):
+        roll, pitch, yaw = euler_from_matrix(self.R)
+        return Pose(float(self.t or 0.0), self.p.copy(), self.v.copy(),
+                    math.degrees(roll), math.degrees(pitch), math.degrees(yaw),
+                    self.bg / DEG_TO_RAD, self.ba / GRAVITY)
+
+
+class NavigationEstimator:
+    """ErrorStateEKF fed from an IMUStream on a worker thread, publishing at publish_hz.
+
+    Each FIFO batch is propagated with its sample timestamps; a batch that
+    reads as stationary also gets a zero-velocity + gravity update, and every
+    fresh magnetometer sample (read_mag callable, AK8963 axes) a heading
+    update. mag_transform, if given, maps raw magnetometer readings first
+    (e.g. a calibration). latest() returns the newest Pose; subscribe(callback)
+    additionally pushes each one. With a TelemetryLogger every IMU sample
+    and published pose is logged.
+
+    Alignment and publishing are timed on stream.clock, so on a replayed
+    stream (paced=False) they follow the recording's time and the worker
+    runs without sleeping.
+    """
+
+    def __init__(self, stream, read_mag=None, publish_hz=50.0, align_seconds=1.0, ekf=None, mag_transform=None,
+                 telemetry=None):
+        self.stream = stream
+        self.telemetry = telemetry
+        self.read_mag = read_mag
+        self.mag_transform = mag_transform
+        self.publish_period = 1.0 / publish_hz
+        self.align_seconds = align_seconds
+        self.ekf = ekf or ErrorStateEKF()
+        self.stats = {name: StageStats() for name in ("predict", "update")}
+        self.samples = 0
+        self.published = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._latest = None
+        self._running = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _mag(self):
+        if self.read_mag is None:
+            return None
+        try:
+            mag = self.read_mag()
+        except EOFError:  # a replayed bus can run out of magnetometer reads before the FIFO data
+            return None
+        if mag is None or self.mag_transform is None:
+            return mag
+        return self.mag_transform(mag)
+
+    def _align(self):
+        ts, accels, gyros = [], [], []
+        deadline = self.stream.clock() + self.align_seconds
+        while self.stream.clock() < deadline and self._running.is_set() and not self.stream.ended:
+            t, accel, gyro = self.stream.read()
+            ts.append(t)
+            accels.append(accel)
+            gyros.append(gyro)
+            if self.stream.paced:
+                time.sleep(0.01)
+        t = np.concatenate(ts)
+        if len(t):
+            self.ekf.align(np.concatenate(accels), np.concatenate(gyros), self._mag(), t[-1])
+
+    def _publish(self):
+        pose = self.ekf.pose()
+        with self._lock:
+            self._latest = pose
+        self.published += 1
+        if self.telemetry is not None:
+            self.telemetry.log_pose(pose)
+        for callback in self._subscribers:
+            callback(pose)
+
+    def step(self):
+        """Fold in everything the IMU produced since the last step."""
+        t, accel, gyro = self.stream.read()
+        if len(t):
+            start = time.perf_counter()
+            self.ekf.predict_batch(t, accel, gyro)
+            self.stats["predict"].record(time.perf_counter() - start)
+            self.samples += len(t)
+            if self.telemetry is not None:
+                self.telemetry.log_imu(t, accel, gyro)
+            if self.ekf.stationary(accel, gyro):
+                start = time.perf_counter()
+                self.ekf.update_stationary(accel.mean(axis=0))
+                self.stats["update"].record(time.perf_counter() - start)
+        mag = self._mag()
+        if mag is not None:
+            start = time.perf_counter()
+            self.ekf.update_heading(mag)
+            self.stats["update"].record(time.perf_counter() - start)
+
+    def _run(self):
+        self._align()
+        next_publish = self.stream.clock()
+        while self._running.is_set() and not self.stream.ended:
+            self.step()
+            now = self.stream.clock()
+            if now >= next_publish:
+                self._publish()
+                next_publish = max(next_publish + self.publish_period, now)
+            if self.stream.paced:
+                time.sleep(max(0.0, next_publish - self.stream.clock()))
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="nav-estimator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def report(self):
+        report = {name: s.snapshot() for name, s in self.stats.items()}
+        report["samples"] = self.samples
+        report["published"] = self.published
+        report["rejected_updates"] = self.ekf.rejected
+        report["imu"] = self.stream.report()
+        return report
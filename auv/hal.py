@@ -0,0 +1,499 @@
+"""Hardware abstraction: camera, IMU and motor backends chosen by config.
+
+propeller_control/motor_control.py built its gpiozero Motors at import and
+every script opened Picamera2(0/1) and the I2C bus at module level, so
+nothing ran (or could be benchmarked) away from the vehicle. Hardware hands
+out each device through the interface the code already uses and only
+creates it on first use:
+
+- camera(index): a Picamera2, or a SimCamera rendering a SyntheticScene of
+  objects at known depths (same configure/start/capture_request API, so
+  configure_camera and StereoCapture run unchanged),
+- imu(): an auv.imu.MPU9250 on the real bus, or on a SimIMUBus, a
+  register-level MPU-9250/AK8963 model with noise, bias and bias drift,
+- motors(): GpioMotors (gpiozero) or SimMotors, which records commands.
+
+The backend per device is "real" or "sim", given to Hardware() or taken from
+AUV_CAMERA / AUV_IMU / AUV_MOTORS, falling back to AUV_HAL (default "real"):
+    AUV_HAL=sim python propeller_control/main.py
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from auv.estimator import MAG_TO_BODY
+from auv.imu import (ACCEL_LSB_PER_G, ACCEL_XOUT_H, FIFO_COUNTH, FIFO_EN, FIFO_R_W, FIFO_SAMPLE_BYTES,
+                     FIFO_SIZE, GYRO_LSB_PER_DPS, INT_FIFO_OFLOW, INT_STATUS, INTERNAL_RATE_HZ, MAG_ADDR,
+                     MAG_ASAX, MAG_CNTL1, MAG_CONTINUOUS_100HZ_16BIT, MAG_SAMPLE, MAG_ST1, MAG_UT_PER_LSB,
+                     MAG_XOUT_L, MPU9250, SMPLRT_DIV, TEMP_LSB_PER_C, TEMP_OFFSET_C, USER_CTRL,
+                     USER_CTRL_FIFO_EN, USER_CTRL_FIFO_RST, WHO_AM_I)
+
+BACKENDS = ("real", "sim")
+DEVICES = ("camera", "imu", "motors")
+HAL_ENV = "AUV_HAL"
+
+
+def backend_from_env(device):
+    """Backend name for device from AUV_<DEVICE>, then AUV_HAL, default "real"."""
+    return os.environ.get(f"AUV_{device.upper()}") or os.environ.get(HAL_ENV) or "real"
+
+
+# === Simulated Camera ===
+class SceneObject:
+    """A box-shaped object; position and size in cm, camera 0 at the origin, z forward."""
+
+    def __init__(self, label, x_cm, y_cm, depth_cm, width_cm, height_cm, velocity_cm_s=(0.0, 0.0, 0.0),
+                 color=(200, 80, 40)):
+        self.label = label
+        self.position = np.array([x_cm, y_cm, depth_cm], dtype=np.float64)
+        self.size = (width_cm, height_cm)
+        self.velocity = np.array(velocity_cm_s, dtype=np.float64)
+        self.color = color
+
+    def at(self, t):
+        return self.position + self.velocity * t
+
+
+class SyntheticScene:
+    """Textured boxes in front of a textured backdrop, rendered for either camera.
+
+    Camera 1 sits baseline_cm to the right of camera 0, so a box at depth Z
+    has exactly focal_length_px * baseline_cm / Z pixels of disparity, the
+    relation compute_depth inverts. focal_length_px is for 640 px wide
+    frames and scales with the requested size. depths(t) is the ground
+    truth, t in seconds since `epoch` (time.monotonic() at construction).
+    """
+
+    REFERENCE_WIDTH = 640
+
+    def __init__(self, objects, focal_length_px=625.0, baseline_cm=12.0, seed=0):
+        self.objects = list(objects)
+        self.focal_length_px = focal_length_px
+        self.baseline_cm = baseline_cm
+        self.epoch = time.monotonic()
+        rng = np.random.default_rng(seed)
+        # Fine texture so optical flow and SGBM have something to lock onto
+        self._backdrop = rng.integers(40, 90, (480, 640, 3), dtype=np.uint8)
+        self._textures = [np.clip(np.array(obj.color) + rng.integers(-30, 30, (32, 32, 3)), 0, 255).astype(np.uint8)
+                          for obj in self.objects]
+        self._backdrops = {}
+
+    @classmethod
+    def default(cls):
+        """A person ahead and a bottle off to the side, slowly drifting closer."""
+        return cls([
+            SceneObject("human", 10.0, 0.0, 250.0, 45.0, 120.0, velocity_cm_s=(0.0, 0.0, -5.0), color=(220, 170, 140)),
+            SceneObject("plastic bottle", -40.0, 20.0, 120.0, 8.0, 22.0, color=(60, 120, 220)),
+        ])
+
+    def depths(self, t=0.0):
+        return {obj.label: float(obj.at(t)[2]) for obj in self.objects}
+
+    def render(self, camera, size, t=0.0, out=None):
+        """RGB frame of size (w, h) from camera 0 or 1 at scene time t."""
+        w, h = size
+        backdrop = self._backdrops.get(size)
+        if backdrop is None:
+            backdrop = self._backdrops[size] = cv2.resize(self._backdrop, size, interpolation=cv2.INTER_NEAREST)
+        frame = out if out is not None else np.empty((h, w, 3), np.uint8)
+        np.copyto(frame, backdrop)
+        f = self.focal_length_px * w / self.REFERENCE_WIDTH
+        offset = camera * self.baseline_cm
+        # Far to near, so nearer objects cover farther ones
+        for obj, texture in sorted(zip(self.objects, self._textures), key=lambda o: -o[0].at(t)[2]):
+            x, y, z = obj.at(t)
+            if z <= 1.0:
+                continue
+            half_w, half_h = f * obj.size[0] / z / 2, f * obj.size[1] / z / 2
+            u, v = w / 2 + f * (x - offset) / z, h / 2 + f * y / z
+            x0, y0 = int(round(u - half_w)), int(round(v - half_h))
+            x1, y1 = int(round(u + half_w)), int(round(v + half_h))
+            cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+            if cx1 <= cx0 or cy1 <= cy0:
+                continue
+            patch = cv2.resize(texture, (x1 - x0, y1 - y0), interpolation=cv2.INTER_NEAREST)
+            frame[cy0:cy1, cx0:cx1] = patch[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+        return frame
+
+
+class _SimRequest:
+    """What capture_request() returns: one frame per configured stream plus metadata."""
+
+    def __init__(self, arrays, metadata):
+        self._arrays = arrays
+        self._metadata = metadata
+
+    def get_metadata(self):
+        return self._metadata
+
+    def make_array(self, name="main"):
+        return self._arrays[name].copy()
+
+    def mapped_array(self, name="main"):
+        return _Mapped(self._arrays[name])
+
+    def release(self):
+        pass
+
+
+class _Mapped:
+    def __init__(self, array):
+        self.array = array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# libcamera format -> conversion from the rendered RGB to its memory layout
+SIM_FORMATS = {
+    "BGR888": None,
+    "RGB888": cv2.COLOR_RGB2BGR,
+    "XBGR8888": cv2.COLOR_RGB2RGBA,
+    "XRGB8888": cv2.COLOR_RGB2BGRA,
+}
+
+
+class SimCamera:
+    """Picamera2 stand-in rendering a SyntheticScene at fps.
+
+    Frames are paced on a time.monotonic() grid of frame boundaries and
+    timestamped on it, so two SimCameras at the same fps pair exactly in
+    StereoCapture. Byte order follows libcamera's format names, which list
+    the channels of a little-endian word: XBGR8888 (the default) and BGR888
+    are R, G, B in memory, XRGB8888 and RGB888 are B, G, R, like OpenCV.
+    Frames are rendered upright; there is no ISP to apply a mounting transform.
+    """
+
+    def __init__(self, index, scene, fps=30.0):
+        self.index = index
+        self.scene = scene
+        self.period = 1.0 / fps
+        self._config = self.create_video_configuration()
+        self._started = False
+        self._next = 0
+        self._metadata = {}
+
+    def create_video_configuration(self, main=None, lores=None, **kwargs):
+        config = {"main": {"size": (640, 480), "format": "XBGR8888", **(main or {})}}
+        if lores is not None:
+            config["lores"] = {"format": "XBGR8888", **lores}
+        return {**kwargs, **config}
+
+    def configure(self, config):
+        self._config = config
+
+    def camera_configuration(self):
+        return self._config
+
+    def start(self):
+        self._started = True
+
+    def stop(self):
+        self._started = False
+
+    def _render(self, name, t):
+        stream = self._config[name]
+        rgb = self.scene.render(self.index, tuple(stream["size"]), t)
+        conversion = SIM_FORMATS[stream.get("format", "XBGR8888")]
+        return rgb if conversion is None else cv2.cvtColor(rgb, conversion)
+
+    def capture_request(self):
+        if not self._started:
+            raise RuntimeError(f"SimCamera {self.index} is not started")
+        # Wait for the next frame boundary, skipping any that were missed
+        frame = max(self._next, int(time.monotonic() / self.period) + 1)
+        delay = frame * self.period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = frame + 1
+        t = frame * self.period
+        arrays = {name: self._render(name, t - self.scene.epoch) for name in ("main", "lores") if name in self._config}
+        self._metadata = {"SensorTimestamp": int(t * 1e9), "FrameDuration": int(self.period * 1e6)}
+        return _SimRequest(arrays, self._metadata)
+
+    def capture_array(self, name="main"):
+        return self.capture_request().make_array(name)
+
+    def capture_metadata(self):
+        return self._metadata
+
+
+# === Simulated IMU ===
+def stationary(t):
+    """Level and still: accel (0, 0, 1) g, no rotation."""
+    accel = np.zeros((len(t), 3))
+    accel[:, 2] = 1.0
+    return accel, np.zeros((len(t), 3))
+
+
+class SimIMUBus:
+    """SMBus stand-in modelling the MPU-9250 and AK8963 registers auv.imu uses.
+
+    MPU9250(SimIMUBus()) then runs the real driver code, FIFO included: the
+    FIFO fills at the configured output data rate on time.monotonic() (or
+    clock) and overflows like the chip's. motion(t [N]) gives the true
+    specific force (g) and rate (deg/s) in the sensor frame; the sensor adds
+    white noise, a constant bias and a gyro bias random walk, then
+    quantizes. The magnetometer sees field_ut (sensor frame) rotated by the
+    integrated yaw, reported in the AK8963's own axes.
+    """
+
+    WHO_AM_I_VALUE = 0x71
+
+    def __init__(self, motion=stationary, accel_noise_g=0.003, gyro_noise_dps=0.05,
+                 accel_bias_g=(0.008, -0.006, 0.005), gyro_bias_dps=(0.3, -0.2, 0.15), gyro_bias_walk_dps=0.002,
+                 field_ut=(22.0, 0.0, -40.0), mag_noise_ut=0.4, mag_asa=(128, 128, 128), seed=0,
+                 clock=time.monotonic):
+        self.motion = motion
+        self.accel_noise = accel_noise_g
+        self.gyro_noise = gyro_noise_dps
+        self.accel_bias = np.asarray(accel_bias_g, dtype=np.float64)
+        self.gyro_bias = np.asarray(gyro_bias_dps, dtype=np.float64)
+        self.gyro_bias_walk = gyro_bias_walk_dps
+        self.field = np.asarray(field_ut, dtype=np.float64)
+        self.mag_noise = mag_noise_ut
+        self.mag_asa = list(mag_asa)
+        self.clock = clock
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._odr = INTERNAL_RATE_HZ
+        self._fifo_enabled = False
+        self._fifo = bytearray()
+        self._fifo_t = self._start
+        self._overflow = False
+        self._mag_mode = 0
+        self._mag_last = self._start
+        self._yaw = 0.0
+        self.registers = {}
+
+    def _samples(self, t):
+        """[N, 6] (accel g, gyro deg/s) as measured at times t."""
+        accel, gyro = self.motion(t - self._start)
+        n = len(t)
+        self._yaw += float(np.sum(gyro[:, 2])) / self._odr
+        walk = self._rng.normal(0.0, self.gyro_bias_walk / np.sqrt(self._odr), (n, 3))
+        gyro_bias = self.gyro_bias + np.cumsum(walk, axis=0)
+        self.gyro_bias = gyro_bias[-1]
+        measured = np.empty((n, 6))
+        measured[:, :3] = accel + self.accel_bias + self._rng.normal(0.0, self.accel_noise, (n, 3))
+        measured[:, 3:] = gyro + gyro_bias + self._rng.normal(0.0, self.gyro_noise, (n, 3))
+        return measured
+
+    def _counts(self, samples):
+        counts = samples * np.array([ACCEL_LSB_PER_G] * 3 + [GYRO_LSB_PER_DPS] * 3)
+        return np.clip(np.round(counts), -32768, 32767).astype(">i2")
+
+    def _fill_fifo(self):
+        now = self.clock()
+        if not self._fifo_enabled:
+            self._fifo_t = now
+            return
+        n = int((now - self._fifo_t) * self._odr)
+        if n <= 0:
+            return
+        capacity = FIFO_SIZE // FIFO_SAMPLE_BYTES
+        t = self._fifo_t + np.arange(1, n + 1) / self._odr
+        self._fifo_t = t[-1]
+        self._fifo += self._counts(self._samples(t[-capacity - 1:])).tobytes()
+        if len(self._fifo) > FIFO_SIZE:
+            self._overflow = True
+            del self._fifo[:len(self._fifo) - capacity * FIFO_SAMPLE_BYTES]
+
+    def _reset_fifo(self):
+        self._fifo.clear()
+        self._fifo_t = self.clock()
+
+    def write_byte_data(self, addr, reg, value):
+        with self._lock:
+            self.registers[(addr, reg)] = value
+            if addr == MAG_ADDR:
+                if reg == MAG_CNTL1:
+                    self._mag_mode = value
+                return
+            if reg == SMPLRT_DIV:
+                self._odr = INTERNAL_RATE_HZ / (1 + value)
+            elif reg == USER_CTRL:
+                if value & USER_CTRL_FIFO_RST:
+                    self._reset_fifo()
+                self._fifo_enabled = bool(value & USER_CTRL_FIFO_EN) and bool(self.registers.get((addr, FIFO_EN)))
+            elif reg == FIFO_EN and not value:
+                self._fifo_enabled = False
+
+    def read_byte_data(self, addr, reg):
+        with self._lock:
+            if addr == MAG_ADDR:
+                if reg == MAG_ST1:
+                    ready = self._mag_mode == MAG_CONTINUOUS_100HZ_16BIT and self.clock() - self._mag_last >= 0.01
+                    return 0x01 if ready else 0x00
+                return self.registers.get((addr, reg), 0)
+            if reg == WHO_AM_I:
+                return self.WHO_AM_I_VALUE
+            if reg == INT_STATUS:
+                self._fill_fifo()
+                status = INT_FIFO_OFLOW if self._overflow else 0
+                self._overflow = False
+                return status
+            return self.registers.get((addr, reg), 0)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self._lock:
+            if addr == MAG_ADDR:
+                if reg == MAG_ASAX:
+                    return self.mag_asa[:length]
+                if reg == MAG_XOUT_L:
+                    self._mag_last = self.clock()
+                    return list(MAG_SAMPLE.pack(*self._mag_counts(), 0x10))[:length]
+                return [0] * length
+            if reg == ACCEL_XOUT_H:
+                counts = self._counts(self._samples(np.array([self.clock()])))[0]
+                temp = int((25.0 - TEMP_OFFSET_C) * TEMP_LSB_PER_C)
+                values = np.array([*counts[:3], temp, *counts[3:]], dtype=">i2")
+                return list(values.tobytes())[:length]
+            if reg == FIFO_COUNTH:
+                self._fill_fifo()
+                return [len(self._fifo) >> 8, len(self._fifo) & 0xFF][:length]
+            if reg == FIFO_R_W:
+                data = self._fifo[:length]
+                del self._fifo[:length]
+                return list(data) + [0] * (length - len(data))
+            return [0] * length
+
+    def _mag_counts(self):
+        yaw = np.radians(self._yaw)
+        c, s = np.cos(yaw), np.sin(yaw)
+        # The field is fixed in the world: in the sensor frame it turns by -yaw
+        body = np.array([c * self.field[0] + s * self.field[1], -s * self.field[0] + c * self.field[1], self.field[2]])
+        body = MAG_TO_BODY.T @ body + self._rng.normal(0.0, self.mag_noise, 3)
+        scale = MAG_UT_PER_LSB * ((np.array(self.mag_asa) - 128) * 0.5 / 128 + 1)
+        return np.clip(np.round(body / scale), -32768, 32767).astype(int).tolist()
+
+
+# === Motors ===
+class _Motors:
+    """forward/turn_right/turn_left/stop as in motor_control, on top of set(left, right)."""
+
+    def forward(self, speed=1.0):
+        self.set(speed, speed)
+
+    def turn_right(self, speed=1.0):
+        self.set(speed, 0.0)
+
+    def turn_left(self, speed=1.0):
+        self.set(0.0, speed)
+
+    def stop(self):
+        self.set(0.0, 0.0)
+
+
+class GpioMotors(_Motors):
+    """The two thrusters on gpiozero H-bridge pins (forward, backward)."""
+
+    def __init__(self, left_pins=(17, 27), right_pins=(23, 24)):
+        from gpiozero import Motor
+
+        self.left = Motor(forward=left_pins[0], backward=left_pins[1])
+        self.right = Motor(forward=right_pins[0], backward=right_pins[1])
+
+    @staticmethod
+    def _drive(motor, value):
+        if value > 0:
+            motor.forward(min(value, 1.0))
+        elif value < 0:
+            motor.backward(min(-value, 1.0))
+        else:
+            motor.stop()
+
+    def set(self, left, right):
+        """Speeds in [-1, 1]; negative runs backwards."""
+        self._drive(self.left, left)
+        self._drive(self.right, right)
+
+    def close(self):
+        self.left.close()
+        self.right.close()
+
+
+class SimMotors(_Motors):
+    """Records every (t, left, right) command instead of driving pins."""
+
+    def __init__(self, history=10000):
+        self.commands = []
+        self.history = history
+        self.state = (0.0, 0.0)
+
+    def set(self, left, right):
+        self.state = (float(left), float(right))
+        self.commands.append((time.monotonic(), *self.state))
+        if len(self.commands) > self.history:
+            del self.commands[:len(self.commands) - self.history]
+
+    def close(self):
+        pass
+
+
+# === Hardware ===
+class Hardware:
+    """Per-device backends ("real" or "sim"), each created on first use."""
+
+    def __init__(self, camera=None, imu=None, motors=None, scene=None, i2c_bus=1):
+        chosen = {"camera": camera, "imu": imu, "motors": motors}
+        self.backends = {device: chosen[device] or backend_from_env(device) for device in DEVICES}
+        for device, backend in self.backends.items():
+            if backend not in BACKENDS:
+                raise ValueError(f"{device} backend must be one of {BACKENDS}, not {backend!r}")
+        self.scene = scene
+        self.i2c_bus = i2c_bus
+        self._cameras = {}
+        self._imu_bus = None
+        self._motors = None
+
+    def simulated(self, device):
+        return self.backends[device] == "sim"
+
+    def camera(self, index=0):
+        """Picamera2(index), or a SimCamera of the shared scene."""
+        if index not in self._cameras:
+            if self.simulated("camera"):
+                if self.scene is None:
+                    self.scene = SyntheticScene.default()
+                self._cameras[index] = SimCamera(index, self.scene)
+            else:
+                from picamera2 import Picamera2
+
+                self._cameras[index] = Picamera2(index)
+        return self._cameras[index]
+
+    def warm_up(self, seconds=2.0):
+        """Give real cameras time for exposure to settle; simulated ones need none."""
+        if self._cameras and not self.simulated("camera"):
+            time.sleep(seconds)
+
+    def imu_bus(self):
+        if self._imu_bus is None:
+            if self.simulated("imu"):
+                self._imu_bus = SimIMUBus()
+            else:
+                import smbus2
+
+                self._imu_bus = smbus2.SMBus(self.i2c_bus)
+        return self._imu_bus
+
+    def imu(self, **kwargs):
+        """auv.imu.MPU9250 on this hardware's bus (kwargs as for MPU9250)."""
+        return MPU9250(self.imu_bus(), **kwargs)
+
+    def motors(self):
+        if self._motors is None:
+            self._motors = SimMotors() if self.simulated("motors") else GpioMotors()
+        return self._motors
+
+    def report(self):
+        return {"backends": dict(self.backends), "cameras": sorted(self._cameras),
+                "imu": self._imu_bus is not None, "motors": self._motors is not None}
@@ -0,0 +1,389 @@
+"""Shared MPU-9250 (+ AK8963 magnetometer) driver with burst I2C reads.
+
+The navigation scripts each read a 16-bit axis as two read_byte_data calls:
+12 bus transactions for one accel+gyro sample and 7 more for the
+magnetometer, which caps the loop at a few tens of Hz. The registers are
+contiguous, so MPU9250 reads ACCEL_XOUT_H..GYRO_ZOUT_L (14 bytes) and the
+AK8963 HXL..ST2 block (7 bytes) with one read_i2c_block_data each.
+
+For integration, IMUStream lets the chip sample at 200-1000 Hz into its own
+FIFO (paced by the sample-rate divider, not by time.sleep) and drains it on a
+reader thread in block reads. Samples get timestamps from the output data
+rate and land in a SampleRing as NumPy batches for vectorized consumers.
+"""
+import struct
+import threading
+import time
+
+import numpy as np
+
+# === I2C Addresses ===
+MPU_ADDR = 0x68
+MAG_ADDR = 0x0C  # AK8963, reachable once the MPU's bypass is on
+
+# === MPU-9250 Registers ===
+SMPLRT_DIV = 0x19    # ODR = 1 kHz / (1 + div) with the DLPF on
+CONFIG = 0x1A        # gyro DLPF_CFG
+GYRO_CONFIG = 0x1B
+ACCEL_CONFIG2 = 0x1D  # accel A_DLPF_CFG
+FIFO_EN = 0x23
+INT_PIN_CFG = 0x37
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B  # accel x/y/z, temp, gyro x/y/z: 7 big-endian int16
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+WHO_AM_I = 0x75
+
+FIFO_ACCEL_GYRO = 0x78   # FIFO_EN: gyro x/y/z + accel; temperature stays out
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RST = 0x04
+INT_FIFO_OFLOW = 0x10
+FIFO_SIZE = 512
+FIFO_SAMPLE_BYTES = 12   # ax ay az gx gy gz
+BLOCK_READ_MAX = 32      # SMBus block limit when plain I2C transfers are unavailable
+INTERNAL_RATE_HZ = 1000.0
+# DLPF_CFG / A_DLPF_CFG code -> bandwidth (Hz), widest first
+DLPF_BANDWIDTHS = ((1, 184), (2, 92), (3, 41), (4, 20), (5, 10), (6, 5))
+
+# === AK8963 Registers ===
+MAG_ST1 = 0x02       # bit 0: data ready
+MAG_XOUT_L = 0x03    # x/y/z little-endian int16, then ST2 (reading it releases the data)
+MAG_CNTL1 = 0x0A
+MAG_ASAX = 0x10      # factory sensitivity adjustment x/y/z (fuse ROM)
+MAG_POWER_DOWN = 0x00
+MAG_FUSE_ROM = 0x0F
+MAG_CONTINUOUS_100HZ_16BIT = 0x16
+MAG_OVERFLOW = 0x08  # ST2 HOFL
+
+# === Scale Factors (power-on full-scale ranges) ===
+ACCEL_LSB_PER_G = 16384.0   # +-2 g
+GYRO_LSB_PER_DPS = 131.0    # +-250 deg/s
+MAG_UT_PER_LSB = 0.15       # 16-bit output
+TEMP_LSB_PER_C = 333.87
+TEMP_OFFSET_C = 21.0
+
+SAMPLE = struct.Struct(">7h")
+MAG_SAMPLE = struct.Struct("<3hB")
+SAMPLE_BYTES = SAMPLE.size
+
+
+def decode_samples(data, fields=7):
+    """[N, fields] int16 from N back-to-back big-endian samples.
+
+    fields=7 is the register layout (ax, ay, az, temp, gx, gy, gz); FIFO
+    samples are fields=6 (ax, ay, az, gx, gy, gz).
+    """
+    return np.frombuffer(bytes(data), dtype=">i2").reshape(-1, fields).astype(np.int16)
+
+
+def dlpf_code(rate_hz):
+    """Widest DLPF setting whose bandwidth stays under the Nyquist rate."""
+    for code, bandwidth in DLPF_BANDWIDTHS:
+        if bandwidth < rate_hz / 2:
+            return code
+    return DLPF_BANDWIDTHS[-1][0]
+
+
+class SampleRing:
+    """Single-producer, single-consumer ring of timestamped IMU samples.
+
+    push() and pop() never lock: the producer only advances `head` after the
+    rows are written and the consumer only advances `tail`, and each index is
+    a plain int assignment. If the producer laps the consumer the oldest
+    samples are lost and counted in `dropped`.
+    """
+
+    def __init__(self, capacity=4096, fields=6):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.data = np.zeros((capacity, fields), dtype=np.float32)
+        self.head = 0   # total samples written
+        self.tail = 0   # total samples consumed
+        self.dropped = 0
+
+    def push(self, t, data):
+        n = len(t)
+        if n > self.capacity:
+            t, data = t[-self.capacity:], data[-self.capacity:]
+            n = self.capacity
+        start = self.head % self.capacity
+        first = min(n, self.capacity - start)
+        self.t[start:start + first] = t[:first]
+        self.data[start:start + first] = data[:first]
+        self.t[:n - first] = t[first:]
+        self.data[:n - first] = data[first:]
+        self.head += n
+
+    def pop(self, max_samples=None):
+        """(t [N], data [N, fields]) copies of everything not consumed yet."""
+        head = self.head
+        if head - self.tail > self.capacity:
+            self.dropped += head - self.tail - self.capacity
+            self.tail = head - self.capacity
+        n = head - self.tail
+        if max_samples is not None:
+            n = min(n, max_samples)
+        index = np.arange(self.tail, self.tail + n) % self.capacity
+        self.tail += n
+        return self.t[index], self.data[index]
+
+    def __len__(self):
+        return min(self.head - self.tail, self.capacity)
+
+
+class LockedBus:
+    """SMBus-like proxy that runs one transaction at a time.
+
+    smbus2 selects the slave with ioctl(I2C_SLAVE) and transfers in a
+    separate call, so an MPU-9250 FIFO read on the IMUStream thread and an
+    AK8963 read on another thread can interleave and reach the wrong device.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.lock = threading.Lock()
+        if hasattr(bus, "i2c_rdwr"):
+            self.i2c_rdwr = self._i2c_rdwr
+
+    def write_byte_data(self, addr, reg, value):
+        with self.lock:
+            return self.bus.write_byte_data(addr, reg, value)
+
+    def read_byte_data(self, addr, reg):
+        with self.lock:
+            return self.bus.read_byte_data(addr, reg)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self.lock:
+            return self.bus.read_i2c_block_data(addr, reg, length)
+
+    def _i2c_rdwr(self, *messages):
+        with self.lock:
+            return self.bus.i2c_rdwr(*messages)
+
+
+class MPU9250:
+    """One MPU-9250 on an I2C bus; bus is an SMBus number or an open SMBus-like object.
+
+    Every transaction goes through a LockedBus, so IMUStream's FIFO thread
+    and read_mag() callers on other threads can share the device.
+    mag_calibration (auv.magnetometer.MagCalibration) corrects read_mag() for
+    hard and soft iron; without it read_mag() is only ASA-adjusted.
+    """
+
+    def __init__(self, bus=1, address=MPU_ADDR, magnetometer=True, mag_calibration=None):
+        if isinstance(bus, int):
+            import smbus2
+            bus = smbus2.SMBus(bus)
+        self.bus = bus if isinstance(bus, LockedBus) else LockedBus(bus)
+        self.address = address
+        self.magnetometer = magnetometer
+        self.mag_calibration = mag_calibration
+        self.mag_asa = np.array([128, 128, 128])
+        self._mag_scale = np.full(3, MAG_UT_PER_LSB)
+
+    def initialize(self):
+        self.bus.write_byte_data(self.address, PWR_MGMT_1, 0x00)  # wake up
+        time.sleep(0.1)
+        if self.magnetometer:
+            self.bus.write_byte_data(self.address, INT_PIN_CFG, 0x02)  # bypass to the AK8963
+            self.read_mag_asa()
+            self.bus.write_byte_data(MAG_ADDR, MAG_CNTL1, MAG_CONTINUOUS_100HZ_16BIT)
+            time.sleep(0.01)
+        return self
+
+    def read_mag_asa(self):
+        """Read the AK8963 factory sensitivity adjustment (leaves it powered down)."""
+        self.bus.write_byte_data(MAG_ADDR, MAG_CNTL1, MAG_POWER_DOWN)
+        time.sleep(0.01)
+        self.bus.write_byte_data(MAG_ADDR, MAG_CNTL1, MAG_FUSE_ROM)
+        time.sleep(0.01)
+        self.mag_asa = np.array(self.bus.read_i2c_block_data(MAG_ADDR, MAG_ASAX, 3))
+        self.bus.write_byte_data(MAG_ADDR, MAG_CNTL1, MAG_POWER_DOWN)
+        time.sleep(0.01)
+        # Datasheet: Hadj = H * ((ASA - 128) * 0.5 / 128 + 1)
+        self._mag_scale = MAG_UT_PER_LSB * ((self.mag_asa - 128) * 0.5 / 128 + 1)
+        return self.mag_asa
+
+    def mag_to_ut(self, raw):
+        """[N, 3] raw counts -> ASA-adjusted uT (no iron correction)."""
+        return np.asarray(raw, dtype=np.float64) * self._mag_scale
+
+    def who_am_i(self):
+        return self.bus.read_byte_data(self.address, WHO_AM_I)
+
+    def read_raw(self):
+        """(ax, ay, az, temp, gx, gy, gz) raw counts from one 14-byte transaction."""
+        return SAMPLE.unpack(bytes(self.bus.read_i2c_block_data(self.address, ACCEL_XOUT_H, SAMPLE_BYTES)))
+
+    def read(self):
+        """((ax, ay, az) in g, (gx, gy, gz) in deg/s, temperature in C) from one burst."""
+        ax, ay, az, temp, gx, gy, gz = self.read_raw()
+        accel = (ax / ACCEL_LSB_PER_G, ay / ACCEL_LSB_PER_G, az / ACCEL_LSB_PER_G)
+        gyro = (gx / GYRO_LSB_PER_DPS, gy / GYRO_LSB_PER_DPS, gz / GYRO_LSB_PER_DPS)
+        return accel, gyro, temp / TEMP_LSB_PER_C + TEMP_OFFSET_C
+
+    def configure_fifo(self, rate_hz=500):
+        """Sample accel + gyro into the FIFO at ~rate_hz; returns the actual ODR in Hz."""
+        div = int(np.clip(round(INTERNAL_RATE_HZ / rate_hz) - 1, 0, 255))
+        odr = INTERNAL_RATE_HZ / (1 + div)
+        dlpf = dlpf_code(odr)
+        self.bus.write_byte_data(self.address, USER_CTRL, 0x00)
+        self.bus.write_byte_data(self.address, FIFO_EN, 0x00)
+        self.bus.write_byte_data(self.address, CONFIG, dlpf)
+        self.bus.write_byte_data(self.address, GYRO_CONFIG, 0x00)  # +-250 deg/s, DLPF in use
+        self.bus.write_byte_data(self.address, ACCEL_CONFIG2, dlpf)
+        self.bus.write_byte_data(self.address, SMPLRT_DIV, div)
+        self.bus.write_byte_data(self.address, FIFO_EN, FIFO_ACCEL_GYRO)
+        self.reset_fifo()
+        return odr
+
+    def reset_fifo(self):
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_RST)
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_EN)
+
+    def fifo_overflowed(self):
+        """True if the FIFO overflowed since the last check (reading INT_STATUS clears it)."""
+        return bool(self.bus.read_byte_data(self.address, INT_STATUS) & INT_FIFO_OFLOW)
+
+    def fifo_count(self):
+        high, low = self.bus.read_i2c_block_data(self.address, FIFO_COUNTH, 2)
+        return ((high & 0x1F) << 8) | low
+
+    def read_fifo(self, nbytes):
+        """nbytes from FIFO_R_W: one plain I2C transfer if the bus has i2c_rdwr, else 32-byte blocks."""
+        if hasattr(self.bus, "i2c_rdwr"):
+            from smbus2 import i2c_msg
+            write, read = i2c_msg.write(self.address, [FIFO_R_W]), i2c_msg.read(self.address, nbytes)
+            self.bus.i2c_rdwr(write, read)
+            return bytes(read)
+        chunk = BLOCK_READ_MAX - BLOCK_READ_MAX % FIFO_SAMPLE_BYTES
+        data = bytearray()
+        while len(data) < nbytes:
+            data += bytes(self.bus.read_i2c_block_data(self.address, FIFO_R_W, min(chunk, nbytes - len(data))))
+        return bytes(data)
+
+    def read_mag_raw(self):
+        """(mx, my, mz) raw counts, or None if no new sample is ready or it overflowed."""
+        if not self.bus.read_byte_data(MAG_ADDR, MAG_ST1) & 0x01:
+            return None
+        mx, my, mz, st2 = MAG_SAMPLE.unpack(bytes(self.bus.read_i2c_block_data(MAG_ADDR, MAG_XOUT_L, MAG_SAMPLE.size)))
+        if st2 & MAG_OVERFLOW:
+            return None
+        return mx, my, mz
+
+    def read_mag(self):
+        """(mx, my, mz) in uT, ASA-adjusted and iron-corrected, or None (see read_mag_raw)."""
+        raw = self.read_mag_raw()
+        if raw is None:
+            return None
+        mag = self.mag_to_ut(raw)
+        if self.mag_calibration is not None:
+            mag = self.mag_calibration.apply(mag)
+        return tuple(mag.tolist())
+
+
+class IMUStream:
+    """FIFO sampling of an MPU9250 at rate_hz, drained on a reader thread.
+
+    Every drain reads all whole samples in the FIFO, converts them to g and
+    deg/s and pushes them into `ring` with timestamps spaced 1/odr apart.
+    Timestamps are on the time.monotonic() clock, anchored when sampling
+    starts and nudged slowly towards the host clock so the sensor
+    oscillator's drift does not accumulate. A FIFO overflow loses samples:
+    the FIFO is reset, `overflows` counts it and the time base re-anchors.
+    clock replaces time.monotonic, e.g. with auv.replay.ReplayBus.clock to
+    keep a recording's timestamps. paced=False (replay) starts no reader
+    thread and never sleeps: read() drains the FIFO on the caller's thread,
+    so the data moves as fast as the source serves it, and `ended` is set
+    once the source runs out (EOFError).
+    """
+
+    SCALE = np.array([1 / ACCEL_LSB_PER_G] * 3 + [1 / GYRO_LSB_PER_DPS] * 3, dtype=np.float32)
+
+    def __init__(self, imu, rate_hz=500, ring_capacity=4096, clock_gain=0.01, clock=time.monotonic,
+                 paced=True):
+        self.imu = imu
+        self.rate_hz = rate_hz
+        self.ring = SampleRing(ring_capacity, fields=6)
+        self.clock_gain = clock_gain
+        self.clock = clock
+        self.paced = paced
+        self.ended = False
+        self.odr = None
+        self.overflows = 0
+        self.samples = 0
+        self.drains = 0
+        self._t0 = 0.0
+        self._index = 0   # samples since the time base was anchored
+        self._running = threading.Event()
+        self._thread = None
+
+    def _anchor(self):
+        self._t0 = self.clock()
+        self._index = 0
+
+    def drain(self):
+        """Move everything in the FIFO into the ring; returns the number of samples."""
+        if self.imu.fifo_overflowed():
+            self.overflows += 1
+            self.imu.reset_fifo()
+            self._anchor()
+            return 0
+        count = self.imu.fifo_count() // FIFO_SAMPLE_BYTES
+        if not count:
+            return 0
+        raw = decode_samples(self.imu.read_fifo(count * FIFO_SAMPLE_BYTES), fields=6)
+        now = self.clock()
+        index = self._index + np.arange(1, count + 1)
+        t = self._t0 + index / self.odr
+        # The newest sample was taken within one period of now
+        self._t0 += self.clock_gain * (now - t[-1])
+        self._index += count
+        self.ring.push(t, raw * self.SCALE)
+        self.samples += count
+        self.drains += 1
+        return count
+
+    def _run(self):
+        # Wake about four times per FIFO fill so it never gets close to overflowing
+        period = FIFO_SIZE // FIFO_SAMPLE_BYTES / self.odr / 4
+        while self._running.is_set():
+            self.drain()
+            time.sleep(period)
+
+    def start(self):
+        self.odr = self.imu.configure_fifo(self.rate_hz)
+        self._anchor()
+        self._running.set()
+        if self.paced:
+            self._thread = threading.Thread(target=self._run, name="imu-fifo", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def read(self, max_samples=None):
+        """(t [N], accel [N, 3] g, gyro [N, 3] deg/s) for all samples since the last read."""
+        if not self.paced and self._running.is_set() and not self.ended:
+            try:
+                self.drain()
+            except EOFError:
+                self.ended = True
+        t, data = self.ring.pop(max_samples)
+        return t, data[:, :3], data[:, 3:]
+
+    def report(self):
+        return {
+            "odr_hz": self.odr,
+            "samples": self.samples,
+            "samples_per_drain": round(self.samples / self.drains, 1) if self.drains else 0.0,
+            "fifo_overflows": self.overflows,
+            "ring_dropped": self.ring.dropped,
+        }
@@ -0,0 +1,105 @@
+"""Hard- and soft-iron calibration for the AK8963 magnetometer.
+
+Near the motors and battery the raw field is offset (hard iron) and squashed
+into an ellipsoid (soft iron), so atan2 of the raw reading is not a heading.
+navigation/calibrate_magneto.py collects readings while the vehicle is
+turned through all orientations and fit_ellipsoid() finds the centre and the
+3x3 matrix that maps the ellipsoid back onto a sphere. The result is saved
+with the sensor's ASA values; at runtime MagCalibration.apply() corrects a
+whole [N, 3] batch with one subtraction and one matrix multiply.
+"""
+import os
+
+import numpy as np
+
+# === Calibration File (relative to the script's working directory) ===
+MAG_CALIBRATION = "mag_calibration.npz"
+
+
+def fit_ellipsoid(samples):
+    """(bias [3], soft_iron [3, 3], field) for [N, 3] samples on an ellipsoid.
+
+    Least-squares fit of the general quadric
+    a x^2 + b y^2 + c z^2 + 2d xy + 2e xz + 2f yz + 2g x + 2h y + 2i z = 1.
+    soft_iron @ (m - bias) lies on a sphere of radius `field`, the geometric
+    mean of the semi-axes, so corrected readings keep their units.
+    """
+    m = np.asarray(samples, dtype=np.float64)
+    x, y, z = m.T
+    design = np.column_stack([x * x, y * y, z * z, 2 * x * y, 2 * x * z, 2 * y * z, 2 * x, 2 * y, 2 * z])
+    coeffs, *_ = np.linalg.lstsq(design, np.ones(len(m)), rcond=None)
+    a, b, c, d, e, f, g, h, i = coeffs
+    Q = np.array([[a, d, e], [d, b, f], [e, f, c]])
+    bias = -np.linalg.solve(Q, [g, h, i])
+    Q = Q / (1.0 + bias @ Q @ bias)
+    eigvals, eigvecs = np.linalg.eigh(Q)
+    if np.any(eigvals <= 0):
+        raise ValueError("samples do not describe an ellipsoid; rotate through more orientations")
+    field = float(np.prod(eigvals) ** (-1 / 6))
+    soft_iron = field * (eigvecs @ np.diag(np.sqrt(eigvals)) @ eigvecs.T)
+    return bias, soft_iron, field
+
+
+def coverage(samples, bins=8):
+    """Fraction of direction bins (azimuth x elevation) the samples have visited."""
+    m = np.asarray(samples, dtype=np.float64)
+    m = m - m.mean(axis=0)
+    azimuth = np.arctan2(m[:, 1], m[:, 0])
+    elevation = np.arctan2(m[:, 2], np.hypot(m[:, 0], m[:, 1]))
+    hist, _, _ = np.histogram2d(azimuth, elevation, bins=(2 * bins, bins),
+                                range=((-np.pi, np.pi), (-np.pi / 2, np.pi / 2)))
+    return float(np.count_nonzero(hist)) / hist.size
+
+
+class MagCalibration:
+    """bias (uT) and soft_iron (3x3) for ASA-adjusted AK8963 readings in uT."""
+
+    def __init__(self, bias, soft_iron, field=None, asa=None, residual=None):
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.soft_iron = np.asarray(soft_iron, dtype=np.float64)
+        self.field = field
+        self.asa = None if asa is None else np.asarray(asa)
+        self.residual = residual
+        self._soft_iron_t = np.ascontiguousarray(self.soft_iron.T)
+
+    @classmethod
+    def fit(cls, samples, asa=None):
+        bias, soft_iron, field = fit_ellipsoid(samples)
+        calibration = cls(bias, soft_iron, field, asa)
+        radii = np.linalg.norm(calibration.apply(samples), axis=1)
+        calibration.residual = float(np.std(radii) / field)
+        return calibration
+
+    def apply(self, samples):
+        """Correct [N, 3] (or [3]) readings: (m - bias) @ soft_iron.T."""
+        return (np.asarray(samples, dtype=np.float64) - self.bias) @ self._soft_iron_t
+
+    __call__ = apply
+
+    def save(self, path=MAG_CALIBRATION):
+        np.savez(path, bias=self.bias, soft_iron=self.soft_iron, field=np.array(self.field),
+                 asa=np.array(self.asa if self.asa is not None else [128, 128, 128]),
+                 residual=np.array(self.residual if self.residual is not None else np.nan))
+
+    @classmethod
+    def load(cls, path=MAG_CALIBRATION):
+        with np.load(path) as data:
+            return cls(data["bias"], data["soft_iron"], float(data["field"]), data["asa"], float(data["residual"]))
+
+
+def load_mag_calibration(path=MAG_CALIBRATION, asa=None):
+    """MagCalibration from path, or None (with a note) if it has not been made yet.
+
+    asa, the sensor's current ASA values, is compared with the saved ones to
+    catch a calibration made on a different IMU board.
+    """
+    if not os.path.exists(path):
+        print(f"[auv.magnetometer] No {path}; magnetometer heading is uncorrected")
+        return None
+    calibration = MagCalibration.load(path)
+    if asa is not None and not np.array_equal(np.asarray(asa), calibration.asa):
+        print(f"[auv.magnetometer] {path} was made with ASA {calibration.asa.tolist()}, "
+              f"this sensor has {np.asarray(asa).tolist()}; recalibrate")
+    print(f"[auv.magnetometer] Loaded {path}: field={calibration.field:.1f}uT "
+          f"bias={np.round(calibration.bias, 1).tolist()} residual={calibration.residual:.1%}")
+    return calibration
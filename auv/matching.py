@@ -0,0 +1,160 @@
+"""Globally optimal left/right pairing of detections for stereo depth.
+
+The old match_detections() paired each left box with the first right box of
+the same label, so two swimmers or a few bottles in view got crossed pairs and
+nonsense depths. match_stereo() scores every left/right combination at once
+(epipolar row offset, size ratio, colour histogram, signed disparity) and
+solves the assignment with the Hungarian algorithm; pairs that break a gate
+are never matched.
+"""
+import cv2
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Cost of a forbidden pair; anything this large is dropped after assignment
+INFEASIBLE = 1e6
+# Camera 1 sits to the right of camera 0, so a point lies further right in
+# the left frame: cx0 - cx1 > 0. Use -1 for a rig mounted the other way.
+DISPARITY_SIGN = 1
+HIST_BINS = (16, 8)  # hue, saturation
+
+
+def hungarian(cost):
+    """Minimum-cost assignment, (rows, cols) like scipy's linear_sum_assignment.
+
+    Pure-NumPy O(n^2 m) shortest augmenting path with potentials, used when
+    SciPy is not installed; each inner step is a vector operation over columns.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)    # p[j]: row (1-based) assigned to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = 1 + int(np.argmin(np.where(free, minv[1:], np.inf)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign(cost):
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    return hungarian(cost)
+
+
+def hsv_histograms(frame, boxes):
+    """Normalized hue/saturation histogram per box, stacked as [N, bins]."""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    h, w = hsv.shape[:2]
+    hists = np.zeros((len(boxes), HIST_BINS[0] * HIST_BINS[1]), np.float32)
+    for i, (x, y, bw, bh) in enumerate(boxes):
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        patch = hsv[y0:min(int(y + bh), h), x0:min(int(x + bw), w)]
+        if patch.size:
+            hist = cv2.calcHist([patch], [0, 1], None, HIST_BINS, [0, 180, 0, 256]).reshape(-1)
+            hists[i] = hist / max(hist.sum(), 1.0)
+    return hists
+
+
+def stereo_cost(boxes0, boxes1, labels0, labels1, hists0=None, hists1=None,
+                max_row_diff=48, max_size_ratio=2.0, disparity_range=(1, 320), disparity_weight=1.0,
+                disparity_sign=DISPARITY_SIGN):
+    """[N, M] matching cost between left and right boxes ([x, y, w, h]).
+
+    Row offset is normalized by max_row_diff, size by log(max_size_ratio) and
+    appearance is the Bhattacharyya distance of the HSV histograms (0..1).
+    Disparity is signed (disparity_sign * (cx0 - cx1)) and gated to
+    disparity_range, so a right box on the wrong side never pairs. The
+    squared disparity term keeps identical-looking objects in order: over a
+    whole assignment sum(cx0 - cx1) is fixed, and the sum of squares is
+    smallest when left and right boxes pair in the same left-to-right order.
+    Label mismatches and pairs outside any gate cost INFEASIBLE.
+    """
+    boxes0 = np.asarray(boxes0, dtype=np.float64).reshape(-1, 4)
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    cx0, cy0 = boxes0[:, 0] + boxes0[:, 2] / 2, boxes0[:, 1] + boxes0[:, 3] / 2
+    cx1, cy1 = boxes1[:, 0] + boxes1[:, 2] / 2, boxes1[:, 1] + boxes1[:, 3] / 2
+
+    row_diff = np.abs(cy0[:, None] - cy1[None, :])
+    disparity = disparity_sign * (cx0[:, None] - cx1[None, :])
+    area0, area1 = boxes0[:, 2] * boxes0[:, 3], boxes1[:, 2] * boxes1[:, 3]
+    size_ratio = np.abs(np.log(np.maximum(area0[:, None], 1) / np.maximum(area1[None, :], 1))) / 2
+
+    cost = row_diff / max_row_diff + size_ratio / np.log(max_size_ratio)
+    cost += disparity_weight * (disparity / disparity_range[1]) ** 2
+    if hists0 is not None and hists1 is not None:
+        overlap = np.sqrt(hists0) @ np.sqrt(hists1).T
+        cost += np.sqrt(np.clip(1.0 - overlap, 0.0, 1.0))
+
+    feasible = (np.asarray(labels0)[:, None] == np.asarray(labels1)[None, :])
+    feasible &= row_diff <= max_row_diff
+    feasible &= size_ratio <= np.log(max_size_ratio)
+    feasible &= (disparity >= disparity_range[0]) & (disparity <= disparity_range[1])
+    return np.where(feasible, cost, INFEASIBLE)
+
+
+def match_stereo(dets0, dets1, frames=None, frame_size=None, track_ids=None, **gates):
+    """Optimal (label, box0, box1, center0, center1) pairs from two (label, box) lists.
+
+    frames=(frame0, frame1) adds the colour-histogram term; frame_size is the
+    (w, h) the boxes are expressed in when it differs from the frames (e.g.
+    main-stream boxes with lores frames). track_ids, parallel to dets0, appends
+    the left track ID to every pair. gates go to stereo_cost().
+    """
+    if not dets0 or not dets1:
+        return []
+    labels0, boxes0 = zip(*dets0)
+    labels1, boxes1 = zip(*dets1)
+
+    hists0 = hists1 = None
+    if frames is not None:
+        scale = 1.0 if frame_size is None else frames[0].shape[1] / frame_size[0]
+        hists0 = hsv_histograms(frames[0], np.asarray(boxes0, dtype=np.float64) * scale)
+        hists1 = hsv_histograms(frames[1], np.asarray(boxes1, dtype=np.float64) * scale)
+
+    cost = stereo_cost(boxes0, boxes1, labels0, labels1, hists0, hists1, **gates)
+    matched = []
+    for i, j in zip(*assign(cost)):
+        if cost[i, j] >= INFEASIBLE:
+            continue
+        box0, box1 = boxes0[i], boxes1[j]
+        center0 = (box0[0] + box0[2] // 2, box0[1] + box0[3] // 2)
+        center1 = (box1[0] + box1[2] // 2, box1[1] + box1[3] // 2)
+        if track_ids is None:
+            matched.append((labels0[i], box0, box1, center0, center1))
+        else:
+            matched.append((labels0[i], box0, box1, center0, center1, track_ids[i]))
+    return matched
@@ -0,0 +1,199 @@
+"""Pipelined capture -> inference -> encode frame engine.
+
+Each stage runs on its own thread and hands frames to the next one through a
+bounded queue that drops the oldest frame when full, so a slow stage never
+makes the others wait and never works on stale frames. OpenCV releases the GIL
+in capture, dnn forward and imencode, so the stages overlap on the Pi's cores.
+
+Items may own ring slots (auv.capture.StereoPair). Ownership moves along with
+the item: the pipeline releases it when a queue drops it, when a stage
+returns None for it, and after the last stage.
+"""
+import queue
+import threading
+import time
+import traceback
+
+
+def release_item(item):
+    """release() the item, or each top-level member of a tuple item, that has one."""
+    for part in item if isinstance(item, tuple) else (item,):
+        release = getattr(part, "release", None)
+        if release is not None:
+            release()
+
+
+class DropOldestQueue:
+    """Bounded queue whose put() discards the oldest item instead of blocking.
+
+    on_drop, if given, is called with every discarded item.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self._queue = queue.Queue(maxsize)
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    oldest = self._queue.get_nowait()
+                    self.dropped += 1
+                    if self.on_drop is not None:
+                        self.on_drop(oldest)
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+    def drain(self):
+        """Remove everything still queued, passing it to on_drop."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if self.on_drop is not None:
+                self.on_drop(item)
+
+
+class StageStats:
+    """Running latency counter for one pipeline stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {
+                "count": self.count,
+                "avg_ms": round(avg * 1000, 2),
+                "last_ms": round(self.last * 1000, 2),
+                "max_ms": round(self.max * 1000, 2),
+            }
+
+
+class FramePipeline:
+    """Run capture(), infer(item) and encode(item) on three threads.
+
+    capture() returns a new item; infer() and encode() take the previous
+    stage's output. Any stage may return None to drop the frame. Whatever
+    encode() returns is handed to publish(). Frames are stamped at capture so
+    report() can show end-to-end latency next to the per-stage timings.
+
+    An item owning ring slots (a StereoPair, or a tuple holding one) is
+    released with release_item() when a queue drops it, when a stage returns
+    None for it and after encode(); a stage passes ownership on by including
+    the pair in its result.
+
+    An exception in a stage (or in publish) is logged with the stage name and
+    counted in report(); the item is dropped and released, and the stage
+    carries on with the next one.
+    """
+
+    def __init__(self, capture, infer, encode, publish, queue_size=1):
+        self.stages = [("capture", capture), ("inference", infer), ("encode", encode)]
+        self.publish = publish
+        self.queues = [DropOldestQueue(queue_size, on_drop=self._release_queued)
+                       for _ in range(len(self.stages) - 1)]
+        self.stats = {name: StageStats() for name, _ in self.stages}
+        self.errors = dict.fromkeys([name for name, _ in self.stages] + ["publish"], 0)
+        self.end_to_end = StageStats()
+        self._running = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._running.set()
+        for index, (name, _) in enumerate(self.stages):
+            thread = threading.Thread(target=self._run, args=(index,), name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running.clear()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for q in self.queues:
+            q.drain()
+
+    def _failed(self, name):
+        self.errors[name] += 1
+        print(f"[auv.pipeline] {name} stage failed:")
+        traceback.print_exc()
+
+    @staticmethod
+    def _release_queued(entry):
+        _, item = entry
+        release_item(item)
+
+    def _run(self, index):
+        name, fn = self.stages[index]
+        inbox = self.queues[index - 1] if index > 0 else None
+        outbox = self.queues[index] if index < len(self.queues) else None
+        stats = self.stats[name]
+
+        while self._running.is_set():
+            if inbox is None:
+                stamp = time.monotonic()
+                start = time.perf_counter()
+                try:
+                    result = fn()
+                except Exception:
+                    self._failed(name)
+                    continue
+            else:
+                try:
+                    stamp, item = inbox.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                start = time.perf_counter()
+                result = None
+                try:
+                    result = fn(item)
+                except Exception:
+                    self._failed(name)
+                finally:
+                    # The item's slots now belong to the result, unless it was dropped or is done
+                    if outbox is None or result is None:
+                        release_item(item)
+            stats.record(time.perf_counter() - start)
+
+            if result is None:
+                continue
+            if outbox is not None:
+                outbox.put((stamp, result))
+            else:
+                try:
+                    self.publish(result)
+                except Exception:
+                    self._failed("publish")
+                    continue
+                self.end_to_end.record(time.monotonic() - stamp)
+
+    def report(self):
+        report = {name: stats.snapshot() for name, stats in self.stats.items()}
+        for name, _ in self.stages:
+            report[name]["errors"] = self.errors[name]
+        report["publish_errors"] = self.errors["publish"]
+        for (name, _), q in zip(self.stages[1:], self.queues):
+            report[name]["dropped"] = q.dropped
+        report["end_to_end"] = self.end_to_end.snapshot()
+        return report
@@ -0,0 +1,416 @@
+"""Record stereo frames and IMU bus traffic to disk, and replay them offline.
+
+Every script creates Picamera2 / SMBus objects at startup, so nothing could be
+run or profiled without the vehicle. A recording (raspi5/record.py) is one
+directory holding:
+
+- left/right frames, either as JPEG streams (left.mjpeg, right.mjpeg) or as
+  raw memory-mappable .npy frame stores (left.npy, right.npy),
+- frame-NNNN.npy: monotonic timestamp and offsets of every stereo pair,
+- i2c.bin: every byte the IMU driver read from the bus, back to back, and
+  i2c-NNNN.npy: time, address, register, offset and length of each read,
+- imu-NNNN.npy: the decoded IMU samples, for analysis.
+
+The replay side presents the interfaces the code already uses:
+ReplayStereoCapture for StereoCapture (read(), read_pair(), start(), report()),
+ReplayCamera for Picamera2.capture_array(), and ReplayBus for an SMBus
+(read_byte_data / read_i2c_block_data), so MPU9250 and IMUStream run
+unchanged on a recording. Replay runs as fast as possible or, with
+realtime=True, paced by the recorded timestamps; either way the recording's
+clock is the one the replayed code sees (IMUStream(paced=False, clock=bus.clock)).
+"""
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+import cv2
+import numpy as np
+
+from auv.capture import StereoPair
+from auv.telemetry import STREAMS, TelemetryLogger, TelemetryRun, _Chunk
+
+I2C_PAYLOAD = "i2c.bin"
+RECORD_STREAMS = {
+    "frame": np.dtype([("t", "f8"), ("index", "u4"), ("offset", "u8", 2), ("size", "u4", 2)]),
+    "i2c": np.dtype([("t", "f8"), ("addr", "u1"), ("reg", "u1"), ("offset", "u8"), ("length", "u2")]),
+    "imu": STREAMS["imu"],
+}
+CAMERAS = ("left", "right")
+
+
+class ReplayExhausted(EOFError):
+    """The recording has no more frames (or bus data) to replay."""
+
+
+# === Recording ===
+class RecordingBus:
+    """SMBus wrapper that logs every read into a recording's i2c stream.
+
+    The bytes read are appended to i2c.bin in the logger's directory and
+    indexed by offset and length in the i2c stream, so a 1-byte register
+    read costs one byte. Writes pass straight through and are not recorded:
+    replay only has to reproduce what the driver reads. Each transaction and
+    its log entry run under one lock, so the FIFO thread and read_mag()
+    callers neither interleave on the bus nor record out of order.
+    close() when done.
+    """
+
+    def __init__(self, bus, logger):
+        self.bus = bus
+        self.logger = logger
+        os.makedirs(logger.directory, exist_ok=True)
+        self._payload = open(os.path.join(logger.directory, I2C_PAYLOAD), "wb")
+        self._offset = 0
+        self._lock = threading.Lock()
+        if hasattr(bus, "i2c_rdwr"):
+            self.i2c_rdwr = self._i2c_rdwr
+
+    def _record(self, addr, reg, data):
+        """Log one read; the caller holds _lock."""
+        data = bytes(data)
+        self._payload.write(data)
+        self.logger.log("i2c", time.monotonic(), addr, reg, self._offset, len(data))
+        self._offset += len(data)
+
+    def close(self):
+        with self._lock:
+            self._payload.close()
+
+    def write_byte_data(self, addr, reg, value):
+        with self._lock:
+            self.bus.write_byte_data(addr, reg, value)
+
+    def read_byte_data(self, addr, reg):
+        with self._lock:
+            value = self.bus.read_byte_data(addr, reg)
+            self._record(addr, reg, [value])
+        return value
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self._lock:
+            data = self.bus.read_i2c_block_data(addr, reg, length)
+            self._record(addr, reg, data)
+        return data
+
+    def _i2c_rdwr(self, write, read):
+        with self._lock:
+            self.bus.i2c_rdwr(write, read)
+            self._record(read.addr, list(write)[0], bytes(read))
+
+
+class StereoRecorder:
+    """Writes stereo pairs on a background thread; jpeg_quality=None stores raw frames.
+
+    record() never blocks: when the writer falls max_pending pairs behind,
+    the pair is dropped and counted in `dropped`. release, if given (e.g. a
+    StereoPair's), is called once the frames are written or dropped.
+    """
+
+    def __init__(self, directory, jpeg_quality=90, max_pending=30, logger=None):
+        self.directory = directory
+        self.jpeg_quality = jpeg_quality
+        self.logger = logger or TelemetryLogger(directory, streams=RECORD_STREAMS)
+        self._queue = queue.Queue(max_pending)
+        self._files = None
+        self._stores = None
+        self.frames = 0
+        self.dropped = 0
+        self._running = threading.Event()
+        self._thread = None
+
+    def record(self, frame0, frame1, t=None, release=None):
+        t = time.monotonic() if t is None else t
+        try:
+            self._queue.put_nowait((t, frame0, frame1, release))
+        except queue.Full:
+            self.dropped += 1
+            if release is not None:
+                release()
+
+    def _write(self, t, frame0, frame1):
+        offsets, sizes = [0, 0], [0, 0]
+        for cam, (name, frame) in enumerate(zip(CAMERAS, (frame0, frame1))):
+            if self.jpeg_quality is None:
+                if self._stores is None:
+                    self._stores = [_Chunk(os.path.join(self.directory, f"{n}.npy"), frame.dtype, frame.shape)
+                                    for n in CAMERAS]
+                store = self._stores[cam]
+                offsets[cam], sizes[cam] = store.count, store.item_bytes
+                store.append(np.ascontiguousarray(frame)[None])
+            else:
+                ok, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+                if not ok:
+                    return
+                f = self._files[cam]
+                offsets[cam], sizes[cam] = f.tell(), len(jpeg)
+                f.write(jpeg.tobytes())
+        self.logger.log("frame", t, self.frames, offsets, sizes)
+        self.frames += 1
+
+    def _run(self):
+        while self._running.is_set() or not self._queue.empty():
+            try:
+                t, frame0, frame1, release = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self._write(t, frame0, frame1)
+            finally:
+                if release is not None:
+                    release()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.jpeg_quality is not None:
+            self._files = [open(os.path.join(self.directory, f"{n}.mjpeg"), "wb") for n in CAMERAS]
+        self.logger.start()
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="stereo-recorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=10.0)
+            self._thread = None
+        for f in self._files or []:
+            f.close()
+        for store in self._stores or []:
+            store.close()
+        self.logger.stop()
+
+    def report(self):
+        return {"frames": self.frames, "dropped": self.dropped, "pending": self._queue.qsize(),
+                "logger": self.logger.report()}
+
+
+# === Replay ===
+class Recording:
+    """A recording directory opened read-only (frames memory-mapped)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.run = TelemetryRun(directory)
+        self.frames = self.run["frame"]
+        raw = [os.path.join(directory, f"{n}.npy") for n in CAMERAS]
+        if all(os.path.exists(p) for p in raw):
+            self._raw = [np.load(p, mmap_mode="r") for p in raw]
+            self._jpeg = None
+        else:
+            self._raw = None
+            self._jpeg = [np.memmap(os.path.join(directory, f"{n}.mjpeg"), np.uint8, mode="r") for n in CAMERAS]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def timestamp(self, index):
+        return float(self.frames["t"][index])
+
+    def frame(self, index, camera):
+        record = self.frames[index]
+        if self._raw is not None:
+            return np.array(self._raw[camera][record["offset"][camera]])
+        start = int(record["offset"][camera])
+        return cv2.imdecode(self._jpeg[camera][start:start + int(record["size"][camera])], cv2.IMREAD_COLOR)
+
+    def pair(self, index):
+        return self.frame(index, 0), self.frame(index, 1)
+
+
+def open_recording(directory):
+    return directory if isinstance(directory, Recording) else Recording(directory)
+
+
+class _Pacer:
+    """Sleeps so recorded timestamps are replayed at wall-clock speed (if realtime)."""
+
+    def __init__(self, realtime):
+        self.realtime = realtime
+        self._offset = None
+
+    def wait(self, t):
+        if not self.realtime:
+            return
+        now = time.monotonic()
+        if self._offset is None:
+            self._offset = now - t
+        delay = t + self._offset - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplayStereoCapture:
+    """Drop-in for auv.capture.StereoCapture reading pairs from a Recording.
+
+    stream works as in StereoCapture; "lores" frames are resized from the
+    recorded frames to lores_size. At the end read() raises ReplayExhausted,
+    or starts over with loop=True.
+    """
+
+    def __init__(self, recording, stream="main", lores_size=None, realtime=False, loop=False):
+        self.recording = open_recording(recording)
+        self.streams = (stream,) if isinstance(stream, str) else tuple(stream)
+        self.active_streams = set(self.streams)
+        self.lores_size = lores_size
+        self.loop = loop
+        self._pacer = _Pacer(realtime)
+        self._index = 0
+        self._start = None
+        self.pairs = 0
+
+    def start(self):
+        self._start = time.monotonic()
+        return self
+
+    def stop(self):
+        pass
+
+    def _stream(self, frame, name):
+        if name not in self.active_streams:
+            return None
+        if name == "lores" and self.lores_size and (frame.shape[1], frame.shape[0]) != tuple(self.lores_size):
+            return cv2.resize(frame, tuple(self.lores_size), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def read_pair(self, last_seq=None, timeout=None):
+        """The next pair as a StereoPair; it owns no ring slots, so release() is a no-op."""
+        frames = self.read(timeout)
+        return StereoPair(frames, seq=self.pairs)
+
+    def read(self, timeout=None):
+        if self._index >= len(self.recording):
+            if not self.loop or not len(self.recording):
+                raise ReplayExhausted(f"replayed all {len(self.recording)} pairs of {self.recording.directory}")
+            self._index = 0
+            self._pacer = _Pacer(self._pacer.realtime)
+        self._pacer.wait(self.recording.timestamp(self._index))
+        frames = self.recording.pair(self._index)
+        self._index += 1
+        self.pairs += 1
+        if len(self.streams) == 1:
+            return frames
+        return tuple(tuple(self._stream(f, name) for name in self.streams) for f in frames)
+
+    def report(self):
+        elapsed = time.monotonic() - self._start if self._start else 0.0
+        return {"pairs": self.pairs, "pairs_per_s": round(self.pairs / elapsed, 1) if elapsed else 0.0,
+                "position": self._index, "length": len(self.recording), "replay": True}
+
+
+class ReplayCamera:
+    """Picamera2 stand-in: capture_array() returns the recorded frames of one camera."""
+
+    def __init__(self, recording, camera=0, realtime=False, loop=False):
+        self.recording = open_recording(recording)
+        self.camera = camera
+        self.loop = loop
+        self._pacer = _Pacer(realtime)
+        self._index = 0
+        self._metadata = {}
+
+    def create_video_configuration(self, **config):
+        return config
+
+    def configure(self, config):
+        pass
+
+    def camera_configuration(self):
+        return {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def capture_array(self, name="main"):
+        if self._index >= len(self.recording):
+            if not self.loop:
+                raise ReplayExhausted(f"camera {self.camera} replayed all {len(self.recording)} frames")
+            self._index = 0
+            self._pacer = _Pacer(self._pacer.realtime)
+        t = self.recording.timestamp(self._index)
+        self._pacer.wait(t)
+        self._metadata = {"SensorTimestamp": int(t * 1e9)}
+        frame = self.recording.frame(self._index, self.camera)
+        self._index += 1
+        return frame
+
+    def capture_metadata(self):
+        return self._metadata
+
+
+class ReplayBus:
+    """SMBus stand-in serving the bytes a RecordingBus captured.
+
+    Reads are answered per (address, register) in recorded order, as a byte
+    stream, so the driver may split a transfer differently than when it was
+    recorded (e.g. 32-byte FIFO blocks instead of one i2c_rdwr). Writes are
+    ignored. clock() is the recorded time of the last byte served; pass it to
+    IMUStream to timestamp samples on the recording's clock. `exhausted` is
+    set once a read runs past the end of the recording.
+    """
+
+    def __init__(self, recording, realtime=False):
+        directory = recording.directory if isinstance(recording, Recording) else recording
+        records = TelemetryRun(directory)["i2c"]
+        payload = np.fromfile(os.path.join(directory, I2C_PAYLOAD), np.uint8)
+        self._data = defaultdict(bytearray)
+        self._times = defaultdict(deque)   # (end offset, t) per key
+        for record in records:
+            start, end = int(record["offset"]), int(record["offset"]) + int(record["length"])
+            if end > len(payload):
+                break  # recording cut short before its payload reached the disk
+            key = (int(record["addr"]), int(record["reg"]))
+            self._data[key] += payload[start:end].tobytes()
+            self._times[key].append((len(self._data[key]), float(record["t"])))
+        self._read = defaultdict(int)
+        self._pacer = _Pacer(realtime)
+        self._now = float(records["t"][0]) if len(records) else 0.0
+        self.exhausted = False
+
+    def clock(self):
+        return self._now
+
+    def _take(self, addr, reg, length):
+        key = (addr, reg)
+        start = self._read[key]
+        if start + length > len(self._data[key]):
+            self.exhausted = True
+            raise ReplayExhausted(f"no more recorded reads of register 0x{reg:02X} at 0x{addr:02X}")
+        self._read[key] = start + length
+        times = self._times[key]
+        while times and times[0][0] < start + length:
+            times.popleft()
+        if times:
+            self._now = max(self._now, times[0][1])
+            self._pacer.wait(self._now)
+        return list(self._data[key][start:start + length])
+
+    def write_byte_data(self, addr, reg, value):
+        pass
+
+    def read_byte_data(self, addr, reg):
+        return self._take(addr, reg, 1)[0]
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return self._take(addr, reg, length)
+
+
+def replay_from_env():
+    """(recording directory, realtime) when AUV_REPLAY is set, else None.
+
+    Lets the vehicle scripts run on a recording unchanged:
+        AUV_REPLAY=recordings/pool-1 python propeller_control/main.py
+    AUV_REPLAY_REALTIME=1 paces the replay at the recorded speed.
+    """
+    directory = os.environ.get("AUV_REPLAY")
+    if not directory:
+        return None
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"AUV_REPLAY={directory} is not a recording directory")
+    print(f"[auv.replay] Replaying {directory}")
+    return directory, os.environ.get("AUV_REPLAY_REALTIME", "") not in ("", "0")
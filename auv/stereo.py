@@ -0,0 +1,225 @@
+"""Dense stereo depth (StereoSGBM) next to the box-center disparity.
+
+compute_depth() only knows the x offset between the two detection boxes, so
+it is noisy, needs both cameras to detect the object and says nothing about
+obstacles the DNN does not classify. DepthEngine computes a full disparity
+map on a worker thread at reduced resolution, turns it into centimetres and
+answers per-box median depths from the map computed for the same pair.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from auv.pipeline import DropOldestQueue, StageStats
+from auv.vision import BASELINE_CM, FOCAL_LENGTH_PX
+
+# Speed/quality presets. width is the working resolution (frames are resized to
+# it); num_disparities is chosen so the nearest measurable depth stays ~60 cm.
+PRESETS = {
+    "fast": dict(width=160, num_disparities=32, block_size=7, mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY),
+    "balanced": dict(width=320, num_disparities=64, block_size=5, mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY),
+    "quality": dict(width=640, num_disparities=128, block_size=5, mode=cv2.STEREO_SGBM_MODE_SGBM),
+}
+
+
+class DepthResult:
+    """One depth map in centimetres (NaN where SGBM found no match).
+
+    tag identifies the pair it was computed from (e.g. StereoPair.seq). With
+    rectify_maps the map is in rectified left-frame coordinates.
+    """
+
+    def __init__(self, depth_cm, timestamp, tag=None):
+        self.depth_cm = depth_cm
+        self.timestamp = timestamp
+        self.tag = tag
+
+    def box_depth(self, box, frame_size, min_valid=0.1):
+        """Median depth inside box, given in pixels of a frame_size (w, h) left frame.
+
+        The box must be in the map's coordinates: pass a rectified box
+        (StereoCalibration.rectify_box) when the engine rectifies. None when
+        fewer than min_valid of the box pixels have a depth.
+        """
+        h, w = self.depth_cm.shape
+        sx, sy = w / frame_size[0], h / frame_size[1]
+        x0, y0 = max(int(box[0] * sx), 0), max(int(box[1] * sy), 0)
+        x1, y1 = min(int((box[0] + box[2]) * sx) + 1, w), min(int((box[1] + box[3]) * sy) + 1, h)
+        patch = self.depth_cm[y0:y1, x0:x1]
+        valid = patch[~np.isnan(patch)]
+        if patch.size == 0 or valid.size < min_valid * patch.size:
+            return None
+        return round(float(np.median(valid)), 2)
+
+    def nearest(self, bands=3, percentile=5):
+        """Nearest obstacle per vertical band, left to right, for navigation.
+
+        Uses a low percentile rather than the minimum so a few bad matches do
+        not read as a wall; None for a band with no valid depth.
+        """
+        nearest = []
+        for strip in np.array_split(self.depth_cm, bands, axis=1):
+            valid = strip[~np.isnan(strip)]
+            nearest.append(round(float(np.percentile(valid, percentile)), 2) if valid.size else None)
+        return nearest
+
+
+class DepthEngine:
+    """StereoSGBM depth from left/right frames, computed on a worker thread.
+
+    submit() hands over a pair without blocking (an older unprocessed pair is
+    dropped); latest() returns the newest DepthResult and result(tag) the one
+    computed from the pair submitted with that tag, if it is among the last
+    few, waiting up to a timeout while that pair is still queued or computing. Frames still owned by a
+    ring are passed with owner (a StereoPair handle), released once the pair
+    is computed or dropped. compute() does the same
+    work synchronously. focal_length_px is the focal length at calib_width
+    pixels, the resolution compute_depth() uses. rectify_maps, if given, is
+    (map0x, map0y, map1x, map1y) for cv2.remap at the input resolution,
+    normally the fixed-point tables from StereoCalibration.maps().
+    """
+
+    def __init__(self, preset="balanced", focal_length_px=FOCAL_LENGTH_PX, baseline_cm=BASELINE_CM,
+                 calib_width=640, rectify_maps=None):
+        if preset not in PRESETS:
+            raise ValueError(f"preset must be one of {sorted(PRESETS)}, got {preset!r}")
+        self.preset = preset
+        self.params = PRESETS[preset]
+        self.focal_length_px = focal_length_px
+        self.baseline_cm = baseline_cm
+        self.calib_width = calib_width
+        self.rectify_maps = rectify_maps
+
+        block = self.params["block_size"]
+        self.matcher = cv2.StereoSGBM_create(
+            minDisparity=0,
+            numDisparities=self.params["num_disparities"],
+            blockSize=block,
+            P1=8 * block * block,
+            P2=32 * block * block,
+            disp12MaxDiff=1,
+            uniquenessRatio=10,
+            speckleWindowSize=100,
+            speckleRange=2,
+            mode=self.params["mode"],
+        )
+        self.stats = {name: StageStats() for name in ("rectify", "sgbm", "depth", "total")}
+        self._queue = DropOldestQueue(1, on_drop=self._dropped)
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending = set()   # tags submitted but neither computed nor dropped
+        self._results = deque(maxlen=4)
+        self._running = threading.Event()
+        self._thread = None
+
+    def _prepare(self, frame0, frame1):
+        grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) if f.ndim == 3 else f for f in (frame0, frame1)]
+        if self.rectify_maps is not None:
+            map0x, map0y, map1x, map1y = self.rectify_maps
+            grays = [cv2.remap(grays[0], map0x, map0y, cv2.INTER_LINEAR),
+                     cv2.remap(grays[1], map1x, map1y, cv2.INTER_LINEAR)]
+        h, w = grays[0].shape
+        width = min(self.params["width"], w)
+        if width != w:
+            size = (width, int(round(h * width / w)))
+            grays = [cv2.resize(g, size, interpolation=cv2.INTER_AREA) for g in grays]
+        return grays
+
+    def compute(self, frame0, frame1, tag=None):
+        """Depth map for one pair (frame0 = left), synchronously."""
+        start = time.perf_counter()
+        left, right = self._prepare(frame0, frame1)
+        t_rectify = time.perf_counter()
+        disparity = self.matcher.compute(left, right).astype(np.float32) / 16.0
+        t_sgbm = time.perf_counter()
+
+        # Disparity at the working width -> depth with the focal length scaled to match
+        focal = self.focal_length_px * left.shape[1] / self.calib_width
+        disparity[disparity <= 0] = np.nan
+        depth_cm = (focal * self.baseline_cm) / disparity
+        end = time.perf_counter()
+
+        self.stats["rectify"].record(t_rectify - start)
+        self.stats["sgbm"].record(t_sgbm - t_rectify)
+        self.stats["depth"].record(end - t_sgbm)
+        self.stats["total"].record(end - start)
+        return DepthResult(depth_cm, time.monotonic(), tag)
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                entry = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            frame0, frame1, tag, _ = entry
+            result = None
+            try:
+                result = self.compute(frame0, frame1, tag)
+            finally:
+                self._release_owner(entry)
+                with self._done:
+                    if result is not None:
+                        self._results.append(result)
+                    self._pending.discard(tag)
+                    self._done.notify_all()
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="depth-engine", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self._queue.drain()
+
+    @staticmethod
+    def _release_owner(entry):
+        owner = entry[-1]
+        if owner is not None:
+            owner.release()
+
+    def _dropped(self, entry):
+        self._release_owner(entry)
+        with self._done:
+            self._pending.discard(entry[2])
+            self._done.notify_all()
+
+    def submit(self, frame0, frame1, tag=None, owner=None):
+        if tag is not None:
+            with self._lock:
+                self._pending.add(tag)
+        self._queue.put((frame0, frame1, tag, owner))
+
+    def latest(self):
+        with self._lock:
+            return self._results[-1] if self._results else None
+
+    def _find(self, tag):
+        for result in reversed(self._results):
+            if result.tag == tag:
+                return result
+        return None
+
+    def result(self, tag, timeout=0.0):
+        """The DepthResult computed from the pair submitted with tag, or None.
+
+        Waits up to timeout seconds while that pair is queued or computing;
+        returns None at once if it was dropped.
+        """
+        with self._done:
+            self._done.wait_for(lambda: tag not in self._pending, timeout)
+            return self._find(tag)
+
+    def report(self):
+        report = {name: s.snapshot() for name, s in self.stats.items()}
+        report["preset"] = self.preset
+        report["dropped"] = self._queue.dropped
+        return report
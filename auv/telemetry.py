@@ -0,0 +1,270 @@
+"""Binary telemetry: typed record batches written by a background thread.
+
+Formatting text per sample and writing it straight to the SD card does not
+keep up with a 500 Hz IMU, and stdout prints cannot be lined up across
+subsystems afterwards. TelemetryLogger appends records to preallocated NumPy
+structured-array batches (one per stream, see STREAMS); full batches go to a
+writer thread that appends them to .npy chunk files and starts a new chunk
+once max_file_bytes is reached. Every record carries a time.monotonic()
+timestamp, the clock the capture, IMU and estimator code already use, so
+streams line up directly.
+
+Chunk headers are rewritten after every write, so a run cut short by a crash
+or power loss still loads. load_run() opens a whole run memory-mapped.
+"""
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+# === Record Types ===
+STREAMS = {
+    "imu": np.dtype([("t", "f8"), ("accel", "f4", 3), ("gyro", "f4", 3)]),
+    "pose": np.dtype([("t", "f8"), ("position", "f4", 3), ("velocity", "f4", 3), ("roll", "f4"),
+                      ("pitch", "f4"), ("yaw", "f4"), ("gyro_bias", "f4", 3), ("accel_bias", "f4", 3)]),
+    "detection": np.dtype([("t", "f8"), ("camera", "u1"), ("track_id", "i4"), ("label", "S24"),
+                           ("box", "i4", 4), ("confidence", "f4")]),
+    "depth": np.dtype([("t", "f8"), ("track_id", "i4"), ("label", "S24"), ("raw_cm", "f4"), ("depth_cm", "f4")]),
+    "motor": np.dtype([("t", "f8"), ("command", "S16"), ("left", "f4"), ("right", "f4")]),
+}
+
+TELEMETRY_DIR = "telemetry"
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def npy_header(dtype, count, size=None, item_shape=()):
+    """Version 1.0 .npy header for count records (each item_shape), padded to size bytes."""
+    shape = (count,) + tuple(item_shape)
+    text = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+    if size is None:
+        # Room for any record count, rounded up to the 64-byte alignment numpy uses
+        longest = len(text) + 20
+        size = -(-(len(NPY_MAGIC) + 2 + longest + 1) // 64) * 64
+    text = text.ljust(size - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(text)) + text.encode("latin1")
+
+
+class _Chunk:
+    """One .npy file being appended to; the header is kept in step with the data."""
+
+    def __init__(self, path, dtype, item_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.item_shape = tuple(item_shape)
+        self.item_bytes = self.dtype.itemsize * int(np.prod(self.item_shape, dtype=np.int64))
+        self.count = 0
+        self.file = open(path, "wb")
+        self.header_size = len(npy_header(self.dtype, 0, item_shape=self.item_shape))
+        self.file.write(npy_header(self.dtype, 0, self.header_size, self.item_shape))
+
+    @property
+    def nbytes(self):
+        return self.header_size + self.count * self.item_bytes
+
+    def append(self, records):
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(records.tobytes())
+        self.count += len(records)
+        self.file.seek(0)
+        self.file.write(npy_header(self.dtype, self.count, self.header_size, self.item_shape))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class TelemetryLogger:
+    """Per-stream record batches flushed by a writer thread into rotating .npy chunks.
+
+    log(stream, t, ...) adds one record (fields in STREAMS order); extend()
+    adds a whole column batch at once. A partially filled batch is flushed
+    after flush_interval seconds so slow streams still reach the disk.
+    """
+
+    def __init__(self, directory=None, batch_size=1024, max_file_bytes=16 * 1024 * 1024,
+                 flush_interval=1.0, pool_size=4, streams=STREAMS):
+        if directory is None:
+            directory = os.path.join(TELEMETRY_DIR, time.strftime("run-%Y%m%d-%H%M%S"))
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_file_bytes = max_file_bytes
+        self.flush_interval = flush_interval
+        self.streams = dict(streams)
+        self._pools = {name: [np.empty(batch_size, dtype) for _ in range(pool_size)]
+                       for name, dtype in self.streams.items()}
+        self._batches = {name: self._pools[name].pop() for name in self.streams}
+        self._fill = dict.fromkeys(self.streams, 0)
+        self._locks = {name: threading.Lock() for name in self.streams}
+        self._chunks = {}
+        self._chunk_index = dict.fromkeys(self.streams, 0)
+        self._queue = queue.Queue()
+        self._running = threading.Event()
+        self._thread = None
+        self.records = dict.fromkeys(self.streams, 0)
+        self.bytes_written = 0
+        self.files = 0
+        self.allocations = 0
+
+    # === Producer side ===
+    def _take_batch(self, stream):
+        pool = self._pools[stream]
+        if pool:
+            return pool.pop()
+        self.allocations += 1
+        return np.empty(self.batch_size, self.streams[stream])
+
+    def _hand_off(self, stream):
+        """Queue the current batch for writing (caller holds the stream lock)."""
+        n = self._fill[stream]
+        if n:
+            self._queue.put((stream, self._batches[stream], n))
+            self._batches[stream] = self._take_batch(stream)
+            self._fill[stream] = 0
+
+    def log(self, stream, *values):
+        with self._locks[stream]:
+            self._batches[stream][self._fill[stream]] = values
+            self._fill[stream] += 1
+            if self._fill[stream] == self.batch_size:
+                self._hand_off(stream)
+
+    def extend(self, stream, **columns):
+        """Append len(t) records given as field=array columns (missing fields are zero)."""
+        n = len(columns["t"])
+        start = 0
+        with self._locks[stream]:
+            while start < n:
+                fill = self._fill[stream]
+                take = min(n - start, self.batch_size - fill)
+                batch = self._batches[stream][fill:fill + take]
+                for name in self.streams[stream].names:
+                    if name in columns:
+                        batch[name] = columns[name][start:start + take]
+                    else:
+                        batch[name] = 0
+                self._fill[stream] += take
+                start += take
+                if self._fill[stream] == self.batch_size:
+                    self._hand_off(stream)
+
+    def flush(self):
+        for stream in self.streams:
+            with self._locks[stream]:
+                self._hand_off(stream)
+
+    # === Convenience for the project's own types ===
+    def log_imu(self, t, accel, gyro):
+        self.extend("imu", t=t, accel=accel, gyro=gyro)
+
+    def log_pose(self, pose):
+        self.log("pose", pose.timestamp, pose.position, pose.velocity, pose.roll, pose.pitch, pose.yaw,
+                 pose.gyro_bias, pose.accel_bias)
+
+    def log_tracks(self, t, tracks):
+        """Per-camera lists of auv.tracking.Track (as from TrackedDetector.tracks())."""
+        for camera, cam_tracks in enumerate(tracks):
+            for track in cam_tracks:
+                self.log("detection", t, camera, track.id, track.label, track.int_box(), track.confidence)
+
+    # === Writer side ===
+    def _write(self, stream, batch, n):
+        chunk = self._chunks.get(stream)
+        if chunk is not None and chunk.nbytes + n * batch.dtype.itemsize > self.max_file_bytes:
+            chunk.close()
+            chunk = None
+        if chunk is None:
+            path = os.path.join(self.directory, f"{stream}-{self._chunk_index[stream]:04d}.npy")
+            self._chunk_index[stream] += 1
+            chunk = self._chunks[stream] = _Chunk(path, batch.dtype)
+            self.files += 1
+        chunk.append(batch[:n])
+        self.records[stream] += n
+        self.bytes_written += n * batch.dtype.itemsize
+        with self._locks[stream]:
+            self._pools[stream].append(batch)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while self._running.is_set() or not self._queue.empty():
+            try:
+                self._write(*self._queue.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            if self._running.is_set() and time.monotonic() - last_flush > self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({"wall_time": time.time(), "monotonic": time.monotonic(),
+                       "streams": {name: np.lib.format.dtype_to_descr(d) for name, d in self.streams.items()}},
+                      f, indent=1, default=str)
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Flush everything still buffered, then close the chunk files."""
+        self.flush()
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        for chunk in self._chunks.values():
+            chunk.close()
+        self._chunks = {}
+
+    def report(self):
+        return {
+            "directory": self.directory,
+            "records": dict(self.records),
+            "mb_written": round(self.bytes_written / 1e6, 2),
+            "files": self.files,
+            "queued_batches": self._queue.qsize(),
+            "extra_allocations": self.allocations,
+        }
+
+
+class TelemetryRun:
+    """A logged run opened read-only: run["imu"], run.chunks("imu"), run.meta."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        meta_path = os.path.join(directory, "meta.json")
+        self.meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+
+    def streams(self):
+        names = {os.path.basename(p).rsplit("-", 1)[0] for p in glob.glob(os.path.join(self.directory, "*-*.npy"))}
+        return sorted(names)
+
+    def chunks(self, stream):
+        """Memory-mapped record arrays, one per chunk file, in order."""
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{stream}-[0-9][0-9][0-9][0-9].npy")))
+        return [a for a in (np.load(p, mmap_mode="r") for p in paths) if len(a)]
+
+    def __getitem__(self, stream):
+        """All records of a stream: the memmap itself for one chunk, else a concatenated copy."""
+        chunks = self.chunks(stream)
+        if not chunks:
+            return np.empty(0, STREAMS.get(stream, np.float64))
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def load_run(directory=None):
+    """TelemetryRun for directory, or the newest run under TELEMETRY_DIR."""
+    if directory is None:
+        runs = sorted(glob.glob(os.path.join(TELEMETRY_DIR, "run-*")))
+        if not runs:
+            raise FileNotFoundError(f"no runs under {TELEMETRY_DIR}")
+        directory = runs[-1]
+    return TelemetryRun(directory)
@@ -0,0 +1,174 @@
+"""Keyframe detection with cheap box tracking in between.
+
+Full MobileNet-SSD inference on every frame is the slowest part of the
+stereo loops, while the targets (a swimmer, a floating bottle) barely move
+between frames. TrackedDetector runs the detector on a keyframe schedule and
+propagates boxes on the frames in between with pyramidal Lucas-Kanade optical
+flow on a grid of points inside each box. Track IDs persist across keyframes
+by matching new detections to existing tracks on label and IoU.
+"""
+import itertools
+
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class Track:
+    def __init__(self, track_id, label, box, confidence):
+        self.id = track_id
+        self.label = label
+        self.box = np.asarray(box, dtype=np.float32)  # x, y, w, h
+        self.confidence = float(confidence)
+        self.age = 0  # frames since the detector last confirmed this track
+
+    def int_box(self):
+        return self.box.round().astype(np.int32)
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def grid_points(box, n=5):
+    x, y, w, h = box
+    xs = np.linspace(x + 0.1 * w, x + 0.9 * w, n)
+    ys = np.linspace(y + 0.1 * h, y + 0.9 * h, n)
+    return np.array([(px, py) for py in ys for px in xs], dtype=np.float32).reshape(-1, 1, 2)
+
+
+def propagate_box(prev_gray, gray, box, max_fb_error=1.0):
+    """Move a box from prev_gray to gray; returns (new_box, fraction_of_points_tracked)."""
+    p0 = grid_points(box)
+    p1, st1, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, p0, None, **LK_PARAMS)
+    p0r, st2, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, p1, None, **LK_PARAMS)
+    fb_error = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+    good = (st1.reshape(-1) == 1) & (st2.reshape(-1) == 1) & (fb_error < max_fb_error)
+    if good.sum() < 4:
+        return box, 0.0
+
+    a = p0.reshape(-1, 2)[good]
+    b = p1.reshape(-1, 2)[good]
+    dx, dy = np.median(b - a, axis=0)
+    # Scale from the spread of the points around their centroid
+    spread0 = np.linalg.norm(a - a.mean(axis=0), axis=1)
+    spread1 = np.linalg.norm(b - b.mean(axis=0), axis=1)
+    valid = spread0 > 1e-3
+    scale = float(np.median(spread1[valid] / spread0[valid])) if valid.any() else 1.0
+
+    x, y, w, h = box
+    cx, cy = x + w / 2 + dx, y + h / 2 + dy
+    w, h = w * scale, h * scale
+    return np.array([cx - w / 2, cy - h / 2, w, h], dtype=np.float32), good.mean()
+
+
+class TrackedDetector:
+    """Wraps a Detector: detect on keyframes, track boxes in between.
+
+    A keyframe happens every keyframe_interval frames, whenever a track's
+    confidence decays below min_confidence (it loses points or simply ages),
+    and - if detect_when_empty - on every frame where nothing is tracked.
+    detect_many() returns the same per-frame (label, box) lists as
+    Detector.detect_many; tracks() exposes the IDs behind them.
+
+    With roi=True, keyframes only look at windows around the current tracks
+    (Detector.detect_rois_raw), which keeps the target at native resolution
+    instead of squeezing all 640x480 into the network input. Every
+    full_scan_interval-th keyframe still scans whole frames to pick up new
+    objects.
+    """
+
+    def __init__(self, detector, keyframe_interval=5, min_confidence=0.3, decay=0.9,
+                 match_iou=0.3, detect_when_empty=True, roi=False, full_scan_interval=4,
+                 roi_expand=2.0):
+        self.detector = detector
+        self.keyframe_interval = keyframe_interval
+        self.min_confidence = min_confidence
+        self.decay = decay
+        self.match_iou = match_iou
+        self.detect_when_empty = detect_when_empty
+        self.roi = roi
+        self.full_scan_interval = full_scan_interval
+        self.roi_expand = roi_expand
+        self._ids = itertools.count(1)
+        self._tracks = []      # per camera: list of Track
+        self._prev_gray = []   # per camera: previous grayscale frame
+        self.frame_count = 0
+        self.keyframes = 0
+
+    def _needs_keyframe(self):
+        if not self._tracks or self.frame_count % self.keyframe_interval == 0:
+            return True
+        tracks = [t for cam in self._tracks for t in cam]
+        if not tracks:
+            return self.detect_when_empty
+        return min(t.confidence for t in tracks) < self.min_confidence
+
+    def _associate(self, old_tracks, class_ids, confidences, boxes):
+        tracks, unused = [], list(old_tracks)
+        for class_id, confidence, box in zip(class_ids, confidences, boxes):
+            label = self.detector.label(class_id)
+            best, best_iou = None, self.match_iou
+            for track in unused:
+                overlap = box_iou(track.box, box)
+                if track.label == label and overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is not None:
+                unused.remove(best)
+                best.box = np.asarray(box, dtype=np.float32)
+                best.confidence = float(confidence)
+                best.age = 0
+                tracks.append(best)
+            else:
+                tracks.append(Track(next(self._ids), label, box, confidence))
+        return tracks
+
+    def update(self, frames):
+        """Advance all cameras by one frame; returns per-camera lists of Track."""
+        grays = [cv2.cvtColor(f, cv2.COLOR_BGRA2GRAY if f.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+                 for f in frames]
+        if len(self._tracks) != len(frames):
+            self._tracks = [[] for _ in frames]
+            self._prev_gray = [None] * len(frames)
+
+        if self._needs_keyframe():
+            if self.roi and self.keyframes % self.full_scan_interval != 0:
+                rois = [[t.int_box() for t in cam] for cam in self._tracks]
+                results = self.detector.detect_rois_raw(frames, rois, self.roi_expand)
+            else:
+                results = self.detector.detect_many_raw(frames)
+            self._tracks = [self._associate(old, *result) for old, result in zip(self._tracks, results)]
+            self.keyframes += 1
+        else:
+            h, w = grays[0].shape[:2]
+            for cam, gray in enumerate(grays):
+                kept = []
+                for track in self._tracks[cam]:
+                    box, quality = propagate_box(self._prev_gray[cam], gray, track.box)
+                    track.box = box
+                    track.confidence *= self.decay * quality
+                    track.age += 1
+                    x, y, bw, bh = box
+                    if quality > 0 and bw > 2 and bh > 2 and x < w and y < h and x + bw > 0 and y + bh > 0:
+                        kept.append(track)
+                self._tracks[cam] = kept
+
+        self._prev_gray = grays
+        self.frame_count += 1
+        return self._tracks
+
+    def tracks(self):
+        return self._tracks
+
+    def ids(self):
+        """Per camera track IDs, in the order detect_many() returned the boxes."""
+        return [[t.id for t in cam] for cam in self._tracks]
+
+    def detect_many(self, frames):
+        return [[(t.label, t.int_box()) for t in cam] for cam in self.update(frames)]
@@ -0,0 +1,380 @@
+"""Shared MobileNet-SSD detector and stereo helpers.
+
+Every script used to load its own cv2.dnn_DetectionModel and carry a copy of
+detect()/match_detections()/compute_depth(); those copies had drifted on
+setInputSwapRB, focal length and thresholds. They all use this module now.
+
+Frames are fed to a raw cv2.dnn.Net so several frames (e.g. a stereo pair)
+can share one blob and one forward pass; the SSD output is decoded the same
+way cv2.dnn_DetectionModel.detect does it.
+"""
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from auv.matching import match_stereo
+
+# === Model Files (relative to the script's working directory) ===
+WEIGHTS = "frozen_inference_graph.pb"
+CONFIG = "Pretrained_vectors_mobile_net.pbtxt"
+LABELS = "data_items.names"
+
+# === DNN Backends ===
+# name -> (backend, target); entries missing from this OpenCV build are skipped
+BACKENDS = {
+    name: (getattr(cv2.dnn, backend), getattr(cv2.dnn, target))
+    for name, backend, target in (
+        ("opencv", "DNN_BACKEND_OPENCV", "DNN_TARGET_CPU"),
+        ("opencv_fp16", "DNN_BACKEND_OPENCV", "DNN_TARGET_CPU_FP16"),
+        ("timvx", "DNN_BACKEND_TIMVX", "DNN_TARGET_NPU"),
+        ("openvino", "DNN_BACKEND_INFERENCE_ENGINE", "DNN_TARGET_CPU"),
+    )
+    if hasattr(cv2.dnn, backend) and hasattr(cv2.dnn, target)
+}
+# Set AUV_DNN_BACKEND=auto (or a name above) to choose without editing scripts
+BACKEND_ENV = "AUV_DNN_BACKEND"
+BACKEND_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "auv", "dnn_backend.json")
+
+# === Defaults shared by the stereo scripts ===
+TARGETS = ("Human", "Plastic Bottle")
+BASELINE_CM = 12.0
+FOCAL_LENGTH_PX = 630.0
+
+
+def load_labels(path=LABELS):
+    with open(path, "r") as f:
+        return f.read().strip().split("\n")
+
+
+def available_backends():
+    """Names from BACKENDS that this OpenCV build can actually run."""
+    names = []
+    for name, (backend, target) in BACKENDS.items():
+        try:
+            if target in cv2.dnn.getAvailableTargets(backend):
+                names.append(name)
+        except cv2.error:
+            pass
+    return names
+
+
+def load_net(weights, config, backend="opencv"):
+    net = cv2.dnn.readNet(weights, config)
+    net.setPreferableBackend(BACKENDS[backend][0])
+    net.setPreferableTarget(BACKENDS[backend][1])
+    return net
+
+
+def probe_backends(weights, config, input_size=(320, 320), warmup=2, runs=5):
+    """Time a few inferences of a synthetic frame on every available backend.
+
+    Returns ({name: median_ms}, {name: net}) for the backends that ran.
+    """
+    blob = cv2.dnn.blobFromImage(np.zeros((input_size[1], input_size[0], 3), np.uint8),
+                                 1.0 / 127.5, input_size, (127.5, 127.5, 127.5), swapRB=True)
+    timings, nets = {}, {}
+    for name in available_backends():
+        try:
+            net = load_net(weights, config, name)
+            samples = []
+            for i in range(warmup + runs):
+                start = time.perf_counter()
+                net.setInput(blob)
+                net.forward()
+                if i >= warmup:
+                    samples.append(time.perf_counter() - start)
+        except cv2.error as e:
+            print(f"[auv.vision] Backend {name} failed: {e}")
+            continue
+        timings[name] = round(float(np.median(samples)) * 1000, 2)
+        nets[name] = net
+    return timings, nets
+
+
+class OnnxSSD:
+    """onnxruntime runner for an exported/quantized SSD (see Object-detection/quantize_model.py).
+
+    The ONNX graph is the TF Object Detection API graph converted by tf2onnx:
+    uint8 NHWC RGB in, detection_boxes/classes/scores/num_detections out, with
+    resizing and NMS inside the graph. run() returns the same
+    [image_id, class_id, confidence, x1, y1, x2, y2] rows as the cv2 path.
+    """
+
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("onnxruntime is required to run .onnx detector models") from e
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+    def _output(self, outputs, name):
+        for key, value in outputs.items():
+            if key.split(":")[0] == name:
+                return value
+        raise KeyError(f"ONNX model has no {name} output (outputs: {list(outputs)})")
+
+    def run(self, images):
+        outputs = dict(zip(self.output_names, self.session.run(None, {self.input_name: images})))
+        boxes = self._output(outputs, "detection_boxes")      # [N, K, 4] ymin, xmin, ymax, xmax
+        classes = self._output(outputs, "detection_classes")  # [N, K]
+        scores = self._output(outputs, "detection_scores")    # [N, K]
+        counts = self._output(outputs, "num_detections").astype(np.int32)
+
+        rows = []
+        for i, count in enumerate(counts.reshape(-1)):
+            b = boxes[i, :count]
+            rows.append(np.column_stack([np.full(count, i), classes[i, :count], scores[i, :count],
+                                         b[:, 1], b[:, 0], b[:, 3], b[:, 2]]))
+        return np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, 7), np.float32)
+
+
+def _backend_cache_key(weights, input_size):
+    return f"{os.path.abspath(weights)}|{input_size[0]}x{input_size[1]}|opencv-{cv2.__version__}"
+
+
+def auto_select_backend(weights, config, input_size=(320, 320), cache_path=BACKEND_CACHE):
+    """Pick the fastest backend, reusing the cached choice from earlier boots.
+
+    Returns (name, net); net is None when the choice came from the cache.
+    """
+    key = _backend_cache_key(weights, input_size)
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    cached = cache.get(key, {}).get("backend")
+    if cached in available_backends():
+        print(f"[auv.vision] DNN backend: {cached} (cached in {cache_path})")
+        return cached, None
+
+    timings, nets = probe_backends(weights, config, input_size)
+    if not timings:
+        raise RuntimeError("No DNN backend could run the model")
+    best = min(timings, key=timings.get)
+    print(f"[auv.vision] DNN backend: {best} (probed ms/frame: {timings})")
+
+    cache[key] = {"backend": best, "ms": timings}
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"[auv.vision] Could not cache backend choice: {e}")
+    return best, nets[best]
+
+
+class Detector:
+    """MobileNet-SSD detector loaded once and shared by all callers.
+
+    input_format is the channel order of the frames handed to detect():
+    "BGR" for OpenCV images and Picamera2 "RGB888" captures, "RGB" for
+    Picamera2's default XBGR8888 captures. Four-channel frames have their
+    X/alpha channel dropped. The network itself expects RGB.
+
+    backend is a BACKENDS name or "auto" (probe once, then cached on disk);
+    it defaults to $AUV_DNN_BACKEND, else "opencv". A weights path ending in
+    .onnx (e.g. the INT8 export) runs on onnxruntime instead and ignores it.
+
+    targets limits every detect*() call to those labels (case-insensitive);
+    pass None to keep every class. The set is turned into a boolean mask over
+    class IDs once, so filtering is a single NumPy lookup on the hot path and
+    label strings are only built for the few detections that survive it.
+    """
+
+    def __init__(self, weights=WEIGHTS, config=CONFIG, labels=LABELS, targets=TARGETS,
+                 input_size=(320, 320), conf_threshold=0.45, nms_threshold=0.4,
+                 input_format="BGR", backend=None):
+        if input_format not in ("BGR", "RGB"):
+            raise ValueError(f"input_format must be 'BGR' or 'RGB', got {input_format!r}")
+        backend = backend or os.environ.get(BACKEND_ENV, "opencv")
+        if backend != "auto" and backend not in BACKENDS:
+            raise ValueError(f"backend must be 'auto' or one of {sorted(BACKENDS)}, got {backend!r}")
+        self.obj_names = load_labels(labels)
+        self.targets = None if targets is None else {t.lower() for t in targets}
+        self.target_mask = np.array([False] + [self.targets is None or name.lower() in self.targets
+                                               for name in self.obj_names])
+        self.input_size = tuple(input_size)
+        self.conf_threshold = conf_threshold
+        self.nms_threshold = nms_threshold
+        self.swap_rb = input_format == "BGR"
+
+        net = None
+        if weights.endswith(".onnx"):
+            backend, net = "onnxruntime", OnnxSSD(weights)
+        elif backend == "auto":
+            backend, net = auto_select_backend(weights, config, self.input_size)
+        self.backend = backend
+        self.net = net if net is not None else load_net(weights, config, backend)
+        self._lock = threading.Lock()
+
+    def label(self, class_id):
+        return self.obj_names[class_id - 1]
+
+    def forward(self, frames):
+        """Run all frames through the network in one batch; returns SSD rows.
+
+        Each row is [image_id, class_id, confidence, x1, y1, x2, y2] with
+        normalized coordinates. Safe to call from several threads.
+        """
+        frames = [cv2.cvtColor(f, cv2.COLOR_BGRA2BGR) if f.shape[2] == 4 else f for f in frames]
+        if isinstance(self.net, OnnxSSD):
+            images = np.stack([cv2.resize(f, self.input_size) for f in frames])
+            if self.swap_rb:
+                images = images[..., ::-1]
+            with self._lock:
+                return self.net.run(np.ascontiguousarray(images))
+
+        blob = cv2.dnn.blobFromImages(frames, 1.0 / 127.5, self.input_size,
+                                      (127.5, 127.5, 127.5), swapRB=self.swap_rb)
+        with self._lock:
+            self.net.setInput(blob)
+            return self.net.forward().reshape(-1, 7)
+
+    def is_target(self, class_ids):
+        """Boolean array: which class IDs belong to the target set."""
+        class_ids = np.asarray(class_ids, dtype=np.int32)
+        in_range = (class_ids >= 0) & (class_ids < len(self.target_mask))
+        return in_range & self.target_mask[np.where(in_range, class_ids, 0)]
+
+    def decode(self, rows, frame_shape, conf_threshold=None, nms_threshold=None):
+        """Turn one image's SSD rows into compact (class_ids, confidences, boxes).
+
+        Rows below the confidence threshold or outside the target set are
+        dropped in one mask before any box math. Boxes are [x, y, w, h] in
+        pixels of a frame with frame_shape, clipped to the frame; per-class NMS
+        is applied like dnn_DetectionModel.detect.
+        """
+        conf_threshold = self.conf_threshold if conf_threshold is None else conf_threshold
+        nms_threshold = self.nms_threshold if nms_threshold is None else nms_threshold
+
+        rows = rows[(rows[:, 2] > conf_threshold) & self.is_target(rows[:, 1])]
+        h, w = frame_shape[:2]
+        left = (rows[:, 3] * w).astype(np.int32)
+        top = (rows[:, 4] * h).astype(np.int32)
+        width = (rows[:, 5] * w).astype(np.int32) - left + 1
+        height = (rows[:, 6] * h).astype(np.int32) - top + 1
+        left = np.clip(left, 0, w - 1)
+        top = np.clip(top, 0, h - 1)
+        width = np.clip(width, 1, w - left)
+        height = np.clip(height, 1, h - top)
+        boxes = np.stack([left, top, width, height], axis=1)
+        class_ids = rows[:, 1].astype(np.int32)
+        confidences = rows[:, 2]
+
+        return self._nms(class_ids, confidences, boxes, conf_threshold, nms_threshold)
+
+    def _nms(self, class_ids, confidences, boxes, conf_threshold, nms_threshold):
+        if len(class_ids) and nms_threshold:
+            keep = cv2.dnn.NMSBoxesBatched(boxes.tolist(), confidences.tolist(), class_ids.tolist(),
+                                           conf_threshold, nms_threshold)
+            keep = np.array(keep, dtype=np.int32).reshape(-1)
+            class_ids, confidences, boxes = class_ids[keep], confidences[keep], boxes[keep]
+        return class_ids, confidences, boxes
+
+    def detect_raw(self, frame, conf_threshold=None, nms_threshold=None):
+        """Target detections for one frame as (class_ids, confidences, boxes) arrays."""
+        rows = self.forward([frame])
+        return self.decode(rows, frame.shape, conf_threshold, nms_threshold)
+
+    def _to_detections(self, class_ids, boxes):
+        return [(self.label(class_id), box) for class_id, box in zip(class_ids, boxes)]
+
+    def detect(self, frame):
+        """Target detections for one frame as a list of (label, box)."""
+        class_ids, _, boxes = self.detect_raw(frame)
+        return self._to_detections(class_ids, boxes)
+
+    def detect_many_raw(self, frames):
+        """detect_raw() for several frames with a single forward pass."""
+        rows = self.forward(frames)
+        return [self.decode(rows[rows[:, 0] == i], frame.shape) for i, frame in enumerate(frames)]
+
+    def detect_many(self, frames):
+        """detect() for several frames with a single forward pass."""
+        return [self._to_detections(class_ids, boxes)
+                for class_ids, _, boxes in self.detect_many_raw(frames)]
+
+    def roi_window(self, box, frame_shape, expand=2.0):
+        """Square crop (x0, y0, x1, y1) around box, expand times its larger side.
+
+        The window is never smaller than the network input, so the crop is fed
+        at native resolution or upsampled, and it is shifted (not cut) to stay
+        inside the frame.
+        """
+        h, w = frame_shape[:2]
+        side = int(max(box[2], box[3]) * expand)
+        side = min(max(side, self.input_size[0]), w, h)
+        cx, cy = box[0] + box[2] // 2, box[1] + box[3] // 2
+        x0 = int(np.clip(cx - side // 2, 0, w - side))
+        y0 = int(np.clip(cy - side // 2, 0, h - side))
+        return x0, y0, x0 + side, y0 + side
+
+    def detect_rois_raw(self, frames, rois, expand=2.0):
+        """detect_many_raw() restricted to windows around previous boxes.
+
+        rois holds, per frame, the boxes to look around; a frame with no boxes
+        is scanned whole. All crops go through one forward pass, their boxes
+        are mapped back to full-frame pixels and overlapping windows are
+        merged with per-class NMS.
+        """
+        crops, owners = [], []
+        for i, (frame, boxes) in enumerate(zip(frames, rois)):
+            windows = [self.roi_window(box, frame.shape, expand) for box in boxes]
+            for x0, y0, x1, y1 in windows or [(0, 0, frame.shape[1], frame.shape[0])]:
+                crops.append(frame[y0:y1, x0:x1])
+                owners.append((i, x0, y0))
+
+        rows = self.forward(crops)
+        parts = [[] for _ in frames]
+        for j, (crop, (i, x0, y0)) in enumerate(zip(crops, owners)):
+            class_ids, confidences, boxes = self.decode(rows[rows[:, 0] == j], crop.shape, nms_threshold=0)
+            parts[i].append((class_ids, confidences, boxes + np.array([x0, y0, 0, 0], dtype=np.int32)))
+
+        results = []
+        for part in parts:
+            class_ids, confidences, boxes = (np.concatenate(a) for a in zip(*part))
+            results.append(self._nms(class_ids, confidences, boxes, self.conf_threshold, self.nms_threshold))
+        return results
+
+
+# === Stereo Helpers ===
+def box_center(box):
+    return (box[0] + box[2] // 2, box[1] + box[3] // 2)
+
+
+def rescale_detections(detections, from_size, to_size):
+    """Map (label, box) detections from a from_size (w, h) frame onto a to_size one.
+
+    Used when inference runs on the camera's lores stream while depth, zones
+    and drawing stay in main-stream pixels.
+    """
+    sx, sy = to_size[0] / from_size[0], to_size[1] / from_size[1]
+    scale = np.array([sx, sy, sx, sy])
+    return [(label, (np.asarray(box) * scale).round().astype(np.int32)) for label, box in detections]
+
+
+def compute_depth(center_left, center_right, focal_length_px=FOCAL_LENGTH_PX, baseline_cm=BASELINE_CM):
+    """Depth in cm from box centres, or None unless the left x exceeds the right x."""
+    disparity = center_left[0] - center_right[0]
+    if disparity < 1:
+        return None
+    return round((focal_length_px * baseline_cm) / disparity, 2)
+
+
+def match_detections(dets0, dets1, frames=None, frame_size=None, track_ids=None, **gates):
+    """Pair left/right (label, box) lists as (label, box0, box1, center0, center1).
+
+    Optimal assignment over row offset, size and (with frames) colour, see
+    auv.matching.match_stereo; pairs outside the gates are left unmatched.
+    With track_ids (parallel to dets0) each pair also carries the left track ID.
+    """
+    return match_stereo(dets0, dets1, frames, frame_size, track_ids, **gates)
+
@@ -1,21 +1,20 @@
 from flask import Flask, Response
 from picamera2 import Picamera2
 import cv2
+import os
+import sys
+import threading
 
-# Load class names
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
-
-# Load DNN model
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
+from auv.vision import Detector
 
 # Only detect these objects
 target_classes = ["Human", "Plastic Bottle"]
 
+# Load DNN model (RGB888 captures are BGR in memory)
+detector = Detector(input_format="BGR", targets=target_classes)
+
 # Flask setup
 app = Flask(__name__)
 
@@ -26,38 +25,32 @@ camera.configure(config)
 camera.start()
 
 # Object detection and annotation
-def detect_objects(frame, threshold=0.45, nms_thresh=0.1, draw=True, targets=[]):
-    result = model.detect(frame, confThreshold=threshold, nmsThreshold=nms_thresh)
-
-    # Handle OpenCV versions that return 2 or 3 items
-    if len(result) == 3:
-        class_ids, confidences, boxes = result
-    else:
-        class_ids, boxes = result
-        confidences = [1.0] * len(class_ids)
+def detect_objects(frame, threshold=0.45, nms_thresh=0.1, draw=True):
+    class_ids, confidences, boxes = detector.detect_raw(frame, threshold, nms_thresh)
 
     detected_objects = []
-    if len(class_ids) != 0:
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            obj_name = obj_names[class_id - 1]
-            if obj_name.lower() in [t.lower() for t in targets]:
-                detected_objects.append([box, obj_name])
-                if draw:
-                    color = (0, 0, 255) if obj_name.lower() == "plastic bottle" else (255, 255, 0)
-                    cv2.rectangle(frame, box, color, 1)
-                    cv2.putText(frame, obj_name.upper(), (box[0]+10, box[1]+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 1)
-                    cv2.putText(frame, f'{round(confidence*100,1)}%', (box[0]+10, box[1]+50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    for class_id, confidence, box in zip(class_ids, confidences, boxes):
+        obj_name = detector.label(class_id)
+        detected_objects.append([box, obj_name])
+        if draw:
+            color = (0, 0, 255) if obj_name.lower() == "plastic bottle" else (255, 255, 0)
+            cv2.rectangle(frame, box, color, 1)
+            cv2.putText(frame, obj_name.upper(), (box[0]+10, box[1]+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 1)
+            cv2.putText(frame, f'{round(confidence*100,1)}%', (box[0]+10, box[1]+50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
     return frame, detected_objects
 
-# Generate camera stream with logic feedback
-def gen_frames():
+# One producer per camera; every /video client shares its JPEGs
+broadcaster = FrameBroadcaster()
+
+# Capture, detect and encode once per frame with logic feedback
+def update_frames():
     frame_center = 320 // 2
     deadzone = 40
     stop_threshold = 25000
 
     while True:
         frame = camera.capture_array("main")
-        frame, detected = detect_objects(frame, targets=target_classes)
+        frame, detected = detect_objects(frame)
 
         message = "Rotating... Searching for object..."
 
@@ -83,9 +76,8 @@ def gen_frames():
 
         # Encode frame for MJPEG stream
         ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        if ret:
+            broadcaster.publish(buffer.tobytes())
 
         # Also print to terminal for debugging
         print(message)
@@ -107,8 +99,9 @@ def index():
 
 @app.route('/video')
 def video():
-    return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # Main entry
 if __name__ == '__main__':
+    threading.Thread(target=update_frames, daemon=True).start()
     app.run(host='0.0.0.0', port=5000)
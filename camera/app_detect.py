@@ -2,6 +2,12 @@ from flask import Flask, Response
 from picamera2 import Picamera2
 import cv2
 import numpy as np
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
 
 # Load COCO labels
 with open('coco-labels.txt') as f:
@@ -28,7 +34,10 @@ camera.start()
 target_classes = {"person", "bottle", "car"}
 confidence_thresh = 0.7
 
-def gen_frames():
+# One producer per camera; every /video client shares its JPEGs
+broadcaster = FrameBroadcaster()
+
+def update_frames():
     while True:
         frame = camera.capture_array("main")
         (h, w) = frame.shape[:2]
@@ -58,10 +67,9 @@ def gen_frames():
 
         # Encode JPEG
         ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        frame = buffer.tobytes()
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        if not ret:
+            continue
+        broadcaster.publish(buffer.tobytes())
 
 @app.route('/')
 def index():
@@ -77,8 +85,9 @@ def index():
 
 @app.route('/video')
 def video():
-    return Response(gen_frames(),
+    return Response(broadcaster.stream(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
+    threading.Thread(target=update_frames, daemon=True).start()
     app.run(host='0.0.0.0', port=5000, debug=False)
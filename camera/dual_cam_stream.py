@@ -1,6 +1,12 @@
 from flask import Flask, Response
 from picamera2 import Picamera2
 import cv2
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
 
 app = Flask(__name__)
 
@@ -15,18 +21,21 @@ picam2.start()
 # ✅ Set up USB cam (adjust index if needed)
 usb_cam = cv2.VideoCapture(0)  # usually 0 or 1 depending on device
 
-def gen_csi_frames():
-    """Generate MJPEG frames from CSI cam."""
+# One producer per camera; every client shares its JPEGs
+csi_broadcaster = FrameBroadcaster()
+usb_broadcaster = FrameBroadcaster()
+
+def update_csi_frames():
+    """Capture and encode CSI cam frames once for all viewers."""
     while True:
         frame = picam2.capture_array()
         ret, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
         if not ret:
             continue
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n")
+        csi_broadcaster.publish(buffer.tobytes())
 
-def gen_usb_frames():
-    """Generate MJPEG frames from USB cam."""
+def update_usb_frames():
+    """Capture and encode USB cam frames once for all viewers."""
     while True:
         success, frame = usb_cam.read()
         if not success:
@@ -34,8 +43,7 @@ def gen_usb_frames():
         ret, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
         if not ret:
             continue
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n")
+        usb_broadcaster.publish(buffer.tobytes())
 
 @app.route('/')
 def index():
@@ -54,13 +62,15 @@ def index():
 
 @app.route('/csi')
 def csi_feed():
-    return Response(gen_csi_frames(),
+    return Response(csi_broadcaster.stream(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/usb')
 def usb_feed():
-    return Response(gen_usb_frames(),
+    return Response(usb_broadcaster.stream(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
+    threading.Thread(target=update_csi_frames, daemon=True).start()
+    threading.Thread(target=update_usb_frames, daemon=True).start()
     app.run(host='0.0.0.0', port=5000, threaded=True)
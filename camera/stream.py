@@ -1,6 +1,12 @@
 from flask import Flask, Response
 from picamera2 import Picamera2
 import cv2
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
 
 app = Flask(__name__)
 
@@ -10,14 +16,17 @@ config = camera.create_video_configuration(main={"format": "RGB888", "size": (12
 camera.configure(config)
 camera.start()
 
-def gen_frames():
+# One producer per camera; every /video client shares its JPEGs
+broadcaster = FrameBroadcaster()
+
+def update_frames():
     while True:
         frame = camera.capture_array("main")  # Already in RGB
         # DO NOT convert to BGR — avoid color swap
         ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        if not ret:
+            continue
+        broadcaster.publish(buffer.tobytes())
 
 @app.route('/')
 def index():
@@ -35,8 +44,9 @@ def index():
 
 @app.route('/video')
 def video():
-    return Response(gen_frames(),
+    return Response(broadcaster.stream(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
+    threading.Thread(target=update_frames, daemon=True).start()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.hal import Hardware
+from auv.magnetometer import MAG_CALIBRATION, MagCalibration, coverage
+
+# Hard/soft-iron calibration for the AK8963 inside the MPU-9250.
+#
+# Mount everything as it will run (motors, battery, hull) and slowly turn the
+# vehicle through every orientation, figure-of-eight style, until coverage
+# reaches ~80%:
+#   python calibrate_magneto.py --seconds 60
+# The fit is saved with the sensor's ASA values and picked up by
+# auv.magnetometer.load_mag_calibration() in with_magneto.py and
+# dead_reckoning.py.
+
+MAG_RATE_HZ = 100  # AK8963 continuous mode 2
+
+
+def collect(imu, seconds, min_coverage):
+    samples = np.empty((int(seconds * MAG_RATE_HZ * 1.2), 3))
+    count, last_print = 0, 0.0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and count < len(samples):
+        raw = imu.read_mag_raw()
+        if raw is None:
+            time.sleep(0.002)
+            continue
+        samples[count] = raw
+        count += 1
+        if time.monotonic() - last_print > 1.0 and count > 50:
+            covered = coverage(samples[:count])
+            print(f"{count} samples, coverage {covered:.0%}")
+            last_print = time.monotonic()
+            if covered >= min_coverage and count > 20 * MAG_RATE_HZ:
+                break
+    return imu.mag_to_ut(samples[:count])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the AK8963 for hard and soft iron")
+    parser.add_argument("--seconds", type=float, default=60.0, help="maximum collection time")
+    parser.add_argument("--coverage", type=float, default=0.8, help="stop early at this direction coverage")
+    parser.add_argument("--output", default=MAG_CALIBRATION)
+    args = parser.parse_args()
+
+    imu = Hardware().imu().initialize()
+    print(f"ASA: {imu.mag_asa.tolist()}. Rotate the vehicle through all orientations...")
+    samples = collect(imu, args.seconds, args.coverage)
+    if len(samples) < 200:
+        raise SystemExit(f"Only {len(samples)} magnetometer samples; is the AK8963 responding?")
+
+    calibration = MagCalibration.fit(samples, asa=imu.mag_asa)
+    raw_spread = np.std(np.linalg.norm(samples - samples.mean(axis=0), axis=1)) / calibration.field
+    print(f"Bias (hard iron): {np.round(calibration.bias, 2).tolist()} uT")
+    print(f"Soft iron:\n{np.round(calibration.soft_iron, 4)}")
+    print(f"Field {calibration.field:.1f} uT; radius spread {raw_spread:.1%} raw -> {calibration.residual:.1%} corrected")
+    calibration.save(args.output)
+    print(f"Wrote {args.output}")
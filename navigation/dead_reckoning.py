@@ -1,93 +1,76 @@
-import smbus2
+import os
+import sys
 import time
-import math
-import numpy as np
 
-# Constants
-MPU_ADDR = 0x68  # MPU-9250 I2C address
-DEG_TO_RAD = math.pi / 180
-TIME_STEP = 0.1  # Time step in seconds
-ALPHA = 0.9  # Complementary filter coefficient
-
-# Initialize variables
-x, y = 0.0, 0.0  # Position
-velocity_x, velocity_y = 0.0, 0.0  # Velocity
-heading = 0.0  # Current heading
-accel_filtered_x, accel_filtered_y = 0.0, 0.0  # Filtered acceleration
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.estimator import NavigationEstimator
+from auv.hal import Hardware
+from auv.imu import IMUStream, MPU9250
+from auv.magnetometer import load_mag_calibration
+from auv.replay import ReplayBus, replay_from_env
+from auv.telemetry import TelemetryLogger
 
-# Open file for logging data
-file = open("dead_reckoning_log.txt", "w")
-file.write("Time,X,Y,Heading\n")  # Write CSV header
-
-# Initialize I2C bus
-bus = smbus2.SMBus(1)
+# Constants
+SAMPLE_RATE_HZ = 500  # MPU-9250 FIFO rate (sample-rate divider)
+PUBLISH_HZ = 50  # Pose published to the control loop at this rate
+TIME_STEP = 0.1  # Print every 0.1 s
+
+# Every IMU sample and pose goes to binary telemetry under telemetry/run-*
+# (auv.telemetry.load_run() reads it back)
+telemetry = TelemetryLogger()
+
+# MPU-9250 sampled into its FIFO and drained on a thread; AK8963 for heading.
+# AUV_REPLAY=<recording> feeds the driver the bus reads raspi5/record.py saved,
+# timed on the recording's clock with no wall-clock sleeps (AUV_REPLAY_REALTIME=1
+# paces the bus reads instead); AUV_IMU=sim uses the simulated MPU-9250 of auv.hal.
+replay = replay_from_env()
+if replay:
+    bus = ReplayBus(*replay)
+    imu = MPU9250(bus)
+    stream = IMUStream(imu, rate_hz=SAMPLE_RATE_HZ, clock=bus.clock, paced=False)
+else:
+    bus = None
+    imu = Hardware().imu()
+    stream = IMUStream(imu, rate_hz=SAMPLE_RATE_HZ)
+# Error-state EKF at the IMU rate: gravity/bias removal, magnetometer heading
+estimator = NavigationEstimator(stream, read_mag=imu.read_mag, publish_hz=PUBLISH_HZ, telemetry=telemetry)
 
 # Initialize MPU-9250
 def initialize_mpu9250():
-    bus.write_byte_data(MPU_ADDR, 0x6B, 0)  # Wake up MPU-9250
-    time.sleep(0.1)
-    print("MPU-9250 Initialized.")
-
-# Read 16-bit word from sensor
-def read_word_2c(addr, reg):
-    high = bus.read_byte_data(addr, reg)
-    low = bus.read_byte_data(addr, reg + 1)
-    value = (high << 8) + low
-    if value >= 0x8000:
-        value = -((65535 - value) + 1)
-    return value
-
-# Get acceleration (m/s²) with filtering
-def get_acceleration():
-    global accel_filtered_x, accel_filtered_y
-    raw_ax = read_word_2c(MPU_ADDR, 0x3B) / 16384.0  # X-axis
-    raw_ay = read_word_2c(MPU_ADDR, 0x3D) / 16384.0  # Y-axis
-
-    # Apply Low-Pass Filter
-    accel_filtered_x = ALPHA * accel_filtered_x + (1 - ALPHA) * raw_ax
-    accel_filtered_y = ALPHA * accel_filtered_y + (1 - ALPHA) * raw_ay
-
-    return accel_filtered_x, accel_filtered_y
-
-# Get angular velocity (Yaw rate)
-def get_angular_velocity():
-    gyro_z = read_word_2c(MPU_ADDR, 0x47) / 131.0  # Gyro Z-axis (Yaw rate)
-    return gyro_z
+    imu.initialize()
+    # Hard/soft-iron correction from calibrate_magneto.py; heading is useless near the motors without it
+    imu.mag_calibration = load_mag_calibration(asa=imu.mag_asa)
+    telemetry.start()
+    stream.start()
+    estimator.start()  # Keep still for the first second: it levels and finds the gyro bias
+    print(f"MPU-9250 Initialized, FIFO at {stream.odr:.0f} Hz.")
 
 # Dead reckoning loop
 def dead_reckoning():
-    global x, y, velocity_x, velocity_y, heading
-
     try:
-        while True:
+        while not stream.ended:
             start_time = time.time()
 
-            # Read sensor data
-            ax, ay = get_acceleration()
-            angular_velocity = get_angular_velocity()
-            heading += angular_velocity * TIME_STEP
-            heading_rad = heading * DEG_TO_RAD
-
-            # Update velocity (Integrate acceleration)
-            velocity_x += ax * TIME_STEP
-            velocity_y += ay * TIME_STEP
-
-            # Update position (Integrate velocity)
-            x += velocity_x * math.cos(heading_rad) * TIME_STEP
-            y += velocity_y * math.sin(heading_rad) * TIME_STEP
-
-            # Write data to file
-            file.write(f"{time.time()},{x:.2f},{y:.2f},{heading:.2f}\n")
+            pose = estimator.latest()
+            if pose is not None:
+                x, y = pose.position[0], pose.position[1]
 
-            # Print results
-            print(f"X: {x:.2f}, Y: {y:.2f}, Heading: {heading:.2f}°")
+                # Print results
+                print(f"X: {x:.2f}, Y: {y:.2f}, Heading: {pose.yaw:.2f}° "
+                      f"(gyro bias z: {pose.gyro_bias[2]:.3f}°/s, FIFO overflows: {stream.overflows})")
 
             # Wait for next time step
             time.sleep(max(0, TIME_STEP - (time.time() - start_time)))
 
     except KeyboardInterrupt:
+        pass
+    finally:
         print("Stopping dead reckoning...")
-        file.close()  # Ensure file is properly closed
+        print(estimator.report())
+        estimator.stop()
+        stream.stop()
+        telemetry.stop()  # Flush buffered records
+        print(telemetry.report())
 
 # Initialize sensors
 initialize_mpu9250()
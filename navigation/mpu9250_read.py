@@ -1,37 +1,20 @@
-import smbus2
+import os
+import sys
 import time
 
-# MPU9250 Registers
-MPU9250_ADDR = 0x68
-PWR_MGMT_1 = 0x6B
-ACCEL_XOUT_H = 0x3B
-GYRO_XOUT_H = 0x43
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.hal import Hardware
 
-bus = smbus2.SMBus(1)
-
-def read_word(reg):
-    high = bus.read_byte_data(MPU9250_ADDR, reg)
-    low = bus.read_byte_data(MPU9250_ADDR, reg+1)
-    val = (high << 8) + low
-    if val > 32767:
-        val -= 65536
-    return val
+imu = Hardware().imu(magnetometer=False)  # AUV_IMU=sim: simulated MPU-9250
 
 def init_mpu():
-    bus.write_byte_data(MPU9250_ADDR, PWR_MGMT_1, 0x00)
-    time.sleep(0.1)
+    imu.initialize()
 
 def read_sensor_data():
-    accel = {
-        'x': read_word(ACCEL_XOUT_H),
-        'y': read_word(ACCEL_XOUT_H + 2),
-        'z': read_word(ACCEL_XOUT_H + 4)
-    }
-    gyro = {
-        'x': read_word(GYRO_XOUT_H),
-        'y': read_word(GYRO_XOUT_H + 2),
-        'z': read_word(GYRO_XOUT_H + 4)
-    }
+    # All six axes (and temperature) in one 14-byte burst
+    ax, ay, az, _, gx, gy, gz = imu.read_raw()
+    accel = {'x': ax, 'y': ay, 'z': az}
+    gyro = {'x': gx, 'y': gy, 'z': gz}
     return accel, gyro
 
 def interpret_movement(accel, gyro):
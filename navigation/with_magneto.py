@@ -1,53 +1,27 @@
-import smbus2
+import math
+import os
+import sys
 import time
 
-bus = smbus2.SMBus(1)
-MPU_ADDR = 0x68  # MPU9250 default I2C address
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.hal import Hardware
+from auv.magnetometer import load_mag_calibration
 
-# MPU9250 register addresses
-PWR_MGMT_1 = 0x6B
-ACCEL_XOUT_H = 0x3B
-GYRO_XOUT_H = 0x43
-MAG_ADDR = 0x0C
-MAG_XOUT_L = 0x03
-
-# Wake up MPU9250
-bus.write_byte_data(MPU_ADDR, PWR_MGMT_1, 0)
-
-def read_raw_data(addr):
-    high = bus.read_byte_data(MPU_ADDR, addr)
-    low = bus.read_byte_data(MPU_ADDR, addr+1)
-    value = (high << 8) | low
-    if value > 32768:
-        value -= 65536
-    return value
-
-# Enable magnetometer passthrough
-bus.write_byte_data(MPU_ADDR, 0x37, 0x02)  # INT_PIN_CFG - Bypass enable
-bus.write_byte_data(MAG_ADDR, 0x0A, 0x16)  # 100Hz continuous measurement mode
+# Wake up MPU9250, enable magnetometer passthrough, read ASA, AK8963 at 100Hz continuous
+imu = Hardware().imu().initialize()  # AUV_IMU=sim: simulated MPU-9250
+# Hard/soft-iron correction from calibrate_magneto.py (raw ASA-adjusted uT without it)
+imu.mag_calibration = load_mag_calibration(asa=imu.mag_asa)
 
 while True:
-    # ACCELEROMETER
-    acc_x = read_raw_data(ACCEL_XOUT_H) / 16384.0
-    acc_y = read_raw_data(ACCEL_XOUT_H + 2) / 16384.0
-    acc_z = read_raw_data(ACCEL_XOUT_H + 4) / 16384.0
-
-    # GYROSCOPE
-    gyro_x = read_raw_data(GYRO_XOUT_H) / 131.0
-    gyro_y = read_raw_data(GYRO_XOUT_H + 2) / 131.0
-    gyro_z = read_raw_data(GYRO_XOUT_H + 4) / 131.0
+    # ACCELEROMETER + GYROSCOPE (one 14-byte burst)
+    (acc_x, acc_y, acc_z), (gyro_x, gyro_y, gyro_z), _ = imu.read()
 
-    # MAGNETOMETER (AK8963)
+    # MAGNETOMETER (AK8963, one 7-byte burst up to ST2)
     try:
-        # Check data ready bit
-        if bus.read_byte_data(MAG_ADDR, 0x02) & 0x01:
-            mag_x = (bus.read_byte_data(MAG_ADDR, MAG_XOUT_L + 1) << 8 | bus.read_byte_data(MAG_ADDR, MAG_XOUT_L)) / 0.6
-            mag_y = (bus.read_byte_data(MAG_ADDR, MAG_XOUT_L + 3) << 8 | bus.read_byte_data(MAG_ADDR, MAG_XOUT_L + 2)) / 0.6
-            mag_z = (bus.read_byte_data(MAG_ADDR, MAG_XOUT_L + 5) << 8 | bus.read_byte_data(MAG_ADDR, MAG_XOUT_L + 4)) / 0.6
-        else:
-            mag_x = mag_y = mag_z = 0.0
-    except:
-        mag_x = mag_y = mag_z = 0.0
+        mag = imu.read_mag()
+    except OSError:
+        mag = None
+    mag_x, mag_y, mag_z = mag if mag else (0.0, 0.0, 0.0)
 
     # Display in layman format
     print("\n📈 Accelerometer (tilt/movement):")
@@ -58,5 +32,7 @@ while True:
 
     print("🧲 Magnetometer (direction):")
     print(f"X: {mag_x:.2f} µT, Y: {mag_y:.2f} µT, Z: {mag_z:.2f} µT")
+    # AK8963 x/y are the body's y/x; heading assumes the vehicle is level
+    print(f"Heading: {math.degrees(-math.atan2(mag_x, mag_y)):.1f}° from magnetic north")
 
     time.sleep(1)
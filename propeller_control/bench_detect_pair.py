@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.vision import CONFIG, WEIGHTS, Detector
+
+detector = Detector()
+
+# The original path: one cv2.dnn_DetectionModel.detect call per camera, set up
+# the way every script used to load it
+model = cv2.dnn_DetectionModel(WEIGHTS, CONFIG)
+model.setInputSize(*detector.input_size)
+model.setInputScale(1.0 / 127.5)
+model.setInputMean((127.5, 127.5, 127.5))
+model.setInputSwapRB(True)
+
+# Usage: python bench_detect_pair.py [left.jpg right.jpg]
+# Without images, two random 640x480 frames are used (timing only, no detections).
+ITERATIONS = 50
+WARMUP = 5
+
+if len(sys.argv) == 3:
+    frame0 = cv2.imread(sys.argv[1])
+    frame1 = cv2.imread(sys.argv[2])
+else:
+    rng = np.random.default_rng(0)
+    frame0 = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    frame1 = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+def model_detect(frame):
+    class_ids, _, boxes = model.detect(frame, confThreshold=detector.conf_threshold,
+                                       nmsThreshold=detector.nms_threshold)
+    class_ids, boxes = np.reshape(class_ids, -1), np.reshape(boxes, (-1, 4))
+    keep = detector.is_target(class_ids)
+    return detector._to_detections(class_ids[keep], boxes[keep])
+
+def model_two_calls():
+    return model_detect(frame0), model_detect(frame1)
+
+def two_calls():
+    return detector.detect(frame0), detector.detect(frame1)
+
+def one_call():
+    return detector.detect_many([frame0, frame1])
+
+def pairs_per_second(fn):
+    for _ in range(WARMUP):
+        fn()
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    return ITERATIONS / (time.perf_counter() - start)
+
+# All paths should agree on what they found
+print(f"DetectionModel x2: {model_two_calls()}")
+print(f"detect x2:         {two_calls()}")
+print(f"detect_many:       {one_call()}")
+
+baseline = pairs_per_second(model_two_calls)
+sequential = pairs_per_second(two_calls)
+batched = pairs_per_second(one_call)
+print(f"DetectionModel two-call path (original): {baseline:.2f} pairs/s")
+print(f"Detector two-call path:                  {sequential:.2f} pairs/s ({sequential / baseline:.2f}x)")
+print(f"Batched path:                            {batched:.2f} pairs/s ({batched / baseline:.2f}x, "
+      f"{batched / sequential:.2f}x over two Detector calls)")
@@ -1,20 +1,71 @@
+import os
+import sys
 import time
-import cv2
-from picamera2 import Picamera2
 
-from detection import detect, match_detections, compute_depth, smoothed_depth
-import motor_control as motor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.calibration import load_calibration
+from auv.capture import StereoCapture, configure_camera
+from auv.depth import KalmanDepthFilter
+from auv.hal import Hardware
+from auv.replay import ReplayExhausted, ReplayStereoCapture, replay_from_env
+from auv.telemetry import TelemetryLogger
+from auv.vision import BASELINE_CM, FOCAL_LENGTH_PX, Detector, compute_depth, match_detections
+from auv.tracking import TrackedDetector
 
-# Camera Setup
-picam0 = Picamera2(0)
-picam1 = Picamera2(1)
-config0 = picam0.create_video_configuration(main={"size": (640, 480)})
-config1 = picam1.create_video_configuration(main={"size": (640, 480)})
-picam0.configure(config0)
-picam1.configure(config1)
-picam0.start()
-picam1.start()
-time.sleep(2)
+# Detection Setup (default XBGR8888 captures are RGB once X is dropped)
+detector = Detector(input_format="RGB")
+# Detection every 5th frame (or when a track fades); optical flow in between.
+# Keyframes look around the locked targets, with a whole-frame scan every 4th.
+tracker = TrackedDetector(detector, keyframe_interval=5, roi=True, full_scan_interval=4)
+# Per-object constant-velocity Kalman filter on depth
+depth_filter = KalmanDepthFilter()
+
+# Binary telemetry (detections, depths, motor commands) under telemetry/run-*
+telemetry = TelemetryLogger().start()
+
+# Stereo Calibration (calibrate_stereo.py; the shared defaults are the fallback)
+calibration = load_calibration()
+if calibration:
+    FOCAL_LENGTH_PX, BASELINE_CM = calibration.focal_length_px, calibration.baseline_cm
+
+# Cameras and thrusters (AUV_HAL=sim: synthetic stereo scene, recorded motor commands)
+hardware = Hardware()
+motors = hardware.motors()
+
+# Camera Setup (AUV_REPLAY=<recording> replays raspi5/record.py output instead)
+replay = replay_from_env()
+if replay:
+    recording, realtime = replay
+    stereo = ReplayStereoCapture(recording, realtime=realtime).start()
+else:
+    picam0 = hardware.camera(0)
+    picam1 = hardware.camera(1)
+    CAMERA_ORIENTATION = "vflip"  # Cameras are mounted upside down
+    # The ISP does the mounting flip; flip0/flip1 are None unless it can't
+    flip0 = configure_camera(picam0, CAMERA_ORIENTATION, main={"size": (640, 480)})
+    flip1 = configure_camera(picam1, CAMERA_ORIENTATION, main={"size": (640, 480)})
+    picam0.start()
+    picam1.start()
+    hardware.warm_up()
+
+    # Both cameras captured on their own threads, paired on SensorTimestamp;
+    # reduced to 3 channels (and flipped, if the ISP could not) while copying out
+    stereo = StereoCapture(picam0, picam1, flip=(flip0, flip1), drop_alpha=True).start()
+
+
+# command -> (left, right) thruster speeds, as logged to telemetry
+MOTOR_COMMANDS = {
+    "forward": (1.0, 1.0),
+    "right": (1.0, 0.0),
+    "left": (0.0, 1.0),
+    "stop": (0.0, 0.0),
+}
+
+
+def drive(command):
+    left, right = MOTOR_COMMANDS[command]
+    motors.set(left, right)
+    telemetry.log("motor", time.monotonic(), command, left, right)
 
 
 def get_zone(x):
@@ -28,26 +79,35 @@ def get_zone(x):
 print("Running... Press Ctrl+C to stop.")
 try:
     while True:
-        frame0 = cv2.flip(picam0.capture_array(), 0)
-        frame1 = cv2.flip(picam1.capture_array(), 0)
+        # Blocks until a new pair arrives: decisions run at the camera frame rate
+        pair = stereo.read()
+        if pair is None:
+            continue
+        frame0, frame1 = pair
+        captured_at = time.monotonic()
 
-        if frame0.shape[2] == 4:
-            frame0 = cv2.cvtColor(frame0, cv2.COLOR_BGRA2BGR)
-        if frame1.shape[2] == 4:
-            frame1 = cv2.cvtColor(frame1, cv2.COLOR_BGRA2BGR)
+        dets0, dets1 = tracker.detect_many([frame0, frame1])
+        matches = match_detections(dets0, dets1, (frame0, frame1), track_ids=tracker.ids()[0])
+        telemetry.log_tracks(captured_at, tracker.tracks())
 
-        dets0 = detect(frame0)
-        dets1 = detect(frame1)
-        matches = match_detections(dets0, dets1)
+        # Filter at capture time, then extrapolate to now, when the motors act on it
+        # Box centres come from the raw frames; the calibration rectifies them first
+        frame_size = (frame0.shape[1], frame0.shape[0])
+        raw_depths = [calibration.depth(c0, c1, frame_size) if calibration else
+                      compute_depth(c0, c1, FOCAL_LENGTH_PX, BASELINE_CM) for _, _, _, c0, c1, _ in matches]
+        track_ids = [track_id for *_, track_id in matches]
+        depth_filter.update(track_ids, raw_depths, t=captured_at)
+        depths = depth_filter.predict(track_ids)
+        for (label, *_, track_id), raw_depth, depth in zip(matches, raw_depths, depths):
+            telemetry.log("depth", captured_at, track_id, label,
+                          raw_depth or float("nan"), float("nan") if depth is None else depth)
 
         human_data = []
         bottle_data = []
 
-        for label, box0, box1, center0, center1 in matches:
-            raw_depth = compute_depth(center0, center1)
-            if not raw_depth:
+        for (label, box0, box1, center0, center1, track_id), depth in zip(matches, depths):
+            if depth is None:
                 continue
-            depth = smoothed_depth(label, raw_depth)
             if label.lower() == "human":
                 human_data.append((depth, center0[0]))
             elif label.lower() == "plastic bottle":
@@ -64,10 +124,10 @@ try:
                 movement_decision = "Bottle Ahead. Rerouting..."
                 if bottle_x < 320:
                     movement_decision += " Turn RIGHT."
-                    motor.turn_right()
+                    drive("right")
                 else:
                     movement_decision += " Turn LEFT."
-                    motor.turn_left()
+                    drive("left")
                 break
 
         if human_data:
@@ -82,28 +142,27 @@ try:
                 if human_zone == "center":
                     if human_depth > 200:
                         print("Decision: Human Centered. MOVE FORWARD FAST.\n")
-                        motor.move_forward()
+                        drive("forward")
                     elif human_depth > 50:
                         print("Decision: Human Centered. Approaching.\n")
-                        motor.move_forward()
+                        drive("forward")
                     else:
                         print("Decision: Human Very Close. STOP.\n")
-                        motor.stop()
+                        drive("stop")
                 elif human_zone == "left":
                     print("Decision: Human on Left. TURN RIGHT.\n")
-                    motor.turn_right()
+                    drive("right")
                 else:
                     print("Decision: Human on Right. TURN LEFT.\n")
-                    motor.turn_left()
+                    drive("left")
         else:
             if not obstacle_blocking:
                 print("Decision: No Human. Rotate to Search.\n")
-                motor.turn_right()
+                drive("right")
             else:
                 print(f"Decision: {movement_decision}\n")
 
-        time.sleep(0.1)
-
-except KeyboardInterrupt:
-    motor.stop()
+except (KeyboardInterrupt, ReplayExhausted):
+    drive("stop")
+    telemetry.stop()
     print("Stopped.")
@@ -1,25 +1,33 @@
-from gpiozero import Motor#,Robot
-from time import sleep
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.hal import Hardware
+
+# Thrusters through the hardware layer: gpiozero H-bridges on pins 17/27
+# (left) and 23/24 (right), or recorded commands with AUV_MOTORS=sim.
+# Nothing is opened until the first command.
+_motors = None
+
+
+def motors():
+    global _motors
+    if _motors is None:
+        _motors = Hardware().motors()
+    return _motors
 
-left = Motor(forward=17, backward=27)     
-right = Motor(forward=23, backward=24)
-#both = Robot(left=(17, 27), right=(23, 24))
 
 def move_forward():
-    #both.forward()
-    left.forward()
-    #print("Moving left")
-    right.forward()
-    #print("Moving right")     
+    motors().forward()
+
 
 def turn_right():
-    left.forward()     
-    right.stop()  
+    motors().turn_right()
+
 
 def turn_left():
-    left.stop()
-    right.forward()      
+    motors().turn_left()
+
 
 def stop():
-    left.stop()
-    right.stop()
+    motors().stop()
@@ -1,104 +1,79 @@
-import cv2
+import os
+import sys
 import numpy as np
-from picamera2 import Picamera2
-import threading
-import time
-
-# === Load Labels ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
-
-# === Load DNN Model ===
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
-
-# === Target Classes ===
-targets = ["Human", "Plastic Bottle"]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.calibration import load_calibration
+from auv.capture import StereoCapture, configure_camera, lores_size
+from auv.depth import KalmanDepthFilter
+from auv.hal import Hardware
+from auv.tracking import TrackedDetector
+from auv.vision import Detector, compute_depth, match_detections, rescale_detections
+
+# === Load DNN Model (default XBGR8888 captures are RGB once X is dropped) ===
+detector = Detector(input_format="RGB")
+# Detection on every frame; the tracker only keeps object IDs stable for the depth filter
+tracker = TrackedDetector(detector, keyframe_interval=1)
+
+# === Stereo Constants ===
 BASELINE_CM = 12.0         # Camera baseline
 FOCAL_LENGTH_PX = 630.0   # Pre-calibrated for OV5647
+CAMERA_ORIENTATION = "vflip"  # Cameras are mounted upside down
+MAIN_SIZE = (640, 480)
+LORES_SIZE = lores_size(MAIN_SIZE, detector.input_size)  # 320x240
 
-depth_history = {}
+# === Stereo Calibration (calibrate_stereo.py; the constants above are the fallback) ===
+calibration = load_calibration()
+if calibration:
+    FOCAL_LENGTH_PX, BASELINE_CM = calibration.focal_length_px, calibration.baseline_cm
 
-def smoothed_depth(label, raw_depth, window=5):
-    if label not in depth_history:
-        depth_history[label] = []
-    history = depth_history[label]
-    history.append(raw_depth)
-    if len(history) > window:
-        history.pop(0)
-    return round(sum(history) / len(history), 2)
+# Per-object constant-velocity Kalman filter on depth
+depth_filter = KalmanDepthFilter()
 
 # === Camera Setup ===
-picam0 = Picamera2(0)
-picam1 = Picamera2(1)
-
-config0 = picam0.create_video_configuration(main={"size": (640, 480)})
-config1 = picam1.create_video_configuration(main={"size": (640, 480)})
-
-picam0.configure(config0)
-picam1.configure(config1)
+hardware = Hardware()  # AUV_HAL=sim renders a synthetic scene instead
+picam0 = hardware.camera(0)
+picam1 = hardware.camera(1)
+
+# The ISP does the mounting flip; flip0/flip1 are None unless it can't
+# Detection reads the ISP-scaled lores stream; main is only the geometry reference
+camera_config = dict(main={"size": MAIN_SIZE}, lores={"size": LORES_SIZE, "format": "XBGR8888"})
+flip0 = configure_camera(picam0, CAMERA_ORIENTATION, **camera_config)
+flip1 = configure_camera(picam1, CAMERA_ORIENTATION, **camera_config)
 picam0.start()
 picam1.start()
-time.sleep(2)
-
-# === Object Detection ===
-def detect(frame):
-    results = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    detections = []
-    if len(results) == 3:
-        class_ids, confidences, boxes = results
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            label = obj_names[class_id - 1]
-            if label.lower() in [t.lower() for t in targets] and confidence > 0.45:
-                detections.append((label, box))
-    return detections
-
-# === Depth Calculation ===
-def compute_depth(center_left, center_right):
-    disparity = abs(center_left[0] - center_right[0])
-    if disparity < 1:
-        return None
-    return round((FOCAL_LENGTH_PX * BASELINE_CM) / disparity, 2)
-
-# === Match objects by label ===
-def match_detections(dets0, dets1):
-    matched = []
-    for label1, box1 in dets0:
-        c1 = (box1[0] + box1[2] // 2, box1[1] + box1[3] // 2)
-        for label2, box2 in dets1:
-            if label1 == label2:
-                c2 = (box2[0] + box2[2] // 2, box2[1] + box2[3] // 2)
-                matched.append((label1, box1, box2, c1, c2))
-                break
-    return matched
+hardware.warm_up()
+
+# Both cameras captured on their own threads, paired on SensorTimestamp;
+# reduced to 3 channels (and flipped, if the ISP could not) while copying out
+stereo = StereoCapture(picam0, picam1, stream="lores", flip=(flip0, flip1), drop_alpha=True).start()
 
 # === Main Loop ===
 print("Running... Press Ctrl+C to stop.")
 try:
     while True:
-        frame0 = cv2.flip(picam0.capture_array(), 0)
-        frame1 = cv2.flip(picam1.capture_array(), 0)
-
-        if frame0.shape[2] == 4:
-            frame0 = cv2.cvtColor(frame0, cv2.COLOR_BGRA2BGR)
-        if frame1.shape[2] == 4:
-            frame1 = cv2.cvtColor(frame1, cv2.COLOR_BGRA2BGR)
-
-        dets0 = detect(frame0)
-        dets1 = detect(frame1)
-        matches = match_detections(dets0, dets1)
+        # Blocks until a new pair arrives: decisions run at the camera frame rate
+        pair = stereo.read()
+        if pair is None:
+            continue
+        frame0, frame1 = pair
+
+        dets0, dets1 = (rescale_detections(d, LORES_SIZE, MAIN_SIZE)
+                        for d in tracker.detect_many([frame0, frame1]))
+        matches = match_detections(dets0, dets1, (frame0, frame1), MAIN_SIZE, track_ids=tracker.ids()[0])
+
+        # One filter step for every matched object (None: no disparity this frame)
+        # Box centres come from the raw frames; the calibration rectifies them first
+        raw_depths = [calibration.depth(c0, c1, MAIN_SIZE) if calibration else
+                      compute_depth(c0, c1, FOCAL_LENGTH_PX, BASELINE_CM) for _, _, _, c0, c1, _ in matches]
+        depths = depth_filter.update([track_id for *_, track_id in matches], raw_depths)
 
         human_data = []
         bottle_data = []
 
-        for label, box0, box1, center0, center1 in matches:
-            raw_depth = compute_depth(center0, center1)
-            if not raw_depth:
+        for (label, box0, box1, center0, center1, track_id), depth in zip(matches, depths):
+            if depth is None:
                 continue
-            depth = smoothed_depth(label, raw_depth)
 
             if label.lower() == "human":
                 human_data.append((depth, center0[0]))
@@ -138,7 +113,5 @@ try:
             else:
                 print("Decision: Bottle not blocking path.\n")
 
-        time.sleep(0.1)
-
 except KeyboardInterrupt:
     print("Stopped.")
@@ -2,46 +2,47 @@ from flask import Flask, Response
 from picamera2 import Picamera2
 import cv2
 import threading
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.calibration import load_calibration
+from auv.capture import configure_camera
+from auv.vision import Detector, FOCAL_LENGTH_PX, box_center
 
 # === Stereo Camera Setup ===
+CAMERA_ORIENTATION = "vflip"  # Cameras are mounted upside down
 picam0 = Picamera2(0)
 picam1 = Picamera2(1)
-picam0.configure(picam0.create_video_configuration(main={"format":"RGB888","size": (640, 480)}))
-picam1.configure(picam1.create_video_configuration(main={"format":"RGB888","size": (640, 480)}))
+# The ISP does the mounting flip; flip0/flip1 are None unless it can't
+flip0 = configure_camera(picam0, CAMERA_ORIENTATION, main={"format":"RGB888","size": (640, 480)})
+flip1 = configure_camera(picam1, CAMERA_ORIENTATION, main={"format":"RGB888","size": (640, 480)})
 picam0.start()
 picam1.start()
 
-# === Load YOLO or MobileNet SSD Model ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
+# === Load MobileNet SSD Model (RGB888 captures are BGR in memory) ===
+detector = Detector(input_format="BGR")
 
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
 # === Stereo and Depth Constants ===
 BASELINE_CM = 12.0
-FOCAL_LENGTH_PIXELS = 640 / (2 * 0.035)  # approx for 35mm FoV on 640px
+FOCAL_LENGTH_PIXELS = FOCAL_LENGTH_PX  # shared hand-tuned default for the OV5647 at 640px
+calibration = load_calibration()
+if calibration:
+    FOCAL_LENGTH_PIXELS, BASELINE_CM = calibration.focal_length_px, calibration.baseline_cm
 
 app = Flask(__name__)
 
-def calculate_depth(x_left, x_right):
-    disparity = abs(x_left - x_right)
+def calculate_depth(center_left, center_right):
+    # Box centres come from the raw frames; the calibration rectifies them first
+    if calibration:
+        return calibration.depth(center_left, center_right, (640, 480))
+    disparity = abs(center_left[0] - center_right[0])
     if disparity == 0:
         return None
     return round((BASELINE_CM * FOCAL_LENGTH_PIXELS) / disparity, 2)
 
-def get_centroids_and_boxes(frame):
-    class_ids, confidences, boxes = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    detections = []
-    for class_id, conf, box in zip(class_ids, confidences, boxes):
-        label = obj_names[class_id - 1]
-        if label in ["Human", "Plastic Bottle"]:
-            x, y, w, h = box
-            cx = x + w // 2
-            detections.append((label, cx, box))
-    return detections
+def get_centroids_and_boxes(detections):
+    return [(label, box_center(box), box) for label, box in detections]
 
 def decision_logic(depths):
     if not depths:
@@ -67,22 +68,27 @@ def decision_logic(depths):
 
 def gen():
     while True:
-        left = cv2.flip(picam0.capture_array(), 0)
-        right = cv2.flip(picam1.capture_array(), 0)
+        left = picam0.capture_array()
+        right = picam1.capture_array()
+        if flip0 is not None:
+            left = cv2.flip(left, flip0)
+        if flip1 is not None:
+            right = cv2.flip(right, flip1)
 
         if left.shape[2] == 4:
             left = cv2.cvtColor(left, cv2.COLOR_BGRA2BGR)
         if right.shape[2] == 4:
             right = cv2.cvtColor(right, cv2.COLOR_BGRA2BGR)
 
-        det_left = get_centroids_and_boxes(left)
-        det_right = get_centroids_and_boxes(right)
+        dets = detector.detect_many([left, right])
+        det_left = get_centroids_and_boxes(dets[0])
+        det_right = get_centroids_and_boxes(dets[1])
 
         depths = []
-        for label_l, cx_l, box_l in det_left:
-            for label_r, cx_r, box_r in det_right:
-                if label_l == label_r and abs(cx_l - cx_r) < 40:
-                    depth = calculate_depth(cx_l, cx_r)
+        for label_l, center_l, box_l in det_left:
+            for label_r, center_r, box_r in det_right:
+                if label_l == label_r and abs(center_l[0] - center_r[0]) < 40:
+                    depth = calculate_depth(center_l, center_r)
                     if depth:
                         depths.append((label_l, depth))
                         # Draw bounding box and depth
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.capture import copy_frame
+
+# Per-frame CPU time removed by letting the ISP do the mounting flip
+# (configure_camera(..., "vflip")) instead of flipping in software.
+# Runs anywhere, no cameras needed: each entry point's capture path is
+# replayed on a synthetic 640x480 buffer of the format it configures.
+#
+# Usage: python bench_flip.py
+ITERATIONS = 500
+WARMUP = 20
+
+rng = np.random.default_rng(0)
+xbgr = rng.integers(0, 256, (480, 640, 4), dtype=np.uint8)  # default XBGR8888
+rgb888 = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+dst = np.empty((480, 640, 3), np.uint8)
+
+
+def stereo_capture(src, drop_alpha, flip):
+    return lambda: copy_frame(src, dst, flip, drop_alpha)
+
+def capture_array(src, flip):
+    # autonav_cam: capture_array() copy, then an allocating cv2.flip
+    if flip is None:
+        return lambda: src.copy()
+    return lambda: cv2.flip(src.copy(), flip)
+
+# entry point -> (software flip path, ISP flip path)
+ENTRY_POINTS = {
+    "raspi5/inverted.py": (stereo_capture(rgb888, False, 0), stereo_capture(rgb888, False, None)),
+    "raspi5/autonav_v2.py": (stereo_capture(xbgr, True, 0), stereo_capture(xbgr, True, None)),
+    "raspi5/autonav_cam.py": (capture_array(rgb888, 0), capture_array(rgb888, None)),
+    "raspi5/no_cam_feed.py": (stereo_capture(xbgr, True, 0), stereo_capture(xbgr, True, None)),
+    "propeller_control/main.py": (stereo_capture(xbgr, True, 0), stereo_capture(xbgr, True, None)),
+}
+
+def cpu_ms_per_frame(fn):
+    for _ in range(WARMUP):
+        fn()
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        fn()
+    return (time.process_time() - start) * 1000 / ITERATIONS
+
+print(f"{'entry point':<28}{'software':>12}{'ISP':>12}{'removed/frame':>16}{'removed/pair':>15}")
+for name, (software, isp) in ENTRY_POINTS.items():
+    sw_ms = cpu_ms_per_frame(software)
+    isp_ms = cpu_ms_per_frame(isp)
+    print(f"{name:<28}{sw_ms:>9.3f} ms{isp_ms:>9.3f} ms{sw_ms - isp_ms:>13.3f} ms{2 * (sw_ms - isp_ms):>12.3f} ms")
@@ -0,0 +1,154 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.calibration import CALIBRATION, size_key
+
+# Stereo calibration for the picam0/picam1 rig from checkerboard captures.
+#
+# 1. Grab pairs where both cameras see the whole board (move it around the
+#    field of view and tilt it between shots):
+#      python calibrate_stereo.py capture --out calib_pairs --count 25
+# 2. Solve and write intrinsics, extrinsics and rectification maps:
+#      python calibrate_stereo.py solve --pairs calib_pairs --board 9x6 --square-cm 2.5
+#
+# Capture uses the same mounting orientation as the runtime scripts, so the
+# maps apply to the frames they see. The .npz is loaded with
+# auv.calibration.load_calibration(); keep it uncompressed so the maps can
+# be memory-mapped.
+
+MAIN_SIZE = (640, 480)
+FIND_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def find_corners(gray, board, fast=False):
+    flags = FIND_FLAGS | (cv2.CALIB_CB_FAST_CHECK if fast else 0)
+    found, corners = cv2.findChessboardCorners(gray, board, flags)
+    if not found:
+        return None
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), SUBPIX_CRITERIA)
+
+
+def capture(args):
+    from auv.capture import StereoCapture, configure_camera
+    from auv.hal import Hardware
+
+    hardware = Hardware()
+    picam0, picam1 = hardware.camera(0), hardware.camera(1)
+    flips = [configure_camera(cam, args.orientation, main={"size": MAIN_SIZE}) for cam in (picam0, picam1)]
+    picam0.start()
+    picam1.start()
+    hardware.warm_up()
+    stereo = StereoCapture(picam0, picam1, flip=flips, drop_alpha=True).start()
+
+    os.makedirs(args.out, exist_ok=True)
+    board = parse_size(args.board)
+    saved, last = 0, 0.0
+    print(f"Show the {args.board} board to both cameras; saving {args.count} pairs to {args.out}")
+    try:
+        while saved < args.count:
+            pair = stereo.read()
+            if pair is None or time.monotonic() - last < args.interval:
+                continue
+            grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in pair]
+            if any(find_corners(g, board, fast=True) is None for g in grays):
+                continue
+            for name, frame in zip(("left", "right"), pair):
+                cv2.imwrite(os.path.join(args.out, f"{name}_{saved:02d}.png"), frame)
+            saved += 1
+            last = time.monotonic()
+            print(f"Saved pair {saved}/{args.count}; move the board")
+    finally:
+        stereo.stop()
+        picam0.stop()
+        picam1.stop()
+
+
+def scaled(matrix, scale):
+    """Camera or projection matrix for an image scaled by `scale`."""
+    matrix = matrix.copy()
+    matrix[:2] *= scale
+    return matrix
+
+
+def solve(args):
+    board = parse_size(args.board)
+    object_points = np.zeros((board[0] * board[1], 3), np.float32)
+    object_points[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * args.square_cm
+
+    lefts = sorted(glob.glob(os.path.join(args.pairs, "left_*.png")))
+    objects, corners0, corners1, image_size = [], [], [], None
+    for left in lefts:
+        right = left.replace("left_", "right_")
+        grays = [cv2.imread(p, cv2.IMREAD_GRAYSCALE) for p in (left, right)]
+        if any(g is None for g in grays):
+            continue
+        image_size = (grays[0].shape[1], grays[0].shape[0])
+        found = [find_corners(g, board) for g in grays]
+        if any(c is None for c in found):
+            print(f"Skipping {os.path.basename(left)}: board not found in both views")
+            continue
+        objects.append(object_points)
+        corners0.append(found[0])
+        corners1.append(found[1])
+    if len(objects) < 8:
+        raise SystemExit(f"Only {len(objects)} usable pairs in {args.pairs}; capture at least 8")
+    print(f"Calibrating from {len(objects)} pairs at {size_key(image_size)}")
+
+    rms0, K0, D0, _, _ = cv2.calibrateCamera(objects, corners0, image_size, None, None)
+    rms1, K1, D1, _, _ = cv2.calibrateCamera(objects, corners1, image_size, None, None)
+    rms, K0, D0, K1, D1, R, T, E, F = cv2.stereoCalibrate(
+        objects, corners0, corners1, K0, D0, K1, D1, image_size,
+        criteria=SUBPIX_CRITERIA, flags=cv2.CALIB_FIX_INTRINSIC)
+    R0, R1, P0, P1, Q, _, _ = cv2.stereoRectify(K0, D0, K1, D1, image_size, R, T, alpha=0)
+    print(f"RMS reprojection error: cam0 {rms0:.3f}px, cam1 {rms1:.3f}px, stereo {rms:.3f}px")
+    print(f"Rectified focal length {P0[0, 0]:.1f}px, baseline {np.linalg.norm(T):.2f}cm")
+
+    arrays = dict(K0=K0, D0=D0, K1=K1, D1=D1, R=R, T=T, E=E, F=F, R0=R0, R1=R1, P0=P0, P1=P1, Q=Q,
+                  image_size=np.array(image_size), rms=np.array(rms))
+    for size in [image_size] + [parse_size(s) for s in args.map_sizes.split(",") if s]:
+        scale = size[0] / image_size[0]
+        for cam, K, D, Rn, P in ((0, K0, D0, R0, P0), (1, K1, D1, R1, P1)):
+            xy, interp = cv2.initUndistortRectifyMap(scaled(K, scale), D, Rn, scaled(P, scale), size, cv2.CV_16SC2)
+            arrays[f"map{cam}_{size_key(size)}_xy"] = xy
+            arrays[f"map{cam}_{size_key(size)}_interp"] = interp
+
+    np.savez(args.output, **arrays)  # uncompressed on purpose: the maps are memory-mapped at runtime
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the dual-CSI stereo rig")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cap = sub.add_parser("capture", help="save checkerboard pairs from picam0/picam1")
+    cap.add_argument("--out", default="calib_pairs")
+    cap.add_argument("--count", type=int, default=25)
+    cap.add_argument("--board", default="9x6", help="inner corners, columns x rows")
+    cap.add_argument("--interval", type=float, default=1.5, help="seconds between saved pairs")
+    cap.add_argument("--orientation", default="vflip", help="mounting orientation used at runtime")
+
+    sol = sub.add_parser("solve", help="compute calibration and rectification maps")
+    sol.add_argument("--pairs", default="calib_pairs")
+    sol.add_argument("--board", default="9x6", help="inner corners, columns x rows")
+    sol.add_argument("--square-cm", type=float, required=True, help="checkerboard square size")
+    sol.add_argument("--map-sizes", default="320x240", help="extra remap resolutions, e.g. the lores stream")
+    sol.add_argument("--output", default=CALIBRATION)
+
+    args = parser.parse_args()
+    if args.command == "capture":
+        capture(args)
+    else:
+        solve(args)
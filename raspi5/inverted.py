@@ -1,51 +1,63 @@
+import os
+import sys
+from collections import Counter
 import cv2
 import numpy as np
 from flask import Flask, Response
-from picamera2 import Picamera2
-import threading
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
+from auv.calibration import load_calibration
+from auv.capture import StereoCapture, configure_camera, lores_size
+from auv.hal import Hardware
+from auv.pipeline import FramePipeline
+from auv.stereo import DepthEngine
+from auv.depth import KalmanDepthFilter
+from auv.tracking import TrackedDetector
+from auv.vision import Detector, compute_depth, match_detections, rescale_detections
+
 # === Flask App ===
 app = Flask(__name__)
 
-# === Load Labels ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
-
-# === Load DNN Model ===
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(False)  # Fixed: Don't swap RB, already handled in conversion
+# === Load DNN Model (RGB888 captures are BGR in memory) ===
+detector = Detector(input_format="BGR")
+# Detection on every frame; the tracker only keeps object IDs stable for the depth filter
+tracker = TrackedDetector(detector, keyframe_interval=1)
 
-# === Target Classes and Constants ===
-targets = ["Human", "Plastic Bottle"]
+# === Stereo Constants ===
 BASELINE_CM = 12.0
 FOCAL_LENGTH_PX = 620.0  # Calibrated for 12cm baseline
-
-# === Frame Buffer and Thread Lock ===
-frame_lock = threading.Lock()
-latest_frame = None
-
-# === Depth History for Smoothing ===
-depth_history = {}
-
-def smoothed_depth(label, raw_depth, window=5):
-    if label not in depth_history:
-        depth_history[label] = []
-    history = depth_history[label]
-    history.append(raw_depth)
-    if len(history) > window:
-        history.pop(0)
-    return round(sum(history) / len(history), 2)
+CAMERA_ORIENTATION = "vflip"  # Cameras are mounted upside down
+MAIN_SIZE = (640, 480)
+LORES_SIZE = lores_size(MAIN_SIZE, detector.input_size)  # 320x240
+DEPTH_PRESET = "balanced"  # StereoSGBM preset: fast / balanced / quality
+DEPTH_WAIT_S = 0.05        # Encode waits this long for the SGBM map of its own pair
+# Relative depth noise per source for the Kalman filter: the SGBM box median
+# pools many pixels, box centres move with every bit of detection jitter
+DEPTH_NOISE_REL = {"sgbm": 0.03, "centers": 0.08}
+
+# === Stereo Calibration (calibrate_stereo.py; the constants above are the fallback) ===
+calibration = load_calibration()
+if calibration:
+    FOCAL_LENGTH_PX, BASELINE_CM = calibration.focal_length_px, calibration.baseline_cm
+
+# === Shared Frame Broadcaster ===
+broadcaster = FrameBroadcaster()
+
+# === Per-Object Kalman Depth Filter ===
+depth_filter = KalmanDepthFilter()
+depth_sources = Counter()  # measurements per source, for /stats
 
 # === Initialize CSI Cameras ===
-picam0 = Picamera2(0)
-picam1 = Picamera2(1)
-
-config0 = picam0.create_video_configuration(
-    main={"format":"RGB888","size": (640, 480),},
+hardware = Hardware()  # AUV_HAL=sim renders a synthetic scene instead
+picam0 = hardware.camera(0)
+picam1 = hardware.camera(1)
+
+# Detection reads the ISP-scaled lores stream; main is kept for the video
+camera_config = dict(
+    main={"format":"RGB888","size": MAIN_SIZE,},
+    lores={"format":"RGB888","size": LORES_SIZE,},
     controls={
         "FrameDurationLimits": (33333, 33333),  # ~30 fps
         "AeEnable": True,
@@ -53,106 +65,107 @@ config0 = picam0.create_video_configuration(
     }
 )
 
-config1 = picam1.create_video_configuration(
-    main={"format":"RGB888","size": (640, 480),},
-    controls={
-        "FrameDurationLimits": (33333, 33333),
-        "AeEnable": True,
-        "AwbEnable": True
-    }
-)
-
-picam0.configure(config0)
-picam1.configure(config1)
+# The ISP does the mounting flip; flip0/flip1 are None unless it can't
+flip0 = configure_camera(picam0, CAMERA_ORIENTATION, **camera_config)
+flip1 = configure_camera(picam1, CAMERA_ORIENTATION, **camera_config)
 picam0.start()
 picam1.start()
-time.sleep(2)  # Camera warm-up
-
-# === Object Detection ===
-def detect(frame):
-    results = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    detections = []
-    if len(results) == 3:
-        class_ids, confidences, boxes = results
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            label = obj_names[class_id - 1]
-            if label.lower() in [t.lower() for t in targets] and confidence > 0.45:
-                detections.append((label, box))
-    return detections
-
-# === Compute Depth ===
-def compute_depth(center_left, center_right):
-    disparity = abs(center_left[0] - center_right[0])
-    if disparity < 1:
+hardware.warm_up()  # Camera warm-up
+
+# Both cameras captured on their own threads, paired on SensorTimestamp
+# (and flipped while copying out, if the ISP could not)
+stereo = StereoCapture(picam0, picam1, stream=("main", "lores"), flip=(flip0, flip1))
+
+# Dense SGBM depth on its own thread, fed from the lores frames
+rectify_maps = calibration.maps(LORES_SIZE) if calibration else None
+depth_engine = DepthEngine(DEPTH_PRESET, FOCAL_LENGTH_PX, BASELINE_CM, rectify_maps=rectify_maps)
+
+def depth_box(box0):
+    # The depth map is in rectified left-frame coordinates once calibrated
+    return calibration.rectify_box(box0, MAIN_SIZE) if calibration else box0
+
+# === Pipeline Stages ===
+# Side-by-side canvas reused by the encode stage instead of np.hstack per frame
+stacked = np.empty((MAIN_SIZE[1], 2 * MAIN_SIZE[0], 3), np.uint8)
+
+def capture_frames():
+    # Main is only for the annotated video: skip copying it while nobody watches
+    stereo.active_streams = {"main", "lores"} if broadcaster.viewer_count() else {"lores"}
+    # RGB888 is already BGR, no conversion needed. The pair owns its ring
+    # slots and travels with the frames; the pipeline releases it when done
+    return stereo.read_pair()
+
+def infer_frames(pair):
+    (frame0, lores0), (frame1, lores1) = pair
+    captured_at = time.monotonic()
+    depth_engine.submit(lores0, lores1, tag=pair.seq, owner=pair.retain())
+    dets0, dets1 = (rescale_detections(d, LORES_SIZE, MAIN_SIZE)
+                    for d in tracker.detect_many([lores0, lores1]))
+    matches = match_detections(dets0, dets1, (lores0, lores1), MAIN_SIZE, track_ids=tracker.ids()[0])
+    return pair, frame0, frame1, matches, captured_at
+
+def annotate_and_encode(result):
+    pair, frame0, frame1, matches, captured_at = result
+    # Only the SGBM map of this very pair; it usually finishes shortly after detection
+    dense = depth_engine.result(pair.seq, timeout=DEPTH_WAIT_S)
+    # Median SGBM depth inside the box; box-center disparity as the fallback
+    raw_depths, sources = [], []
+    for _, box0, _, center0, center1, _ in matches:
+        depth, source = (dense.box_depth(depth_box(box0), MAIN_SIZE) if dense else None), "sgbm"
+        if depth is None:
+            depth = (calibration.depth(center0, center1, MAIN_SIZE) if calibration else
+                     compute_depth(center0, center1, FOCAL_LENGTH_PX, BASELINE_CM))
+            source = "centers" if depth is not None else "predicted"
+        raw_depths.append(depth)
+        sources.append(source)
+    depth_sources.update(sources)
+    # The two sources are filtered with their own measurement noise
+    noise = [DEPTH_NOISE_REL.get(source, 0.0) for source in sources]
+    depths = depth_filter.update([track_id for *_, track_id in matches], raw_depths, t=captured_at,
+                                 measurement_rel=noise)
+    for (label, box0, box1, center0, center1, track_id), depth, source in zip(matches, depths, sources):
+        if depth is not None:
+            print(f"{label} Depth: {depth} cm ({source})")
+            if frame0 is None or frame1 is None:
+                continue
+
+            # Draw on left
+            cv2.rectangle(frame0, box0, (0, 255, 0), 1)
+            cv2.putText(frame0, f"{label} {depth}cm", (box0[0], box0[1]-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            # Draw on right
+            cv2.rectangle(frame1, box1, (255, 0, 0), 1)
+            cv2.putText(frame1, f"{label} {depth}cm", (box1[0], box1[1]-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
+
+    # Combine and encode
+    if frame0 is None or frame1 is None:
+        return None  # No viewer, nothing to encode
+    np.concatenate((frame0, frame1), axis=1, out=stacked)
+    ret, buffer = cv2.imencode('.jpg', stacked, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+    if not ret:
         return None
-    depth_cm = (FOCAL_LENGTH_PX * BASELINE_CM) / disparity
-    return round(depth_cm, 2)
-
-# === Match Detected Objects ===
-def match_detections(dets0, dets1):
-    matched = []
-    for label1, box1 in dets0:
-        c1 = (box1[0] + box1[2] // 2, box1[1] + box1[3] // 2)
-        for label2, box2 in dets1:
-            if label1 == label2:
-                c2 = (box2[0] + box2[2] // 2, box2[1] + box2[3] // 2)
-                matched.append((label1, box1, box2, c1, c2))
-                break
-    return matched
-
-# === Update Frames ===
-def update_frames():
-    global latest_frame
-    while True:
-        frame0 = picam0.capture_array()
-        frame1 = picam1.capture_array()
-
-        # Flip vertically
-        frame0 = cv2.flip(frame0, 0)
-        frame1 = cv2.flip(frame1, 0)
-
-        # Convert from RGB to BGR for OpenCV DNN
-        frame0 = cv2.cvtColor(frame0, cv2.COLOR_RGB2BGR)
-        frame1 = cv2.cvtColor(frame1, cv2.COLOR_RGB2BGR)
-
-        dets0 = detect(frame0)
-        dets1 = detect(frame1)
-        matches = match_detections(dets0, dets1)
-
-        for label, box0, box1, center0, center1 in matches:
-            raw_depth = compute_depth(center0, center1)
-            if raw_depth:
-                depth = smoothed_depth(label, raw_depth)
-                print(f"{label} Depth: {depth} cm")
-
-                # Draw on left
-                cv2.rectangle(frame0, box0, (0, 255, 0), 1)
-                cv2.putText(frame0, f"{label} {depth}cm", (box0[0], box0[1]-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                # Draw on right
-                cv2.rectangle(frame1, box1, (255, 0, 0), 1)
-                cv2.putText(frame1, f"{label} {depth}cm", (box1[0], box1[1]-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-
-        # Combine and encode
-        stacked = np.hstack((frame0, frame1))
-        ret, buffer = cv2.imencode('.jpg', stacked, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        if not ret:
-            continue
-
-        with frame_lock:
-            latest_frame = buffer.tobytes()
+    return buffer.tobytes()
+
+pipeline = FramePipeline(capture_frames, infer_frames, annotate_and_encode, broadcaster.publish)
 
 # === Streaming Route ===
 @app.route('/video')
 def video():
-    def generate():
-        while True:
-            with frame_lock:
-                if latest_frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# === Per-Stage Latency and Viewer Counters ===
+@app.route('/stats')
+def stats():
+    report = pipeline.report()
+    report["stream"] = broadcaster.stats()
+    report["stereo"] = stereo.report()
+    report["depth"] = depth_engine.report()
+    report["depth"]["sources"] = dict(depth_sources)
+    dense = depth_engine.latest()
+    if dense:
+        report["depth"]["obstacles_cm"] = dense.nearest()
+    return report
 
 # === HTML Index ===
 @app.route('/')
@@ -171,5 +184,7 @@ def index():
 
 # === Main ===
 if __name__ == '__main__':
-    threading.Thread(target=update_frames, daemon=True).start()
+    stereo.start()
+    depth_engine.start()
+    pipeline.start()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.replay import RecordingBus, StereoRecorder
+
+# Record synchronized stereo frames and IMU traffic for offline replay.
+#
+#   python record.py --out recordings/pool-1 --seconds 120
+#   python record.py --out recordings/raw --jpeg-quality 0   # raw frame store
+#
+# Replay on any machine by pointing a vehicle script at the directory:
+#   AUV_REPLAY=recordings/pool-1 python ../propeller_control/main.py
+#   AUV_REPLAY=recordings/pool-1 AUV_REPLAY_REALTIME=1 python triangulate.py
+#   AUV_REPLAY=recordings/pool-1 python ../navigation/dead_reckoning.py
+# Frames use the same orientation and size as the runtime scripts.
+
+MAIN_SIZE = (640, 480)
+IMU_RATE_HZ = 500
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record stereo frames and IMU samples for replay")
+    parser.add_argument("--out", default=time.strftime("recordings/rec-%Y%m%d-%H%M%S"))
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--jpeg-quality", type=int, default=90, help="0 stores raw frames (large, exact)")
+    parser.add_argument("--orientation", default="vflip")
+    parser.add_argument("--no-imu", action="store_true")
+    args = parser.parse_args()
+
+    from auv.capture import StereoCapture, configure_camera
+    from auv.hal import Hardware
+
+    hardware = Hardware()  # AUV_HAL=sim records the synthetic scene and simulated IMU
+    recorder = StereoRecorder(args.out, jpeg_quality=args.jpeg_quality or None)
+    picam0, picam1 = hardware.camera(0), hardware.camera(1)
+    flips = [configure_camera(cam, args.orientation, main={"size": MAIN_SIZE}) for cam in (picam0, picam1)]
+    picam0.start()
+    picam1.start()
+    hardware.warm_up()
+    stereo = StereoCapture(picam0, picam1, flip=flips, drop_alpha=True).start()
+    recorder.start()
+
+    imu = stream = None
+    if not args.no_imu:
+        from auv.imu import IMUStream, MPU9250
+
+        # Every byte the driver reads is logged so ReplayBus can serve it back
+        bus = RecordingBus(hardware.imu_bus(), recorder.logger)
+        imu = MPU9250(bus).initialize()
+        stream = IMUStream(imu, rate_hz=IMU_RATE_HZ).start()
+
+    print(f"Recording to {args.out} for {args.seconds:.0f} s (Ctrl+C stops early)")
+    deadline = time.monotonic() + args.seconds
+    try:
+        while time.monotonic() < deadline:
+            pair = stereo.read_pair()
+            if pair is not None:
+                recorder.record(*pair, release=pair.release)  # slots go back once written
+            if stream is not None:
+                t, accel, gyro = stream.read()
+                if len(t):
+                    recorder.logger.log_imu(t, accel, gyro)
+                imu.read_mag()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not None:
+            stream.stop()
+            bus.close()
+        stereo.stop()
+        picam0.stop()
+        picam1.stop()
+        recorder.stop()
+        print(recorder.report())
+        if stream is not None:
+            print(stream.report())
@@ -1,124 +1,146 @@
+import os
+import sys
+from collections import Counter
 import cv2
 import numpy as np
 from flask import Flask, Response
-from picamera2 import Picamera2
-import threading
-import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from auv.broadcast import FrameBroadcaster
+from auv.calibration import load_calibration
+from auv.capture import StereoCapture, lores_size
+from auv.hal import Hardware
+from auv.pipeline import FramePipeline
+from auv.replay import ReplayStereoCapture, replay_from_env
+from auv.stereo import DepthEngine
+from auv.vision import Detector, compute_depth, match_detections, rescale_detections
 
 # === Flask App ===
 app = Flask(__name__)
 
-# === Load Labels ===
-with open("data_items.names", "r") as f:
-    obj_names = f.read().strip().split("\n")
-
-# === Load DNN Model ===
-model = cv2.dnn_DetectionModel("frozen_inference_graph.pb", "Pretrained_vectors_mobile_net.pbtxt")
-model.setInputSize(320, 320)
-model.setInputScale(1.0 / 127.5)
-model.setInputMean((127.5, 127.5, 127.5))
-model.setInputSwapRB(True)
+# === Load DNN Model (default XBGR8888 captures are RGB once X is dropped) ===
+detector = Detector(input_format="RGB")
 
-# === Target Classes and Camera Constants ===
-targets = ["Human", "Plastic Bottle"]
+# === Camera Constants ===
 BASELINE_CM = 12.0           # Distance between cameras in cm did change to 8.0
 FOCAL_LENGTH_PX = 625.0      # Approx focal length in pixels for OV5647 at 640x480
-
-# === Shared Frame Storage ===
-frame_lock = threading.Lock()
-latest_frame = None
-
-# === Camera Setup ===
-picam0 = Picamera2(0)
-picam1 = Picamera2(1)
-
-config0 = picam0.create_video_configuration(main={"size": (640, 480)})
-config1 = picam1.create_video_configuration(main={"size": (640, 480)})
-
-picam0.configure(config0)
-picam1.configure(config1)
-
-picam0.start()
-picam1.start()
-time.sleep(2)  # Warm-up
-
-# === Object Detection ===
-def detect(frame):
-    results = model.detect(frame, confThreshold=0.45, nmsThreshold=0.4)
-    detections = []
-    if len(results) == 3:
-        class_ids, confidences, boxes = results
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            label = obj_names[class_id - 1]
-            if label.lower() in [t.lower() for t in targets] and confidence > 0.45:
-                detections.append((label, box))
-    return detections
-
-# === Triangulation ===
-def compute_depth(center_left, center_right):
-    disparity = abs(center_left[0] - center_right[0])
-    if disparity == 0:
+MAIN_SIZE = (640, 480)
+LORES_SIZE = lores_size(MAIN_SIZE, detector.input_size)  # 320x240
+DEPTH_PRESET = "balanced"    # StereoSGBM preset: fast / balanced / quality
+DEPTH_WAIT_S = 0.05          # Encode waits this long for the SGBM map of its own pair
+
+# === Stereo Calibration (calibrate_stereo.py; the constants above are the fallback) ===
+calibration = load_calibration()
+if calibration:
+    FOCAL_LENGTH_PX, BASELINE_CM = calibration.focal_length_px, calibration.baseline_cm
+
+# === Shared Frame Broadcaster ===
+broadcaster = FrameBroadcaster()
+depth_sources = Counter()  # reported depths per source, for /stats
+
+# === Camera Setup (AUV_REPLAY=<recording> loops raspi5/record.py output instead) ===
+replay = replay_from_env()
+if replay:
+    recording, realtime = replay
+    stereo = ReplayStereoCapture(recording, stream=("main", "lores"), lores_size=LORES_SIZE,
+                                 realtime=realtime, loop=True)
+else:
+    hardware = Hardware()  # AUV_HAL=sim renders a synthetic scene instead
+    picam0 = hardware.camera(0)
+    picam1 = hardware.camera(1)
+
+    # Detection reads the ISP-scaled lores stream; main is kept for the video
+    config0 = picam0.create_video_configuration(main={"size": MAIN_SIZE},
+                                                lores={"size": LORES_SIZE, "format": "XBGR8888"})
+    config1 = picam1.create_video_configuration(main={"size": MAIN_SIZE},
+                                                lores={"size": LORES_SIZE, "format": "XBGR8888"})
+
+    picam0.configure(config0)
+    picam1.configure(config1)
+
+    picam0.start()
+    picam1.start()
+    hardware.warm_up()  # Warm-up
+
+    # Both cameras captured on their own threads, paired on SensorTimestamp;
+    # XBGR8888 is reduced to 3 channels while copying out of the camera buffer
+    stereo = StereoCapture(picam0, picam1, stream=("main", "lores"), drop_alpha=True)
+
+# Dense SGBM depth on its own thread, fed from the lores frames
+rectify_maps = calibration.maps(LORES_SIZE) if calibration else None
+depth_engine = DepthEngine(DEPTH_PRESET, FOCAL_LENGTH_PX, BASELINE_CM, rectify_maps=rectify_maps)
+
+def depth_box(box0):
+    # The depth map is in rectified left-frame coordinates once calibrated
+    return calibration.rectify_box(box0, MAIN_SIZE) if calibration else box0
+
+# === Pipeline Stages ===
+# Side-by-side canvas reused by the encode stage instead of np.hstack per frame
+stacked = np.empty((MAIN_SIZE[1], 2 * MAIN_SIZE[0], 3), np.uint8)
+
+def capture_frames():
+    # Main is only for the annotated video: skip copying it while nobody watches
+    stereo.active_streams = {"main", "lores"} if broadcaster.viewer_count() else {"lores"}
+    # The pair owns its ring slots and travels with the frames; the pipeline
+    # releases it after encode
+    return stereo.read_pair()
+
+def infer_frames(pair):
+    (frame0, lores0), (frame1, lores1) = pair
+    depth_engine.submit(lores0, lores1, tag=pair.seq, owner=pair.retain())
+    dets0, dets1 = (rescale_detections(d, LORES_SIZE, MAIN_SIZE)
+                    for d in detector.detect_many([lores0, lores1]))
+    return pair, frame0, frame1, match_detections(dets0, dets1, (lores0, lores1), MAIN_SIZE)
+
+def annotate_and_encode(result):
+    pair, frame0, frame1, matches = result
+    # Only the SGBM map of this very pair; it usually finishes shortly after detection
+    dense = depth_engine.result(pair.seq, timeout=DEPTH_WAIT_S)
+    for label, box0, box1, center0, center1 in matches:
+        box_depth = (calibration.depth(center0, center1, MAIN_SIZE) if calibration else
+                     compute_depth(center0, center1, FOCAL_LENGTH_PX, BASELINE_CM))
+        dense_depth = dense.box_depth(depth_box(box0), MAIN_SIZE) if dense else None
+        depth = dense_depth or box_depth
+        if depth:
+            source = "sgbm" if dense_depth else "centers"
+            depth_sources[source] += 1
+            print(f"{label} Depth: {depth} cm ({source}; SGBM {dense_depth}, box centers {box_depth})")
+            if frame0 is None or frame1 is None:
+                continue
+            cv2.rectangle(frame0, box0, (0, 255, 0), 1)
+            cv2.putText(frame0, f"{label} {depth}cm", (box0[0], box0[1]-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            cv2.rectangle(frame1, box1, (255, 0, 0), 1)
+            cv2.putText(frame1, f"{label} {depth}cm", (box1[0], box1[1]-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
+
+    if frame0 is None or frame1 is None:
+        return None  # No viewer, nothing to encode
+    np.concatenate((frame0, frame1), axis=1, out=stacked)
+    ret, buffer = cv2.imencode('.jpg', stacked, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+    if not ret:
         return None
-    depth_cm = (FOCAL_LENGTH_PX * BASELINE_CM) / disparity
-    return round(depth_cm, 2)
-
-# === Match Detected Objects ===
-def match_detections(dets0, dets1):
-    matched = []
-    for label1, box1 in dets0:
-        c1 = (box1[0] + box1[2] // 2, box1[1] + box1[3] // 2)
-        for label2, box2 in dets1:
-            if label1 == label2:
-                c2 = (box2[0] + box2[2] // 2, box2[1] + box2[3] // 2)
-                matched.append((label1, box1, box2, c1, c2))
-                break
-    return matched
-
-# === Frame Update Thread ===
-def update_frames():
-    global latest_frame
-    while True:
-        frame0 = picam0.capture_array()
-        frame1 = picam1.capture_array()
-
-        # Convert 4-channel to 3-channel if needed
-        if frame0.shape[2] == 4:
-            frame0 = cv2.cvtColor(frame0, cv2.COLOR_BGRA2BGR)
-        if frame1.shape[2] == 4:
-            frame1 = cv2.cvtColor(frame1, cv2.COLOR_BGRA2BGR)
-
-        dets0 = detect(frame0)
-        dets1 = detect(frame1)
-        matches = match_detections(dets0, dets1)
-
-        for label, box0, box1, center0, center1 in matches:
-            depth = compute_depth(center0, center1)
-            if depth:
-                print(f"{label} Depth: {depth} cm")
-                cv2.rectangle(frame0, box0, (0, 255, 0), 1)
-                cv2.putText(frame0, f"{label} {depth}cm", (box0[0], box0[1]-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                cv2.rectangle(frame1, box1, (255, 0, 0), 1)
-                cv2.putText(frame1, f"{label} {depth}cm", (box1[0], box1[1]-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-
-        stacked = np.hstack((frame0, frame1))
-        ret, buffer = cv2.imencode('.jpg', stacked, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        if not ret:
-            continue
-        with frame_lock:
-            latest_frame = buffer.tobytes()
+    return buffer.tobytes()
+
+pipeline = FramePipeline(capture_frames, infer_frames, annotate_and_encode, broadcaster.publish)
 
 # === MJPEG Streaming Route ===
 @app.route('/video')
 def video():
-    def generate():
-        while True:
-            with frame_lock:
-                if latest_frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# === Per-Stage Latency and Viewer Counters ===
+@app.route('/stats')
+def stats():
+    report = pipeline.report()
+    report["stream"] = broadcaster.stats()
+    report["stereo"] = stereo.report()
+    report["depth"] = depth_engine.report()
+    report["depth"]["sources"] = dict(depth_sources)
+    dense = depth_engine.latest()
+    if dense:
+        report["depth"]["obstacles_cm"] = dense.nearest()
+    return report
 
 # === Basic HTML Frontend ===
 @app.route('/')
@@ -137,5 +159,7 @@ def index():
 
 # === Start Everything ===
 if __name__ == '__main__':
-    threading.Thread(target=update_frames, daemon=True).start()
+    stereo.start()
+    depth_engine.start()
+    pipeline.start()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,5 @@
+"""Put the repo root on sys.path so the tests import auv like the scripts do."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from auv.depth import KalmanDepthFilter
+
+
+def test_converges_on_a_noisy_constant_depth():
+    rng = np.random.default_rng(0)
+    kf = KalmanDepthFilter()
+    for i in range(60):
+        depth, = kf.update([1], [200 + rng.normal(0, 5)], t=i * 0.05)
+    assert depth == pytest.approx(200, abs=3)
+    assert abs(kf.velocity(1)) < 20
+
+
+def test_tracks_closing_speed_and_predicts():
+    kf = KalmanDepthFilter()
+    for i in range(40):
+        kf.update([1], [300 - 50 * i * 0.05], t=i * 0.05)
+    assert kf.velocity(1) == pytest.approx(-50, abs=2)
+    last = 300 - 50 * 39 * 0.05
+    predicted, = kf.predict([1], t=39 * 0.05 + 0.2)
+    assert predicted == pytest.approx(last - 10, abs=1)
+    assert kf.predict([2], t=2.0) == [None]
+
+
+def test_gate_rejects_outliers_then_restarts():
+    kf = KalmanDepthFilter(max_rejects=3)
+    for i in range(10):
+        kf.update([1], [150.0], t=i * 0.05)
+    t = 10 * 0.05
+    depth, = kf.update([1], [400.0], t=t)
+    assert depth == pytest.approx(150, abs=1)
+    assert kf.rejected == 1
+    kf.update([1], [400.0], t=t + 0.05)
+    depth, = kf.update([1], [400.0], t=t + 0.1)
+    assert depth == 400.0
+    assert kf.rejected == 2
+    assert kf.velocity(1) == 0.0
+
+
+def test_per_measurement_noise_widens_the_gate():
+    precise, noisy = KalmanDepthFilter(), KalmanDepthFilter()
+    for kf in (precise, noisy):
+        for i in range(20):
+            kf.update([1], [200.0], t=i * 0.05)
+    precise.update([1], [240.0], t=1.0, measurement_rel=[0.03])
+    noisy.update([1], [240.0], t=1.0, measurement_rel=[0.3])
+    assert precise.rejected == 1
+    assert noisy.rejected == 0
+
+
+def test_unmeasured_and_stale_tracks():
+    kf = KalmanDepthFilter(max_age=1.0)
+    assert kf.update([1, 2], [100.0, None], t=0.0) == [100.0, None]
+    # A new ID without a depth is not kept
+    assert 2 not in kf._slots
+    assert kf.update([1], [None], t=0.5) == [100.0]
+    kf.update([3], [50.0], t=2.0)
+    assert kf.predict([1, 3], t=2.0) == [None, 50.0]
+
+
+def test_capacity_recycles_oldest_track():
+    kf = KalmanDepthFilter(capacity=2)
+    kf.update([1], [100.0], t=0.0)
+    kf.update([2], [110.0], t=0.1)
+    kf.update([3], [120.0], t=0.2)
+    assert kf.predict([1, 2, 3], t=0.2) == [None, 110.0, 120.0]
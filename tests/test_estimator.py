@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pytest
+
+from auv.estimator import (GRAVITY, MAG_TO_BODY, ErrorStateEKF, quat_from_euler, quat_from_rotvec,
+                           quat_multiply, quat_to_matrix)
+
+G_UP = np.array([0.0, 0.0, GRAVITY])
+# Earth field in the world frame (x north, z up), dipping down, in uT
+FIELD_W = np.array([20.0, 0.0, -40.0])
+
+
+def attitude(roll, pitch, yaw):
+    return quat_to_matrix(quat_from_euler(roll, pitch, yaw))
+
+
+def still_accel(R):
+    """Accelerometer reading (g) of a motionless IMU with attitude R."""
+    return R.T @ G_UP / GRAVITY
+
+
+def mag_reading(R):
+    """AK8963 reading for attitude R (MAG_TO_BODY is its own inverse)."""
+    return MAG_TO_BODY @ (R.T @ FIELD_W)
+
+
+def test_stationary_jacobian_matches_finite_differences():
+    ekf = ErrorStateEKF()
+    ekf.q = quat_from_euler(0.3, -0.2, 1.0)
+    quat_to_matrix(ekf.q, ekf.R)
+    ekf.ba = np.array([0.05, -0.02, 0.1])
+    # A zero innovation leaves the state alone but fills in the Jacobian
+    assert ekf.update_stationary(still_accel(ekf.R) + ekf.ba / GRAVITY)
+    H = ekf._stationary_H
+
+    def h(dtheta, dba):
+        R = quat_to_matrix(quat_multiply(quat_from_rotvec(dtheta), ekf.q))
+        return R.T @ G_UP + ekf.ba + dba
+
+    eps = 1e-6
+    numeric_theta = np.column_stack([(h(eps * e, 0) - h(-eps * e, 0)) / (2 * eps) for e in np.eye(3)])
+    numeric_ba = np.column_stack([(h(np.zeros(3), eps * e) - h(np.zeros(3), -eps * e)) / (2 * eps)
+                                  for e in np.eye(3)])
+    assert H[3:6, 3:6] == pytest.approx(numeric_theta, abs=1e-6)
+    assert H[3:6, 6:9] == pytest.approx(numeric_ba, abs=1e-6)
+    assert H[0:3, 0:3] == pytest.approx(np.eye(3))
+
+
+def test_heading_innovation_is_the_yaw_error():
+    ekf = ErrorStateEKF()
+    ekf.q = quat_from_euler(0.1, 0.05, 0.0)
+    quat_to_matrix(ekf.q, ekf.R)
+    R0 = ekf.R.copy()
+
+    def innovation(dyaw):
+        # The truth differs from the estimate by dyaw about the world z axis
+        truth = quat_to_matrix(quat_multiply(quat_from_rotvec([0.0, 0.0, dyaw]), ekf.q))
+        m = R0 @ (MAG_TO_BODY @ mag_reading(truth))
+        return -math.atan2(m[1], m[0])
+
+    eps = 1e-6
+    assert (innovation(eps) - innovation(-eps)) / (2 * eps) == pytest.approx(ekf._heading_H[0, 0])
+
+    for _ in range(20):
+        ekf.update_heading(mag_reading(attitude(0.1, 0.05, 0.3)))
+    assert ekf.pose().yaw == pytest.approx(math.degrees(0.3), abs=0.5)
+
+
+def test_align_then_hold_still():
+    R_true = attitude(math.radians(8), math.radians(-5), math.radians(40))
+    gyro_bias = np.array([0.5, -0.3, 0.2])   # deg/s
+    rng = np.random.default_rng(0)
+
+    def batch(n):
+        accel = still_accel(R_true) + rng.normal(0, 0.002, (n, 3))
+        gyro = gyro_bias + rng.normal(0, 0.05, (n, 3))
+        return accel, gyro
+
+    ekf = ErrorStateEKF()
+    accel, gyro = batch(200)
+    ekf.align(accel, gyro, mag=mag_reading(R_true), t=0.0)
+    pose = ekf.pose()
+    assert (pose.roll, pose.pitch, pose.yaw) == pytest.approx((8, -5, 40), abs=0.5)
+    assert pose.gyro_bias == pytest.approx(gyro_bias, abs=0.02)
+
+    t = 0.0
+    for _ in range(100):   # 20 s at 1 kHz in 200-sample FIFO batches
+        accel, gyro = batch(200)
+        times = t + np.arange(1, 201) * 1e-3
+        t = times[-1]
+        ekf.predict_batch(times, accel, gyro)
+        assert ekf.stationary(accel, gyro)
+        ekf.update_stationary(accel.mean(axis=0))
+        ekf.update_heading(mag_reading(R_true))
+
+    pose = ekf.pose()
+    assert (pose.roll, pose.pitch, pose.yaw) == pytest.approx((8, -5, 40), abs=0.5)
+    assert np.linalg.norm(pose.velocity) < 0.05
+    assert np.linalg.norm(pose.position) < 0.5
+    assert ekf.rejected == 0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from auv.magnetometer import MagCalibration, coverage, fit_ellipsoid, load_mag_calibration
+
+FIELD = 45.0
+BIAS = np.array([12.0, -30.0, 8.0])
+# Symmetric soft-iron distortion: a squash along a tilted axis
+DISTORTION = np.array([[1.20, 0.10, -0.05],
+                       [0.10, 0.85, 0.08],
+                       [-0.05, 0.08, 1.05]])
+
+
+def sphere(n, rng):
+    u = rng.normal(size=(n, 3))
+    return u / np.linalg.norm(u, axis=1, keepdims=True)
+
+
+def distorted(n=2000, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return FIELD * sphere(n, rng) @ DISTORTION.T + BIAS + rng.normal(0, noise, (n, 3))
+
+
+def test_fit_recovers_bias_and_soft_iron():
+    bias, soft_iron, field = fit_ellipsoid(distorted())
+    assert bias == pytest.approx(BIAS, abs=1e-6)
+    assert field == pytest.approx(FIELD * np.linalg.det(DISTORTION) ** (1 / 3))
+    # The symmetric correction undoes the distortion up to the field scale
+    assert soft_iron @ DISTORTION == pytest.approx(field / FIELD * np.eye(3), abs=1e-6)
+
+
+def test_calibration_maps_noisy_samples_onto_a_sphere(tmp_path):
+    samples = distorted(noise=0.3)
+    calibration = MagCalibration.fit(samples, asa=[176, 177, 165])
+    radii = np.linalg.norm(calibration.apply(samples), axis=1)
+    assert radii.mean() == pytest.approx(calibration.field, rel=0.01)
+    assert calibration.residual < 0.02
+    assert calibration(samples[0]).shape == (3,)
+
+    path = str(tmp_path / "mag.npz")
+    calibration.save(path)
+    loaded = load_mag_calibration(path, asa=[176, 177, 165])
+    assert loaded.bias == pytest.approx(calibration.bias)
+    assert loaded.soft_iron == pytest.approx(calibration.soft_iron)
+    assert loaded.apply(samples) == pytest.approx(calibration.apply(samples))
+
+
+def test_missing_file(tmp_path):
+    assert load_mag_calibration(str(tmp_path / "none.npz")) is None
+
+
+def test_coverage():
+    rng = np.random.default_rng(2)
+    assert coverage(sphere(5000, rng)) > 0.95
+    # Turning only in yaw leaves every elevation band but one unvisited
+    flat = sphere(5000, rng)
+    flat[:, 2] = 0.0
+    assert coverage(flat) == pytest.approx(1 / 8)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from auv.matching import INFEASIBLE, hungarian, match_stereo, stereo_cost
+
+scipy_optimize = pytest.importorskip("scipy.optimize")
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_hungarian_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        n, m = rng.integers(1, 9, size=2)
+        cost = rng.random((n, m)) * 100
+        # Some forbidden pairs, as stereo_cost produces them
+        cost[rng.random((n, m)) < 0.2] = INFEASIBLE
+        rows, cols = hungarian(cost)
+        ref_rows, ref_cols = scipy_optimize.linear_sum_assignment(cost)
+        assert len(rows) == len(ref_rows) == min(n, m)
+        assert list(rows) == sorted(rows)
+        assert len(set(cols)) == len(cols)
+        assert cost[rows, cols].sum() == pytest.approx(cost[ref_rows, ref_cols].sum())
+
+
+def test_hungarian_integer_ties():
+    cost = np.ones((4, 4))
+    rows, cols = hungarian(cost)
+    assert sorted(cols) == [0, 1, 2, 3]
+    assert list(rows) == [0, 1, 2, 3]
+
+
+def test_identical_boxes_pair_in_order():
+    # Two look-alike bottles: the left frame sees them 40 px further right
+    dets0 = [("bottle", [340, 200, 40, 80]), ("bottle", [140, 200, 40, 80])]
+    dets1 = [("bottle", [100, 200, 40, 80]), ("bottle", [300, 200, 40, 80])]
+    pairs = match_stereo(dets0, dets1)
+    assert [(p[1][0], p[2][0]) for p in pairs] == [(340, 300), (140, 100)]
+
+
+def test_wrong_side_disparity_never_pairs():
+    cost = stereo_cost([[100, 200, 40, 80]], [[160, 200, 40, 80]], ["person"], ["person"])
+    assert cost[0, 0] == INFEASIBLE
+    assert match_stereo([("person", [100, 200, 40, 80])], [("person", [160, 200, 40, 80])]) == []
+    flipped = stereo_cost([[100, 200, 40, 80]], [[160, 200, 40, 80]], ["person"], ["person"],
+                          disparity_sign=-1)
+    assert flipped[0, 0] < INFEASIBLE
+
+
+def test_gates_reject_label_row_and_size():
+    box = [200, 200, 40, 80]
+    assert stereo_cost([box], [[170, 200, 40, 80]], ["person"], ["bottle"])[0, 0] == INFEASIBLE
+    assert stereo_cost([box], [[170, 300, 40, 80]], ["person"], ["person"])[0, 0] == INFEASIBLE
+    assert stereo_cost([box], [[170, 200, 120, 240]], ["person"], ["person"])[0, 0] == INFEASIBLE
+    assert stereo_cost([box], [[170, 210, 40, 80]], ["person"], ["person"])[0, 0] < INFEASIBLE
+
+
+def test_match_stereo_appends_track_ids():
+    dets0 = [("person", [300, 100, 50, 100]), ("bottle", [100, 300, 20, 40])]
+    dets1 = [("bottle", [80, 300, 20, 40]), ("person", [260, 100, 50, 100])]
+    pairs = match_stereo(dets0, dets1, track_ids=[7, 9])
+    assert sorted((p[0], p[-1]) for p in pairs) == [("bottle", 9), ("person", 7)]
+    person = next(p for p in pairs if p[0] == "person")
+    assert person[3] == (325, 150) and person[4] == (285, 150)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from auv.estimator import Pose
+from auv.telemetry import TelemetryLogger, TelemetryRun, _Chunk
+
+
+def test_round_trip_across_batches_and_chunks(tmp_path):
+    logger = TelemetryLogger(str(tmp_path), batch_size=64, max_file_bytes=4096, pool_size=2).start()
+    n = 1000
+    t = np.arange(n) * 0.002
+    accel = np.random.default_rng(0).normal(size=(n, 3)).astype(np.float32)
+    gyro = np.random.default_rng(1).normal(size=(n, 3)).astype(np.float32)
+    for start in range(0, n, 37):
+        logger.log_imu(t[start:start + 37], accel[start:start + 37], gyro[start:start + 37])
+    logger.log("motor", 0.5, "forward", 0.8, 0.75)
+    logger.log_pose(Pose(1.0, np.ones(3), np.zeros(3), 1.5, -2.0, 90.0, np.zeros(3), np.zeros(3)))
+    logger.log("depth", 1.2, 7, "Human", 150.0, 148.5)
+    logger.stop()
+
+    assert logger.records["imu"] == n
+    run = TelemetryRun(str(tmp_path))
+    assert run.streams() == ["depth", "imu", "motor", "pose"]
+    assert len(run.chunks("imu")) > 1
+    imu = run["imu"]
+    assert imu["t"] == pytest.approx(t)
+    assert np.array_equal(imu["accel"], accel) and np.array_equal(imu["gyro"], gyro)
+
+    motor, = run["motor"]
+    assert (motor["command"], motor["left"]) == (b"forward", pytest.approx(0.8))
+    pose, = run["pose"]
+    assert pose["yaw"] == 90.0 and list(pose["position"]) == [1, 1, 1]
+    depth, = run["depth"]
+    assert (depth["track_id"], depth["label"], depth["depth_cm"]) == (7, b"Human", 148.5)
+    assert "monotonic" in run.meta
+    assert len(run["detection"]) == 0
+
+
+def test_unflushed_chunk_header_matches_data(tmp_path):
+    # Headers are rewritten after every append, so a file cut off mid-run loads
+    path = str(tmp_path / "imu-0000.npy")
+    chunk = _Chunk(path, np.dtype([("t", "f8"), ("x", "f4")]))
+    records = np.zeros(5, chunk.dtype)
+    records["t"] = np.arange(5)
+    chunk.append(records)
+    loaded = np.load(path)
+    assert len(loaded) == 5 and list(loaded["t"]) == [0, 1, 2, 3, 4]
+    chunk.append(records[:2])
+    assert len(np.load(path)) == 7
+    chunk.close()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from auv import vision
+from auv.vision import Detector, compute_depth, rescale_detections
+
+LABELS = ["Human", "Fish", "Plastic Bottle", "Rock"]  # class IDs 1..4
+
+
+class FakeNet:
+    """Stands in for cv2.dnn: returns canned SSD rows and records the blob."""
+
+    def __init__(self, rows):
+        self.rows = np.asarray(rows, dtype=np.float32)
+        self.blob = None
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    def forward(self):
+        return self.rows.reshape(1, 1, -1, 7)
+
+
+@pytest.fixture
+def make_detector(tmp_path, monkeypatch):
+    labels = tmp_path / "labels.names"
+    labels.write_text("\n".join(LABELS) + "\n")
+
+    def make(rows=(), **kwargs):
+        net = FakeNet(rows)
+        monkeypatch.setattr(vision, "load_net", lambda weights, config, backend="opencv": net)
+        return Detector(weights="fake.pb", config="fake.pbtxt", labels=str(labels), **kwargs)
+    return make
+
+
+def test_target_mask(make_detector):
+    detector = make_detector()
+    assert list(detector.is_target([0, 1, 2, 3, 4, 5, -1])) == [False, True, False, True, False, False, False]
+    assert make_detector(targets=None).is_target([1, 2, 3, 4]).all()
+
+
+def test_decode_filters_and_clips(make_detector):
+    detector = make_detector()
+    rows = np.array([
+        [0, 1, 0.9, 0.10, 0.20, 0.30, 0.60],    # Human
+        [0, 2, 0.9, 0.50, 0.50, 0.60, 0.60],    # Fish: not a target
+        [0, 3, 0.3, 0.50, 0.50, 0.60, 0.60],    # Bottle below the threshold
+        [0, 3, 0.8, 0.90, -0.10, 1.20, 0.20],   # Bottle running off the frame
+    ], dtype=np.float32)
+    class_ids, confidences, boxes = detector.decode(rows, (480, 640, 3))
+    order = np.argsort(class_ids)
+    assert list(class_ids[order]) == [1, 3]
+    assert confidences[order] == pytest.approx([0.9, 0.8])
+    human, bottle = boxes[order].tolist()
+    assert human == [64, 96, 129, 193]
+    assert bottle[0] == 576 and bottle[1] == 0
+    assert bottle[0] + bottle[2] <= 640 and bottle[3] >= 1
+
+
+def test_decode_nms_is_per_class(make_detector):
+    detector = make_detector()
+    rows = np.array([
+        [0, 1, 0.9, 0.10, 0.10, 0.40, 0.40],
+        [0, 1, 0.7, 0.11, 0.11, 0.41, 0.41],    # duplicate of the first
+        [0, 3, 0.6, 0.11, 0.11, 0.41, 0.41],    # same place, other class
+    ], dtype=np.float32)
+    class_ids, confidences, _ = detector.decode(rows, (480, 640, 3))
+    order = np.argsort(class_ids)
+    assert list(class_ids[order]) == [1, 3]
+    assert confidences[order] == pytest.approx([0.9, 0.6])
+    class_ids, _, _ = detector.decode(rows, (480, 640, 3), nms_threshold=0)
+    assert len(class_ids) == 3
+
+
+def test_detect_many_splits_rows_by_image(make_detector):
+    rows = [
+        [0, 1, 0.9, 0.10, 0.10, 0.20, 0.20],
+        [1, 3, 0.8, 0.50, 0.50, 0.60, 0.70],
+        [1, 1, 0.7, 0.70, 0.10, 0.80, 0.30],
+    ]
+    detector = make_detector(rows)
+    frames = [np.zeros((480, 640, 3), np.uint8), np.zeros((480, 640, 3), np.uint8)]
+    left, right = detector.detect_many(frames)
+    assert detector.net.blob.shape == (2, 3, 320, 320)
+    assert [label for label, _ in left] == ["Human"]
+    assert sorted(label for label, _ in right) == ["Human", "Plastic Bottle"]
+
+
+def test_rescale_detections():
+    dets = [("Human", [100, 50, 40, 30])]
+    (label, box), = rescale_detections(dets, (320, 240), (640, 480))
+    assert label == "Human"
+    assert box.tolist() == [200, 100, 80, 60]
+
+
+def test_compute_depth():
+    assert compute_depth((330, 100), (300, 100), focal_length_px=600, baseline_cm=12) == 240.0
+    assert compute_depth((300, 100), (300, 100)) is None
+    assert compute_depth((290, 100), (300, 100)) is None